@@ -0,0 +1,98 @@
+"""
+Cost of counting emotes on all chat: lines/second through the raw tag
+lookup and the per-channel counters, compared with parsing every line
+and decoding its emotes, and memory held per channel.
+
+Usage: python -m benchmarks.bench_emotes [--lines N] [--channels C] [--emote-share 0.3] [--recording FILE]
+"""
+import argparse
+import random
+import time
+import tracemalloc
+from typing import Dict, List
+
+from benchmarks.traffic import make_traffic, read_recording
+from core.emotes import EmoteStats
+from core.parser import parse
+from core.prefilter import find_channel, find_tag, split_privmsg
+
+EMOTES = ['Kappa', 'LUL', 'PogChamp', 'Kreygasm', 'BibleThump', 'ResidentSleeper', 'NotLikeThis', 'SeemsGood']
+
+
+def add_emotes(lines: List[str], share: float, seed: int = 0) -> List[str]:
+    """
+    Prepend one to three emotes to a share of the chat lines and set their emotes tag
+    """
+    rng = random.Random(seed)
+    result = []
+    for line in lines:
+        if 'emotes=;' not in line or rng.random() >= share:
+            result.append(line)
+            continue
+        names = [rng.choice(EMOTES) for _ in range(rng.randint(1, 3))]
+        ranges: Dict[str, List[str]] = {}
+        position = 0
+        for name in names:
+            ranges.setdefault(str(EMOTES.index(name) + 25), []).append(f'{position}-{position + len(name) - 1}')
+            position += len(name) + 1
+        tag = '/'.join(f'{emote_id}:{",".join(positions)}' for emote_id, positions in ranges.items())
+        prefix, _, rest = line.partition(' PRIVMSG ')
+        channel, _, text = rest.partition(' :')
+        result.append(f'{prefix.replace("emotes=;", f"emotes={tag};")} PRIVMSG {channel} :{" ".join(names)} {text}')
+    return result
+
+
+def count(lines: List[str]) -> EmoteStats:
+    stats = EmoteStats()
+    for line in lines:
+        tag = find_tag(line, 'emotes')
+        if tag:
+            _, channel, text = split_privmsg(line)
+            stats.add(channel, tag, text)
+    return stats
+
+
+def parse_and_decode(lines: List[str]) -> int:
+    emotes = 0
+    for line in lines:
+        message = parse(line)
+        emotes += len(message.user.emote_ranges)  # type: ignore
+    return emotes
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lines', type=int, default=200_000)
+    parser.add_argument('--channels', type=int, default=4)
+    parser.add_argument('--emote-share', type=float, default=0.3, help='share of generated lines with emotes')
+    parser.add_argument('--recording', help='replay a file recorded with benchmarks.capture instead')
+    args = parser.parse_args()
+    if args.recording:
+        lines = read_recording(args.recording)[:args.lines]
+    else:
+        channels = [f'channel{i}' for i in range(args.channels)]
+        lines = add_emotes(list(make_traffic('tagged', args.lines, channels)), args.emote_share)
+    with_emotes = sum(1 for line in lines if find_tag(line, 'emotes'))
+    print(f'{len(lines):,} lines, {with_emotes:,} with emotes, '
+          f'{len({find_channel(line) for line in lines} - {""})} channels')
+
+    start = time.perf_counter()
+    count(lines)
+    elapsed = time.perf_counter() - start
+    print(f'tag lookup + counters  {len(lines) / elapsed:>12,.0f} lines/s  {elapsed / len(lines) * 1e6:.2f}us/line')
+    start = time.perf_counter()
+    parse_and_decode(lines)
+    elapsed = time.perf_counter() - start
+    print(f'parse + decode         {len(lines) / elapsed:>12,.0f} lines/s  {elapsed / len(lines) * 1e6:.2f}us/line')
+
+    tracemalloc.start()
+    stats = count(lines)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    summary = stats.stats()
+    print(f'{memory / max(summary["channels"], 1) / 1024:.1f} KiB/channel '
+          f'({summary["emotes"]} emotes kept, {stats.emotes:,} uses counted)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Cost of keeping the channel history under replayed chat: messages/second
+recorded from raw lines and memory held per channel for different sizes.
+
+Usage: python -m benchmarks.bench_history [--lines N] [--channels C] [--sizes 1000 10000] [--recording FILE]
+"""
+import argparse
+import time
+import tracemalloc
+from typing import List
+
+from benchmarks.traffic import make_traffic, read_recording
+from core.history import ChatHistory
+from core.prefilter import find_channel, split_privmsg
+
+
+def record(lines: List[str], size: int) -> ChatHistory:
+    history = ChatHistory(size)
+    for line in lines:
+        nick, channel, text = split_privmsg(line)
+        if nick:
+            history.add(channel, nick, text)
+    return history
+
+
+def bench(lines: List[str], size: int) -> None:
+    start = time.perf_counter()
+    record(lines, size)
+    elapsed = time.perf_counter() - start
+    # Measured in a second run, tracing allocations slows everything down
+    tracemalloc.start()
+    history = record(lines, size)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stats = history.stats()
+    print(f'{size:>7} messages/channel {len(lines) / elapsed:>12,.0f} lines/s '
+          f'{memory / max(stats["channels"], 1) / 2 ** 20:>8,.2f} MiB/channel '
+          f'({stats["messages"]:,} messages, {stats["users"]:,} users kept)')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--lines', type=int, default=200_000)
+    parser.add_argument('--channels', type=int, default=4)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10_000, 50_000])
+    parser.add_argument('--recording', help='replay a file recorded with benchmarks.capture instead')
+    args = parser.parse_args()
+    if args.recording:
+        lines = read_recording(args.recording)[:args.lines]
+        print(f'{args.recording}: {len({find_channel(line) for line in lines} - {""})} channels')
+    else:
+        lines = list(make_traffic('mixed', args.lines, [f'channel{i}' for i in range(args.channels)]))
+    for size in args.sizes:
+        bench(lines, size)
+
+
+if __name__ == '__main__':
+    main()
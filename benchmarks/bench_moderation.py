@@ -0,0 +1,75 @@
+"""
+Banned phrase matching: messages/second checked by core.moderation.PhraseMatcher
+against a loop of one compiled regex per phrase, for growing phrase lists.
+Also reports how long compiling each list takes, which is the time a
+rebuild spends on the background thread.
+
+Usage: python -m benchmarks.bench_moderation [--lines N] [--sizes 10 100 1000 10000] [--recording FILE]
+"""
+import argparse
+import random
+import re
+import time
+from typing import List, Optional, Pattern
+
+from benchmarks.traffic import make_traffic, read_recording
+from core.moderation import PhraseMatcher
+from core.prefilter import split_privmsg
+
+
+def make_phrases(count: int, seed: int = 0) -> List[str]:
+    """
+    Random words that don't occur in chat, so every message is scanned to the end
+    """
+    rng = random.Random(seed)
+    letters = 'bcdfghjklmnpqrstvwxz'
+    return [''.join(rng.choice(letters) for _ in range(rng.randint(4, 10))) for _ in range(count)]
+
+
+def naive_search(patterns: List[Pattern], text: str) -> Optional[str]:
+    for pattern in patterns:
+        match = pattern.search(text)
+        if match:
+            return match.group()
+    return None
+
+
+def bench(texts: List[str], size: int) -> None:
+    phrases = make_phrases(size)
+    start = time.perf_counter()
+    matcher = PhraseMatcher(phrases)
+    compile_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for text in texts:
+        matcher.search(text)
+    automaton = len(texts) / (time.perf_counter() - start)
+
+    patterns = [re.compile(r'(?<!\w)' + re.escape(phrase) + r'(?!\w)', re.IGNORECASE) for phrase in phrases]
+    # The naive loop is measured on fewer messages for large lists
+    sample = texts[:max(len(texts) * 10 // size, 100)]
+    start = time.perf_counter()
+    for text in sample:
+        naive_search(patterns, text)
+    naive = len(sample) / (time.perf_counter() - start)
+    print(f'{size:>7} phrases  automaton {automaton:>10,.0f} msg/s  regex loop {naive:>10,.0f} msg/s  '
+          f'compile {compile_time * 1000:>8.1f}ms')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lines', type=int, default=50_000)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000, 10_000])
+    parser.add_argument('--recording', help='replay a file recorded with benchmarks.capture instead')
+    args = parser.parse_args()
+    if args.recording:
+        lines = read_recording(args.recording)[:args.lines]
+    else:
+        lines = list(make_traffic('tagged', args.lines, ['channel']))
+    texts = [text for nick, _, text in map(split_privmsg, lines) if nick]
+    print(f'{len(texts):,} messages, {sum(map(len, texts)) / max(len(texts), 1):.0f} characters on average')
+    for size in args.sizes:
+        bench(texts, size)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""
+Micro-benchmark for core.parser.parse
+
+Usage: python -m benchmarks.bench_parser [--number N] [--repeat R]
+"""
+import argparse
+import timeit
+from typing import Dict
+
+from core.parser import parse
+
+
+SAMPLES: Dict[str, str] = {
+    'plain': ':xchromium7!xchromium7@xchromium7.tmi.twitch.tv PRIVMSG #xchrombot :that was a great play KEKW',
+    'tagged': (
+        '@badge-info=;badges=moderator/1;client-nonce=42ef7105da542f903e76632b768ab844;'
+        'color=#5F9EA0;display-name=xchromium7;emotes=;first-msg=0;flags=;id=3f23c8a6-30ee-442c-84ff-ad318fedf60e;'
+        'mod=1;room-id=746006571;subscriber=0;tmi-sent-ts=1638066687071;turbo=0;user-id=69618261;user-type= '
+        ':xchromium7!xchromium7@xchromium7.tmi.twitch.tv PRIVMSG #xchrombot :!addcmd hi hello {message.user_name}'
+    ),
+    'ping': 'PING :tmi.twitch.tv',
+}
+
+
+def bench(line: str, number: int, repeat: int) -> float:
+    """
+    Returns the best messages/second over `repeat` runs
+    """
+    timer = timeit.Timer(lambda: parse(line))
+    best = min(timer.repeat(repeat=repeat, number=number))
+    return number / best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--number', type=int, default=100_000, help='messages parsed per run')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per sample, best one is reported')
+    args = parser.parse_args()
+    for name, line in SAMPLES.items():
+        rate = bench(line, args.number, args.repeat)
+        print(f'{name:<8} {rate:>12,.0f} msg/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+"""
+End to end load benchmark. A real Bot, in its own process, connects to
+the local fake Twitch server, which pushes synthetic or recorded chat at
+a fixed rate. Probe commands (!bench <id>) are answered by a template
+command echoing their id, which gives the reply latency.
+Rate limits and cooldowns are disabled so only the bot's own work is measured.
+
+Reports sustained lines/second, reply latency percentiles and peak memory.
+
+Usage: python -m benchmarks.bench_replay [--mix mixed] [--lines N] [--rate LINES_PER_SECOND]
+       [--channels C] [--recording FILE] [--probe-every N]
+Mixes: tagged, untagged, ping, commands, mixed. A rate of 0 sends as fast as the bot reads.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from benchmarks.fake_twitch import FakeClient, FakeTwitchServer
+from benchmarks.traffic import MIXES, PROBE_COMMAND, make_traffic, probe_line, read_recording
+from core import logs
+from core.journal import StateJournal
+from core.prefilter import find_channel
+from core.scheduler import RateLimiter
+from core.store import CommandStore
+from main import Bot
+
+context = multiprocessing.get_context('spawn')
+
+UNLIMITED = (1_000_000_000, 1)
+
+
+class BenchBot(Bot):
+    def __init__(self, port: int, channels: List[str], state_filename: str) -> None:
+        super().__init__()
+        self.irc_server = '127.0.0.1'
+        self.irc_port = port
+        self.irc_use_tls = False
+        self.channels = channels
+        self.metrics_port = 0
+        self.rate_limiter = RateLimiter(UNLIMITED, UNLIMITED, UNLIMITED, UNLIMITED)
+        self.state_filename = state_filename
+        self.journal = StateJournal(state_filename)
+        self.command_store = CommandStore(os.path.join(os.path.dirname(state_filename), 'commands.db'))
+        self.template_cooldowns = (0, 0, 0)
+        # Recorded chat may use them, but benchmarks should not call Spotify
+        self.spotify_poll_interval = 0
+        self.commands.unregister('song')
+        self.commands.unregister('playlist')
+        self.commands.unregister('history')
+        self.commands.unregister('playcount')
+
+
+def run_bot(port: int, channels: List[str], directory: str, results: Any) -> None:
+    logs.setup_logging(level=logging.WARNING)
+    state_filename = os.path.join(directory, 'state.json')
+    with open(state_filename, 'w') as file:
+        json.dump({'template_commands': {PROBE_COMMAND: '{message.text_args[0]}'}}, file)
+    BenchBot(port, channels, state_filename).init()
+    # Kilobytes on Linux
+    results.put(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024)
+
+
+def with_probes(lines: List[str], every: int, channels: List[str]) -> List[str]:
+    """
+    Insert a probe command every `every` lines, in the channel of the line before it
+    """
+    if not every:
+        return lines
+    probed = []
+    for i, line in enumerate(lines, 1):
+        probed.append(line)
+        if i % every == 0:
+            probed.append(probe_line(f'p{i // every}', find_channel(line) or channels[0], i))
+    return probed
+
+
+def percentile(values: List[float], share: float) -> float:
+    """
+    Nearest-rank percentile of sorted values
+    """
+    if not values:
+        return float('nan')
+    return values[min(len(values) - 1, max(0, int(round(share * len(values))) - 1))]
+
+
+async def replay(lines: List[str], channels: List[str], rate: float, tick: float = 0.01) -> Dict[str, Any]:
+    sent_at: Dict[str, float] = {}
+    latencies: List[float] = []
+    replied = asyncio.Event()
+
+    def on_line(client: FakeClient, line: str) -> None:
+        if not line.startswith('PRIVMSG '):
+            return
+        start = sent_at.pop(line.rsplit(' :', 1)[-1], None)
+        if start is not None:
+            latencies.append(time.perf_counter() - start)
+            if not sent_at:
+                replied.set()
+
+    server = FakeTwitchServer(on_line=on_line)
+    await server.start()
+    results = context.Queue()
+    with tempfile.TemporaryDirectory() as directory:
+        process = context.Process(target=run_bot, args=(server.port, channels, directory, results), daemon=True)
+        process.start()
+        try:
+            await server.wait_for_joins(channels, timeout=30)
+            marker = f' :!{PROBE_COMMAND} '
+            start = time.perf_counter()
+            index = 0
+            while index < len(lines):
+                if rate:
+                    due = min(len(lines), int((time.perf_counter() - start) * rate) + 1)
+                else:
+                    due = min(len(lines), index + 1000)
+                batch = lines[index:due]
+                now = time.perf_counter()
+                for line in batch:
+                    if marker in line:
+                        sent_at[line.rsplit(' ', 1)[-1]] = now
+                server.send(batch)
+                await server.drain()
+                index = due
+                await asyncio.sleep(tick if rate else 0)
+            # Lines are handled in order, so the bot is done once it answered a last probe per channel
+            now = time.perf_counter()
+            replied.clear()
+            for channel in channels:
+                sent_at[f'end-{channel}'] = now
+            server.send(probe_line(f'end-{channel}', channel) for channel in channels)
+            try:
+                await asyncio.wait_for(replied.wait(), 60)
+            except asyncio.TimeoutError:
+                pass
+            elapsed = time.perf_counter() - start
+            lost = len(sent_at)
+        finally:
+            process.terminate()
+            loop = asyncio.get_running_loop()
+            peak_memory = await loop.run_in_executor(None, lambda: results.get(timeout=10))
+            process.join()
+            await server.close()
+    latencies.sort()
+    return {
+        'lines_per_second': len(lines) / elapsed,
+        'probes': len(latencies),
+        'lost_probes': lost,
+        'p50': percentile(latencies, 0.50),
+        'p90': percentile(latencies, 0.90),
+        'p99': percentile(latencies, 0.99),
+        'max': latencies[-1] if latencies else float('nan'),
+        'peak_memory': peak_memory,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mix', choices=sorted(MIXES), default='mixed')
+    parser.add_argument('--lines', type=int, default=100_000)
+    parser.add_argument('--rate', type=float, default=0, help='lines per second, 0 for as fast as possible')
+    parser.add_argument('--channels', type=int, default=4)
+    parser.add_argument('--recording', help='replay a file recorded with benchmarks.capture instead')
+    parser.add_argument('--probe-every', type=int, default=100)
+    args = parser.parse_args()
+
+    if args.recording:
+        lines = read_recording(args.recording)[:args.lines]
+        channels = sorted({find_channel(line) for line in lines} - {''})
+        source = args.recording
+    else:
+        channels = [f'channel{i}' for i in range(args.channels)]
+        lines = list(make_traffic(args.mix, args.lines, channels))
+        source = f'{args.mix} mix'
+    if args.mix != 'commands':
+        lines = with_probes(lines, args.probe_every, channels)
+
+    result = asyncio.run(replay(lines, channels, args.rate))
+    rate = f'{args.rate:,.0f} lines/s' if args.rate else 'unlimited'
+    print(f'{source}, {len(lines):,} lines, {len(channels)} channels, offered rate {rate}')
+    print(f'  sustained      {result["lines_per_second"]:>12,.0f} lines/s')
+    print(f'  reply latency  p50 {result["p50"] * 1000:.2f}ms  p90 {result["p90"] * 1000:.2f}ms  '
+          f'p99 {result["p99"] * 1000:.2f}ms  max {result["max"] * 1000:.2f}ms  '
+          f'({result["probes"]} probes, {result["lost_probes"]} lost)')
+    print(f'  peak memory    {result["peak_memory"] / 2 ** 20:>12,.1f} MiB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Cold start benchmark.
+Import time is measured with `python -X importtime -c "import main"` in
+fresh interpreters. Time to first JOIN starts a new bot process against
+the local fake Twitch server (no TLS) and measures from process start
+until the server receives the first and the last JOIN.
+
+Usage: python -m benchmarks.bench_startup [--runs N] [--channels C] [--top N]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List, Tuple
+
+from benchmarks.fake_twitch import FakeTwitchServer
+
+context = multiprocessing.get_context('spawn')
+
+
+def import_times() -> List[Tuple[str, int, int]]:
+    """
+    (module, nesting depth, cumulative microseconds) of every module imported by main
+    """
+    output = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import main'],
+        capture_output=True, text=True, check=True,
+    ).stderr
+    times = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line[len('import time:'):].split('|')
+        depth = (len(module) - len(module.lstrip())) // 2
+        times.append((module.strip(), depth, int(cumulative)))
+    return times
+
+
+async def time_to_join(channels: List[str]) -> Tuple[float, float]:
+    """
+    Seconds from starting a bot process until its first and last JOIN are received
+    """
+    # Imported here so the benchmark process itself doesn't import the bot
+    from benchmarks.bench_replay import run_bot
+
+    server = FakeTwitchServer()
+    await server.start()
+    results = context.Queue()
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        process = context.Process(target=run_bot, args=(server.port, channels, directory, results), daemon=True)
+        process.start()
+        try:
+            await server.wait_for_joins(channels, timeout=30)
+        finally:
+            # The bot may not have installed its signal handlers yet, so nothing is waited for
+            process.terminate()
+            process.join()
+            # Let the server see the disconnect before the loop stops
+            await server.wait_for(lambda: not server.channels)
+            await server.close()
+    joins = [received for received, _, line in server.received if line.startswith('JOIN ')]
+    return joins[0] - start, joins[-1] - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--channels', type=int, default=20)
+    parser.add_argument('--top', type=int, default=8, help='slowest top level imports to list')
+    args = parser.parse_args()
+
+    runs = [import_times() for _ in range(args.runs)]
+    total = statistics.median(cumulative for times in runs for module, _, cumulative in times if module == 'main')
+    print(f'import main  median {total / 1000:.1f}ms over {args.runs} runs')
+    # Modules imported directly by main, from the last run
+    direct = [(module, cumulative) for module, depth, cumulative in runs[-1] if depth == 1]
+    for module, cumulative in sorted(direct, key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f'  {module:<20} {cumulative / 1000:>8.1f}ms')
+
+    channels = [f'channel{i}' for i in range(args.channels)]
+    joins = [asyncio.run(time_to_join(channels)) for _ in range(args.runs)]
+    first = statistics.median(first for first, _ in joins)
+    last_join = statistics.median(last for _, last in joins)
+    print(f'time to JOIN ({args.channels} channels, process start included)  '
+          f'first {first * 1000:.1f}ms  last {last_join * 1000:.1f}ms')
+
+
+if __name__ == '__main__':
+    main()
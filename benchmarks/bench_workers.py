@@ -0,0 +1,113 @@
+"""
+Throughput of the multi-process supervisor for different worker counts.
+Command lines for many channels are routed to the workers, which parse
+them and render template replies, until every reply has come back.
+
+Usage: python -m benchmarks.bench_workers [--lines N] [--channels C] [--processes 1 2 4]
+"""
+import argparse
+import asyncio
+import functools
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import List, Optional
+
+from core.journal import StateJournal
+from core.store import CommandStore
+from core.supervisor import Supervisor
+from main import Bot
+
+TAGS = (
+    '@badge-info=;badges=;color=#5F9EA0;display-name=chatter{user};emotes=;first-msg=0;flags=;'
+    'id=3f23c8a6-30ee-442c-84ff-ad318fedf60e;mod=0;room-id=746006571;subscriber=0;'
+    'tmi-sent-ts=1638066687071;turbo=0;user-id=69618261;user-type= '
+)
+
+GYM_TEMPLATE = 'Hey buddy @{message.user_name}, I think you got the wrong door.'
+
+
+class WorkerBot(Bot):
+    """
+    Bot keeping its state and commands in a temporary directory
+    """
+
+    def __init__(self, directory: str) -> None:
+        super().__init__()
+        self.state_filename = os.path.join(directory, 'state.json')
+        self.journal = StateJournal(self.state_filename)
+        self.command_store = CommandStore(os.path.join(directory, 'commands.db'))
+        # Every line is the same command, cooldowns would drop most of them
+        self.template_cooldowns = (0, 0, 0)
+
+
+def make_lines(count: int, channels: int) -> List[str]:
+    return [
+        TAGS.format(user=i % 100)
+        + f':chatter{i % 100}!chatter{i % 100}@chatter{i % 100}.tmi.twitch.tv PRIVMSG #channel{i % channels} :!gym'
+        for i in range(count)
+    ]
+
+
+def bench(processes: int, lines: List[str], directory: str, chunk: int = 50) -> float:
+    """
+    Returns handled lines per second
+    """
+    with open(os.path.join(directory, 'state.json'), 'w') as file:
+        json.dump({'template_commands': {'gym': GYM_TEMPLATE}}, file)
+    bot_class = functools.partial(WorkerBot, directory)
+    supervisor = Supervisor(bot_class(), processes, bot_class=bot_class)
+    replies = 0
+    done = threading.Event()
+
+    def on_send(data: bytes, priority: int, channel: Optional[str]) -> None:
+        nonlocal replies
+        replies += 1
+        if replies == len(lines):
+            done.set()
+
+    supervisor.on_send = on_send
+    # Workers start from the supervisor's state
+    supervisor.bot.read_state()
+    supervisor.start_workers()
+
+    async def run() -> float:
+        supervisor.start_outbound_thread()
+        # Warm up, so process start up is not measured
+        supervisor.route(lines[0])
+        while replies < 1:
+            await asyncio.sleep(0.01)
+        start = time.perf_counter()
+        for i in range(1, len(lines), chunk):
+            for line in lines[i:i + chunk]:
+                supervisor.route(line)
+            # Let the batch be flushed like after a socket read
+            await asyncio.sleep(0)
+        await asyncio.get_running_loop().run_in_executor(None, done.wait)
+        return (len(lines) - 1) / (time.perf_counter() - start)
+
+    try:
+        return asyncio.run(run())
+    finally:
+        supervisor.stop_workers()
+        supervisor.bot.journal.close()
+        supervisor.bot.command_store.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--lines', type=int, default=100_000)
+    parser.add_argument('--channels', type=int, default=64)
+    parser.add_argument('--processes', type=int, nargs='+', default=[1, 2, 4, os.cpu_count() or 1])
+    args = parser.parse_args()
+    lines = make_lines(args.lines, args.channels)
+    for processes in sorted(set(args.processes)):
+        with tempfile.TemporaryDirectory() as directory:
+            rate = bench(processes, lines, directory)
+        print(f'{processes:>3} processes {rate:>12,.0f} lines/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Outbound write batching: sends lines in bursts (the replies of one loop
+iteration) to the local fake Twitch server and reports lines/second, the
+number of socket writes and CPU time per line, with every line written on
+its own and with the batched write loop of core.connection. Each write is
+one send call, and one TLS record on a TLS connection.
+
+Usage: python -m benchmarks.bench_writes [--lines N] [--bursts 1 10 50] [--write-delay SECONDS]
+"""
+import argparse
+import asyncio
+import time
+from typing import Type
+
+from benchmarks.fake_twitch import FakeTwitchServer
+from core.connection import IRCConnection
+from core.scheduler import PRIORITY_REPLY, RateLimiter, SendScheduler
+
+# High enough that rate limits never hold lines back
+UNLIMITED = (10 ** 9, 1)
+
+
+class LineByLineConnection(IRCConnection):
+    """
+    The write loop without batching: one write and drain per line
+    """
+
+    async def write_loop(self) -> None:
+        assert self.writer is not None
+        while True:
+            data = await self.scheduler.get()
+            self.write([data])
+            await self.writer.drain()
+
+
+async def bench(connection_class: Type[IRCConnection], lines: int, burst: int, write_delay: float) -> None:
+    server = FakeTwitchServer()
+    await server.start()
+    limiter = RateLimiter(UNLIMITED, UNLIMITED, UNLIMITED, UNLIMITED)
+    connection = connection_class(
+        '127.0.0.1', server.port, lambda line: None, use_tls=False,
+        scheduler=SendScheduler(limiter, max_size=lines), write_delay=write_delay,
+    )
+    await connection.connect()
+    run_task = asyncio.ensure_future(connection.run())
+    connection.send('NICK bench')
+    connection.send('JOIN #channel')
+    await server.wait_for_joins(['channel'])
+    received = len(server.received)
+    data = [f'PRIVMSG #channel :reply number {i}\r\n'.encode() for i in range(lines)]
+
+    writes = connection.writes
+    start, cpu_start = time.perf_counter(), time.process_time()
+    for i in range(0, lines, burst):
+        for line in data[i:i + burst]:
+            connection.send_data(line, PRIORITY_REPLY, 'channel')
+        # The next burst comes from the next loop iteration
+        await asyncio.sleep(0)
+    await server.wait_for(lambda: len(server.received) >= received + lines, timeout=120)
+    elapsed, cpu = time.perf_counter() - start, time.process_time() - cpu_start
+
+    name = 'line by line' if connection_class is LineByLineConnection else 'batched'
+    writes = connection.writes - writes
+    print(f'burst {burst:>4}  {name:<12} {lines / elapsed:>10,.0f} lines/s  {writes:>8,} writes  '
+          f'{lines / max(writes, 1):>6.1f} lines/write  {cpu / lines * 1e6:>6.2f}us CPU/line')
+    run_task.cancel()
+    await connection.close(flush=False)
+    # Let the server see the disconnect before the loop stops
+    await server.wait_for(lambda: not server.channels)
+    await server.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lines', type=int, default=50_000)
+    parser.add_argument('--bursts', type=int, nargs='+', default=[1, 10, 50])
+    parser.add_argument('--write-delay', type=float, default=0.0)
+    args = parser.parse_args()
+    for burst in args.bursts:
+        for connection_class in (LineByLineConnection, IRCConnection):
+            asyncio.run(bench(connection_class, args.lines, burst, args.write_delay))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Record raw traffic of live Twitch channels for bench_replay.
+Connects anonymously (read only, no token needed) and writes every
+received line to the output file.
+
+Usage: python -m benchmarks.capture channel [channel ...] [--out traffic.log] [--seconds 600] [--lines N]
+"""
+import argparse
+import asyncio
+import random
+import time
+from typing import List
+
+from core.connection import IRCConnection
+
+TWITCH_HOST = 'irc.chat.twitch.tv'
+TWITCH_PORT = 6697
+
+
+async def capture(channels: List[str], filename: str, seconds: float, max_lines: int) -> int:
+    with open(filename, 'w', encoding='utf-8', newline='') as file:
+        count = 0
+        done = asyncio.Event()
+
+        def on_line(line: str) -> None:
+            nonlocal count
+            file.write(line + '\r\n')
+            count += 1
+            if max_lines and count >= max_lines:
+                done.set()
+
+        connection = IRCConnection(TWITCH_HOST, TWITCH_PORT, on_line)
+        await connection.connect()
+        # justinfan users are anonymous and may only read
+        connection.send(f'NICK justinfan{random.randint(10000, 99999)}')
+        connection.send('CAP REQ :twitch.tv/tags twitch.tv/commands')
+        for channel in channels:
+            connection.send(f'JOIN #{channel}')
+        run_task = asyncio.ensure_future(connection.run())
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(done.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            run_task.cancel()
+            await connection.close()
+        print(f'Recorded {count} lines in {time.monotonic() - start:.0f}s to {filename}')
+        return count
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('channels', nargs='+')
+    parser.add_argument('--out', default='traffic.log')
+    parser.add_argument('--seconds', type=float, default=600)
+    parser.add_argument('--lines', type=int, default=0, help='stop after this many lines, 0 for no limit')
+    args = parser.parse_args()
+    asyncio.run(capture(args.channels, args.out, args.seconds, args.lines))
+
+
+if __name__ == '__main__':
+    main()
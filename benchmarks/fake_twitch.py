@@ -0,0 +1,177 @@
+"""
+Local stand-in for the Twitch IRC server.
+Answers the registration (PASS, NICK, CAP REQ), JOIN, PART and PING like
+irc.chat.twitch.tv does and records every line received from clients.
+Chat is pushed to the client that joined its channel.
+"""
+import asyncio
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from core.prefilter import find_channel
+
+HOST = 'tmi.twitch.tv'
+
+
+class FakeClient:
+    __slots__ = ('reader', 'writer', 'password', 'nick', 'capabilities', 'channels')
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.reader = reader
+        self.writer = writer
+        self.password = ''
+        self.nick = ''
+        self.capabilities: List[str] = []
+        self.channels: List[str] = []
+
+    def write(self, *lines: str) -> None:
+        self.writer.write(''.join(line + '\r\n' for line in lines).encode('utf-8'))
+
+
+class FakeTwitchServer:
+    def __init__(
+        self,
+        host: str = '127.0.0.1',
+        port: int = 0,
+        on_line: Optional[Callable[[FakeClient, str], None]] = None,
+    ) -> None:
+        self.host = host
+        self.port = port
+        # Called with every line received from a client, after it is answered
+        self.on_line = on_line
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.clients: List[FakeClient] = []
+        # Channel -> client that joined it
+        self.channels: Dict[str, FakeClient] = {}
+        # (time received, client number, line) for every line sent by clients
+        self.received: List[Tuple[float, int, str]] = []
+        self.changed = asyncio.Event()
+
+    async def start(self) -> None:
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        client = FakeClient(reader, writer)
+        self.clients.append(client)
+        index = len(self.clients) - 1
+        try:
+            while True:
+                data = await reader.readline()
+                if not data:
+                    break
+                line = data.decode('utf-8').rstrip('\r\n')
+                self.received.append((time.perf_counter(), index, line))
+                self.answer(client, line)
+                if self.on_line is not None:
+                    self.on_line(client, line)
+        except ConnectionError:
+            pass
+        finally:
+            for channel in client.channels:
+                if self.channels.get(channel) is client:
+                    del self.channels[channel]
+            writer.close()
+            self.notify()
+
+    def answer(self, client: FakeClient, line: str) -> None:
+        command, _, params = line.partition(' ')
+        nick = client.nick
+        if command == 'PASS':
+            client.password = params
+        elif command == 'NICK':
+            client.nick = nick = params
+            client.write(
+                f':{HOST} 001 {nick} :Welcome, GLHF!',
+                f':{HOST} 002 {nick} :Your host is {HOST}',
+                f':{HOST} 003 {nick} :This server is rather new',
+                f':{HOST} 004 {nick} :-',
+                f':{HOST} 375 {nick} :-',
+                f':{HOST} 372 {nick} :You are in a maze of twisty passages, all alike.',
+                f':{HOST} 376 {nick} :>',
+            )
+        elif command == 'CAP':
+            client.capabilities.extend(params.partition(':')[2].split())
+            client.write(f':{HOST} CAP * ACK {params.partition(" ")[2]}')
+        elif command == 'JOIN':
+            for channel in params.split(','):
+                self.join(client, channel.lstrip('#'))
+        elif command == 'PART':
+            channel = params.lstrip('#')
+            if channel in client.channels:
+                client.channels.remove(channel)
+                self.channels.pop(channel, None)
+            client.write(f':{nick}!{nick}@{nick}.{HOST} PART #{channel}')
+        elif command == 'PING':
+            client.write(f':{HOST} PONG {HOST} {params}')
+        self.notify()
+
+    def join(self, client: FakeClient, channel: str) -> None:
+        nick = client.nick
+        client.channels.append(channel)
+        self.channels[channel] = client
+        lines = [
+            f':{nick}!{nick}@{nick}.{HOST} JOIN #{channel}',
+            f':{nick}.{HOST} 353 {nick} = #{channel} :{nick}',
+            f':{nick}.{HOST} 366 {nick} #{channel} :End of /NAMES list',
+        ]
+        if 'twitch.tv/tags' in client.capabilities:
+            lines += [
+                f'@badge-info=;badges=;color=;display-name={nick};emote-sets=0;mod=0;subscriber=0;user-type= '
+                f':{HOST} USERSTATE #{channel}',
+                f'@emote-only=0;followers-only=-1;r9k=0;room-id=1;slow=0;subs-only=0 :{HOST} ROOMSTATE #{channel}',
+            ]
+        client.write(*lines)
+
+    def notify(self) -> None:
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    async def wait_for(self, condition: Callable[[], bool], timeout: float = 5.0) -> None:
+        """
+        Wait until a client has done something that makes condition() true
+        """
+        async def wait() -> None:
+            while not condition():
+                await self.changed.wait()
+
+        await asyncio.wait_for(wait(), timeout)
+
+    async def wait_for_joins(self, channels: Iterable[str], timeout: float = 5.0) -> None:
+        channels = list(channels)
+        await self.wait_for(lambda: all(channel in self.channels for channel in channels), timeout)
+
+    def client_for(self, line: str) -> Optional[FakeClient]:
+        channel = find_channel(line)
+        if channel:
+            return self.channels.get(channel)
+        return self.clients[-1] if self.clients else None
+
+    def send(self, lines: Iterable[str]) -> None:
+        """
+        Push raw lines to the clients that joined their channel,
+        as one write per client. Lines without a channel (e.g. PING)
+        go to the newest client and lines for unjoined channels are dropped.
+        """
+        batches: Dict[FakeClient, List[str]] = {}
+        for line in lines:
+            client = self.client_for(line)
+            if client is not None:
+                batches.setdefault(client, []).append(line)
+        for client, batch in batches.items():
+            client.write(*batch)
+
+    async def drain(self) -> None:
+        for client in self.clients:
+            if not client.writer.is_closing():
+                await client.writer.drain()
+
+    def disconnect(self, client: FakeClient) -> None:
+        client.writer.close()
+
+    async def close(self) -> None:
+        for client in self.clients:
+            client.writer.close()
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
@@ -0,0 +1,64 @@
+"""
+Synthetic and recorded Twitch chat for the load benchmarks.
+Recordings hold one raw IRC line per line, like tests/fixtures/twitch_burst.log.
+"""
+import random
+from typing import Iterator, List
+
+TAGS = (
+    '@badge-info=;badges=;color=#5F9EA0;display-name=chatter{user};emotes=;first-msg=0;flags=;'
+    'id=3f23c8a6-30ee-442c-84ff-{id:012d};mod=0;room-id=746006571;subscriber=0;'
+    'tmi-sent-ts=1638066687071;turbo=0;user-id={user_id};user-type= '
+)
+CHAT = (
+    'that was insane', 'LUL', 'PogChamp PogChamp', 'first time here, love the stream',
+    'what song is this?', 'KEKW', 'gg', 'no way that just happened',
+)
+# Share of each kind of line per mix as (chat, ping, command)
+MIXES = {
+    'tagged': (1.0, 0.0, 0.0),
+    'untagged': (1.0, 0.0, 0.0),
+    'ping': (0.0, 1.0, 0.0),
+    'commands': (0.0, 0.0, 1.0),
+    'mixed': (0.80, 0.05, 0.15),
+}
+# Command whose reply is the probe id, see bench_replay
+PROBE_COMMAND = 'bench'
+
+
+def chat_line(i: int, channel: str, text: str, tagged: bool = True) -> str:
+    user = i % 1000
+    prefix = f':chatter{user}!chatter{user}@chatter{user}.tmi.twitch.tv PRIVMSG #{channel} :'
+    if tagged:
+        prefix = TAGS.format(user=user, id=i, user_id=69618261 + user) + prefix
+    return prefix + text
+
+
+def probe_line(probe_id: str, channel: str, i: int = 0, tagged: bool = True) -> str:
+    return chat_line(i, channel, f'!{PROBE_COMMAND} {probe_id}', tagged)
+
+
+def make_traffic(mix: str, count: int, channels: List[str], seed: int = 0) -> Iterator[str]:
+    """
+    Yields `count` lines of the given mix spread over the channels.
+    Command lines are latency probes numbered from 0.
+    """
+    chat, ping, _ = MIXES[mix]
+    tagged = mix != 'untagged'
+    rng = random.Random(seed)
+    probes = 0
+    for i in range(count):
+        channel = channels[i % len(channels)]
+        kind = rng.random()
+        if kind < chat:
+            yield chat_line(i, channel, rng.choice(CHAT), tagged)
+        elif kind < chat + ping:
+            yield 'PING :tmi.twitch.tv'
+        else:
+            yield probe_line(str(probes), channel, i, tagged)
+            probes += 1
+
+
+def read_recording(filename: str) -> List[str]:
+    with open(filename, 'r', encoding='utf-8', newline='') as file:
+        return [line.rstrip('\r\n') for line in file if line.strip()]
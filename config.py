@@ -4,11 +4,100 @@ TWITCH_OAUTH_TOKEN = ""
 TWITCH_USERNAME = ""
 TWITCH_CHANNELS = ["xchrombot"]
 
+# IRC connection tuning
+# Bytes requested per socket read
+IRC_RECV_SIZE = 4096
+# Longer inbound lines are dropped to keep memory per connection bounded
+IRC_MAX_LINE_LENGTH = 16 * 1024
+# Channels are spread over as many connections as needed
+IRC_CHANNELS_PER_CONNECTION = 50
+# Reconnect delays in seconds as (first, maximum), doubling after each failed attempt, with random jitter
+IRC_RECONNECT_BACKOFF = (0.5, 60.0)
+# Seconds to wait for more outbound lines before writing them together,
+# 0 writes the lines queued during one event loop iteration at once
+IRC_WRITE_DELAY = 0.0
+# Lines waiting to be sent that are kept for a dropped connection and sent once it is back
+OUTBOUND_BACKLOG_SIZE = 100
+
+# Outbound rate limits as (messages, seconds)
+# https://dev.twitch.tv/docs/irc#rate-limits
+RATE_LIMIT_PRIVMSG = (20, 30)
+# Used for channels where the bot is a moderator or the broadcaster
+RATE_LIMIT_PRIVMSG_MOD = (100, 30)
+# Per channel limit where the bot is not a moderator
+RATE_LIMIT_CHANNEL = (1, 1)
+RATE_LIMIT_JOIN = (20, 10)
+# Lowest priority lines are dropped when more are waiting to be sent
+OUTBOUND_QUEUE_SIZE = 1000
+
+# Template commands of every channel are stored in this SQLite database
+COMMAND_STORE_FILENAME = 'commands.db'
+# Seconds to collect command changes before writing them in one transaction
+COMMAND_STORE_BATCH_INTERVAL = 1.0
+# Template commands kept in memory, the channels used least recently are unloaded first
+COMMAND_CACHE_SIZE = 10000
+
+# Cooldowns of template commands in seconds as (per user, per channel, global)
+TEMPLATE_COMMAND_COOLDOWNS = (10, 3, 0)
+# Cooldown entries kept in memory, the oldest are forgotten first
+COOLDOWN_MAX_ENTRIES = 10000
+
+# Log records waiting to be written, more are dropped instead of blocking the bot
+LOG_QUEUE_SIZE = 10000
+# Share of plain chat lines that are logged (0 to 1), commands and replies are always logged
+LOG_CHAT_SAMPLE_RATE = 1.0
+
+# Prometheus metrics are served on http://METRICS_HOST:METRICS_PORT/metrics, 0 disables them.
+# Worker processes serve their own metrics on the following ports.
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = 9108
+
+# Recent chat messages kept in memory per channel for !lastseen and !topchatters, 0 disables it
+HISTORY_MESSAGES = 1000
+# Channels that keep a different number of messages, e.g. {'busychannel': 10000}
+HISTORY_CHANNEL_MESSAGES = {}
+
+# Emote uses are counted per channel for !topemotes, this many emotes are kept per channel, 0 disables it
+EMOTE_STATS_SIZE = 500
+# Seconds after which an emote use counts half as much
+EMOTE_STATS_HALF_LIFE = 600
+# Most used emotes of each channel exported as metrics
+EMOTE_STATS_METRICS_TOP = 10
+
+# Reply to messages containing a phrase banned with !addphrase, {user} is the sender. Empty only logs them.
+MODERATION_WARNING = '@{user} please keep it civil, that phrase is not allowed here'
+# Seconds between two warnings in the same channel, so a raid spamming a phrase gets one warning
+MODERATION_WARNING_COOLDOWN = 10
+
+# Threads running blocking (@io_bound) command handlers
+COMMAND_WORKERS = 8
+# Run parsing and command handling in this many processes, each channel is
+# handled by a fixed one. 0 or 1 keeps everything in a single process.
+WORKER_PROCESSES = 0
+
 # Spotify credentials
 # https://developer.spotify.com/documentation/web-api/quick-start/
 SPOTIFY_CLIENT_ID = ""
 SPOTIFY_CLIENT_SECRET = ""
 SPOTIFY_REDIRECT_URI = ""
+# Kept-alive connections to the Spotify API
+SPOTIFY_POOL_SIZE = 4
+# Retries on connection errors and 429/5xx responses, with exponential backoff in seconds
+SPOTIFY_RETRIES = 2
+SPOTIFY_BACKOFF = 0.2
+# Seconds between polls of the currently playing song while one plays, polls are more frequent
+# near the end of a track. 0 disables polling and !song asks Spotify each time instead.
+SPOTIFY_POLL_INTERVAL = 30
+# Polling backs off from the first to the second number of seconds while nothing plays
+SPOTIFY_POLL_IDLE = (5, 60)
+# Channels where each new song is announced
+SPOTIFY_ANNOUNCE_CHANNELS = []
+# Recently played tracks are copied to this SQLite database for !history and !playcount
+SPOTIFY_HISTORY_FILENAME = 'spotify_history.db'
+# Plays kept, the oldest are removed first
+SPOTIFY_HISTORY_SIZE = 5000
+# Seconds before a query fetches the new plays from Spotify again, they are also fetched on song changes
+SPOTIFY_HISTORY_SYNC_INTERVAL = 300
 
 
 try:
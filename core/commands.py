@@ -0,0 +1,188 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, Iterator, Optional, Tuple
+
+from .decorators import is_mod
+from .objects import Message
+from .utils import add_slots
+
+
+# Cooldowns in seconds as (per user, per channel, global)
+Cooldown = Tuple[float, float, float]
+NO_COOLDOWN: Cooldown = (0, 0, 0)
+
+
+@add_slots
+@dataclass
+class CommandEntry:
+    name: str
+    handler: Callable
+    # Extra arguments passed to the handler after the message
+    args: Tuple[Any, ...]
+    user_cooldown: float
+    channel_cooldown: float
+    global_cooldown: float
+    is_template: bool = False
+
+
+class Cooldowns:
+    """
+    Expiry times of cooldown keys, bounded to `max_entries`.
+    Keys are kept in insertion order so expired ones are evicted from the front.
+    """
+
+    def __init__(self, max_entries: int = 10000) -> None:
+        self.max_entries = max_entries
+        self.expires_at: 'OrderedDict[Hashable, float]' = OrderedDict()
+
+    def is_active(self, key: Hashable, now: float) -> bool:
+        return self.expires_at.get(key, 0) > now
+
+    def start(self, key: Hashable, duration: float, now: float) -> None:
+        if duration <= 0:
+            return
+        self.expires_at[key] = now + duration
+        self.expires_at.move_to_end(key)
+        self.evict(now)
+
+    def evict(self, now: float) -> None:
+        expires_at = self.expires_at
+        while expires_at:
+            key, expiry = next(iter(expires_at.items()))
+            if expiry > now and len(expires_at) <= self.max_entries:
+                return
+            del expires_at[key]
+
+    def __len__(self) -> int:
+        return len(self.expires_at)
+
+
+class CommandRegistry:
+    """
+    Commands by name and alias, with their cooldowns.
+    Built-in commands take precedence over template commands.
+    """
+
+    def __init__(self, max_cooldowns: int = 10000) -> None:
+        self.entries: Dict[str, CommandEntry] = {}
+        self.aliases: Dict[str, CommandEntry] = {}
+        self.cooldowns = Cooldowns(max_cooldowns)
+        self.dropped = 0
+
+    def register(
+        self,
+        name: str,
+        handler: Callable,
+        *args: Any,
+        aliases: Tuple[str, ...] = (),
+        cooldown: Cooldown = NO_COOLDOWN,
+        is_template: bool = False,
+    ) -> Optional[CommandEntry]:
+        existing = self.entries.get(name)
+        if is_template and existing is not None and not existing.is_template:
+            return None
+        entry = CommandEntry(name, handler, args, *cooldown, is_template=is_template)
+        self.entries[name] = entry
+        for alias in aliases:
+            self.aliases[alias] = entry
+        return entry
+
+    def unregister(self, name: str) -> None:
+        entry = self.entries.pop(name, None)
+        if entry is None:
+            return
+        for alias in [alias for alias, target in self.aliases.items() if target is entry]:
+            del self.aliases[alias]
+
+    def get(self, name: str) -> Optional[CommandEntry]:
+        return self.entries.get(name) or self.aliases.get(name)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.entries or name in self.aliases
+
+    def __iter__(self) -> Iterator[CommandEntry]:
+        return iter(self.entries.values())
+
+    def allow(self, entry: CommandEntry, message: Message, now: Optional[float] = None) -> bool:
+        """
+        Returns False when the command is on cooldown for this user,
+        channel or globally, or only mods may use it, otherwise starts
+        its cooldowns
+        """
+        if getattr(entry.handler, 'require_mod', False) and not is_mod(message):
+            return False
+        if now is None:
+            now = time.monotonic()
+        global_key = (entry.name,)
+        channel_key = (entry.name, message.channel)
+        user_key = (entry.name, message.channel, message.user_name)
+        cooldowns = self.cooldowns
+        if (
+            cooldowns.is_active(global_key, now)
+            or cooldowns.is_active(channel_key, now)
+            or cooldowns.is_active(user_key, now)
+        ):
+            self.dropped += 1
+            return False
+        cooldowns.start(global_key, entry.global_cooldown, now)
+        cooldowns.start(channel_key, entry.channel_cooldown, now)
+        cooldowns.start(user_key, entry.user_cooldown, now)
+        return True
+
+
+class ChannelCommands:
+    """
+    Template commands per channel, loaded on first use and kept in an LRU
+    of at most `max_entries` commands. Least recently used channels are
+    evicted whole and loaded again when needed. Channels loaded elsewhere,
+    e.g. on another thread when they are joined, are added with add().
+    """
+
+    def __init__(self, load: Callable[[str], Dict[str, CommandEntry]], max_entries: int = 10000) -> None:
+        self.load = load
+        self.max_entries = max_entries
+        self.channels: 'OrderedDict[str, Dict[str, CommandEntry]]' = OrderedDict()
+        self.size = 0
+        self.loads = 0
+
+    def commands(self, channel: str) -> Dict[str, CommandEntry]:
+        commands = self.channels.get(channel)
+        if commands is not None:
+            self.channels.move_to_end(channel)
+            return commands
+        commands = self.load(channel)
+        self.add(channel, commands)
+        return commands
+
+    def add(self, channel: str, commands: Dict[str, CommandEntry]) -> None:
+        """
+        Cache the loaded commands of a channel, unless it was loaded meanwhile
+        """
+        if channel in self.channels:
+            return
+        self.channels[channel] = commands
+        self.loads += 1
+        self.size += len(commands)
+        self.evict()
+
+    def get(self, channel: str, name: str) -> Optional[CommandEntry]:
+        return self.commands(channel).get(name)
+
+    def set(self, channel: str, entry: CommandEntry) -> None:
+        commands = self.commands(channel)
+        if entry.name not in commands:
+            self.size += 1
+        commands[entry.name] = entry
+        self.evict()
+
+    def remove(self, channel: str, name: str) -> None:
+        commands = self.commands(channel)
+        if commands.pop(name, None) is not None:
+            self.size -= 1
+
+    def evict(self) -> None:
+        # The most recently used channel is kept even if it's larger than the limit
+        while self.size > self.max_entries and len(self.channels) > 1:
+            _, commands = self.channels.popitem(last=False)
+            self.size -= len(commands)
@@ -0,0 +1,215 @@
+import asyncio
+import logging
+import ssl
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from .framer import DEFAULT_MAX_LINE_LENGTH, LineFramer
+from .metrics import (
+    received_bytes_total, received_lines_total, sent_bytes_total, socket_writes_total, stage_seconds,
+)
+from .prefilter import split_command
+from .scheduler import PRIORITY_CONTROL, PRIORITY_PONG, SendScheduler
+
+
+class ResumingSSLContext(ssl.SSLContext):
+    """
+    Client context that offers the last TLS session of a host when
+    connecting to it again, so a reconnect can skip the full handshake
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__()
+        self.sessions: Dict[str, ssl.SSLSession] = {}
+
+    def wrap_bio(  # type: ignore
+        self,
+        incoming: ssl.MemoryBIO,
+        outgoing: ssl.MemoryBIO,
+        server_side: bool = False,
+        server_hostname: Optional[str] = None,
+        session: Optional[ssl.SSLSession] = None,
+    ) -> ssl.SSLObject:
+        if session is None and server_hostname is not None:
+            session = self.sessions.get(server_hostname)
+        return super().wrap_bio(incoming, outgoing, server_side, server_hostname, session)
+
+
+def create_ssl_context() -> ResumingSSLContext:
+    """
+    Same settings as ssl.create_default_context()
+    """
+    context = ResumingSSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.load_default_certs(ssl.Purpose.SERVER_AUTH)
+    return context
+
+
+class IRCConnection:
+    """
+    Asyncio based IRC connection.
+    Reading and writing run as separate tasks so a slow consumer
+    of inbound lines never delays PONGs or outbound replies.
+    Outbound lines are written in batches: every line queued during the
+    same loop iteration, or within `write_delay` seconds of the first
+    one, goes out in a single write.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        on_line: Callable[[str], None],
+        use_tls: bool = True,
+        recv_size: int = 4096,
+        max_line_length: int = DEFAULT_MAX_LINE_LENGTH,
+        scheduler: Optional[SendScheduler] = None,
+        ssl_context: Optional[ResumingSSLContext] = None,
+        write_delay: float = 0.0,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.on_line = on_line
+        self.use_tls = use_tls
+        self.recv_size = recv_size
+        self.framer = LineFramer(max_line_length)
+        self.scheduler = scheduler or SendScheduler()
+        self.ssl_context = ssl_context or (create_ssl_context() if use_tls else None)
+        self.session_reused = False
+        self.write_delay = write_delay
+        self.writes = 0
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def connect(self) -> None:
+        """
+        Open the connection to the IRC server
+        """
+        self.loop = asyncio.get_running_loop()
+        self.reader, self.writer = await asyncio.open_connection(
+            self.host, self.port, ssl=self.ssl_context if self.use_tls else None
+        )
+        ssl_object = self.writer.get_extra_info('ssl_object')
+        self.session_reused = ssl_object is not None and ssl_object.session_reused
+
+    def remember_session(self) -> None:
+        """
+        Keep the TLS session for the next connection to the host.
+        TLS 1.3 servers send it after the handshake, so this is done
+        once data has been read.
+        """
+        ssl_object = self.writer.get_extra_info('ssl_object') if self.writer is not None else None
+        if ssl_object is not None and ssl_object.session is not None and self.ssl_context is not None:
+            self.ssl_context.sessions[self.host] = ssl_object.session
+
+    def flush(self) -> int:
+        """
+        Write every queued line the rate limits allow right now in a single
+        write, used to pipeline the login and JOINs. Returns the line count.
+        """
+        lines = self.scheduler.get_ready()
+        if lines:
+            self.write(lines)
+        return len(lines)
+
+    def write(self, lines: List[bytes]) -> None:
+        """
+        Write encoded lines at once, one send call and TLS record instead of one per line
+        """
+        assert self.writer is not None
+        data = b''.join(lines)
+        self.writer.write(data)
+        self.writes += 1
+        socket_writes_total.inc()
+        sent_bytes_total.inc(amount=len(data))
+
+    async def run(self) -> None:
+        """
+        Read and write until the connection is closed
+        """
+        write_task = asyncio.ensure_future(self.write_loop())
+        try:
+            await self.read_loop()
+        finally:
+            write_task.cancel()
+
+    async def read_loop(self) -> None:
+        assert self.reader is not None
+        self.framer.reset()
+        remembered = False
+        while True:
+            data = await self.reader.read(self.recv_size)
+            if not data:
+                logging.info('Connection closed by server')
+                return
+            if not remembered:
+                self.remember_session()
+                remembered = True
+            received_bytes_total.inc(amount=len(data))
+            start = time.perf_counter()
+            lines = self.framer.feed(data)
+            stage_seconds.observe(time.perf_counter() - start, 'frame')
+            received_lines_total.inc(amount=len(lines))
+            for line in lines:
+                start = time.perf_counter()
+                if line.startswith('PING'):
+                    # Keepalives are answered on the connection that received them
+                    self.send('PONG' + line[4:], PRIORITY_PONG)
+                elif line.endswith('RECONNECT') and split_command(line)[0] == 'RECONNECT':
+                    # Twitch is about to restart the server, the pool reconnects
+                    logging.info('Server asked to reconnect')
+                    return
+                self.on_line(line)
+                stage_seconds.observe(time.perf_counter() - start, 'handle')
+
+    async def write_loop(self) -> None:
+        assert self.writer is not None
+        while True:
+            lines = [await self.scheduler.get()]
+            # Handlers of the current loop iteration may still queue lines, they are sent along
+            await asyncio.sleep(self.write_delay)
+            lines.extend(self.scheduler.get_ready())
+            self.write(lines)
+            await self.writer.drain()
+
+    def send(self, line: str, priority: int = PRIORITY_CONTROL, channel: Optional[str] = None) -> None:
+        """
+        Queue a line to be sent to the server once rate limits allow.
+        Safe to call from any thread.
+        """
+        self.send_data((line + '\r\n').encode('utf-8'), priority, channel)
+
+    def send_data(self, data: bytes, priority: int = PRIORITY_CONTROL, channel: Optional[str] = None) -> None:
+        """
+        Queue an already encoded line, including the trailing CRLF
+        """
+        if self.loop is None:
+            raise RuntimeError('Connection has not been opened')
+        if self.is_loop_thread():
+            self.scheduler.put(data, priority, channel)
+        else:
+            self.loop.call_soon_threadsafe(self.scheduler.put, data, priority, channel)
+
+    def is_loop_thread(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+    async def close(self, flush: bool = True) -> None:
+        """
+        Flush pending lines and close the connection.
+        Without `flush` queued lines are kept in the scheduler.
+        """
+        if self.writer is None:
+            return
+        self.remember_session()
+        if flush:
+            lines = self.scheduler.drain()
+            if lines:
+                self.write(lines)
+            try:
+                await self.writer.drain()
+            except ConnectionError:
+                pass
+        self.writer.close()
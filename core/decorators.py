@@ -2,16 +2,35 @@ from functools import wraps
 from typing import TYPE_CHECKING, Any, Callable, Optional
 
 from core.objects import Message, UserInfo
+from core.workers import IOBound
 
 if TYPE_CHECKING:
     from main import Bot
 
 
+def is_mod(message: Message) -> bool:
+    user: Optional[UserInfo] = getattr(message, 'user', None)
+    return type(user) == UserInfo and user.is_mod
+
+
 def require_mod(func: Callable) -> Callable:
     @wraps(func)
     def inner(self: 'Bot', message: Message, *args: Any, **kwargs: Any) -> None:
-        user: Optional[UserInfo] = getattr(message, 'user', None)
-        if type(user) != UserInfo or not user.is_mod:
+        if not is_mod(message):
             return None
         return func(self, message, *args, **kwargs)
+    # Checked before cooldowns start, so other users can't hold a mod command on cooldown
+    inner.require_mod = True  # type: ignore
     return inner
+
+
+def io_bound(max_concurrency: int = 2, timeout: float = 5.0, fallback: Optional[str] = None) -> Callable:
+    """
+    Mark a command handler as blocking on I/O so it is run on the worker pool
+    instead of the message loop. When it takes longer than `timeout` seconds
+    its replies are dropped and `fallback` is sent instead.
+    """
+    def decorator(func: Callable) -> Callable:
+        func.io_bound = IOBound(max_concurrency, timeout, fallback)  # type: ignore
+        return func
+    return decorator
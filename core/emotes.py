@@ -0,0 +1,174 @@
+import heapq
+import math
+import time
+from array import array
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# (emote id, ((first, last), ...)) with inclusive character positions in the message text
+EmoteRanges = Tuple[Tuple[str, Tuple[Tuple[int, int], ...]], ...]
+
+ACTION_PREFIX = '\x01ACTION '
+
+
+@lru_cache(maxsize=4096)
+def decode_emotes(tag: str) -> EmoteRanges:
+    """
+    Decode the emotes tag, e.g. 25:0-4,12-16/1902:6-10
+    """
+    emotes = []
+    for part in tag.split('/'):
+        emote_id, _, ranges = part.partition(':')
+        if not emote_id or not ranges:
+            continue
+        positions = []
+        for position in ranges.split(','):
+            first, _, last = position.partition('-')
+            try:
+                positions.append((int(first), int(last)))
+            except ValueError:
+                continue
+        if positions:
+            emotes.append((emote_id, tuple(positions)))
+    return tuple(emotes)
+
+
+def count_emotes(tag: str) -> Iterator[Tuple[str, int]]:
+    """
+    (emote id, times used) of an emotes tag without decoding the positions
+    """
+    for part in tag.split('/'):
+        emote_id, _, ranges = part.partition(':')
+        if emote_id and ranges:
+            yield emote_id, ranges.count(',') + 1
+
+
+def emote_name(tag: str, text: str, emote_id: str) -> str:
+    """
+    The text an emote was written as, its id if the positions don't fit the text
+    """
+    # Positions of /me messages are relative to the text inside the ACTION
+    if text.startswith(ACTION_PREFIX):
+        text = text[len(ACTION_PREFIX):].rstrip('\x01')
+    for decoded_id, positions in decode_emotes(tag):
+        if decoded_id == emote_id:
+            first, last = positions[0]
+            name = text[first:last + 1]
+            if name and last < len(text):
+                return name
+    return emote_id
+
+
+class EmoteCounter:
+    """
+    Exponentially decayed usage counts of a channel's emotes, halving
+    every `half_life` seconds. Counts live in one array of doubles indexed
+    by slot. Instead of decaying every count over time, new uses are added
+    with a weight that grows over time and counts are scaled back when
+    read, so an update touches a single slot. When all `size` slots are
+    taken the least used emote makes room.
+    """
+
+    # Counts are scaled back to the current time before their weights overflow
+    MAX_EXPONENT = 200.0
+    # Counts below this are dropped when rescaling
+    MIN_COUNT = 0.01
+
+    def __init__(self, half_life: float = 600.0, size: int = 500, now: Optional[float] = None) -> None:
+        self.rate = math.log(2) / half_life
+        self.size = size
+        self.epoch = time.monotonic() if now is None else now
+        self.slots: Dict[str, int] = {}
+        self.ids: List[str] = []
+        self.names: List[str] = []
+        self.counts = array('d')
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def weight(self, now: float) -> float:
+        exponent = (now - self.epoch) * self.rate
+        if exponent > self.MAX_EXPONENT:
+            self.rescale(now)
+            exponent = 0.0
+        return math.exp(exponent)
+
+    def add(self, emote_id: str, name: str, count: int, now: float) -> None:
+        weight = self.weight(now)
+        slot = self.slots.get(emote_id)
+        if slot is not None:
+            self.counts[slot] += count * weight
+            return
+        if len(self.ids) < self.size:
+            self.slots[emote_id] = len(self.ids)
+            self.ids.append(emote_id)
+            self.names.append(name)
+            self.counts.append(count * weight)
+            return
+        slot = self.counts.index(min(self.counts))
+        del self.slots[self.ids[slot]]
+        self.slots[emote_id] = slot
+        self.ids[slot] = emote_id
+        self.names[slot] = name
+        self.counts[slot] = count * weight
+
+    def rescale(self, now: float) -> None:
+        """
+        Move the epoch to now and forget emotes that are barely used anymore
+        """
+        scale = math.exp(-(now - self.epoch) * self.rate)
+        kept = [slot for slot, count in enumerate(self.counts) if count * scale >= self.MIN_COUNT]
+        self.ids = [self.ids[slot] for slot in kept]
+        self.names = [self.names[slot] for slot in kept]
+        self.counts = array('d', (self.counts[slot] * scale for slot in kept))
+        self.slots = {emote_id: slot for slot, emote_id in enumerate(self.ids)}
+        self.epoch = now
+
+    def top(self, count: int, now: float) -> List[Tuple[str, float]]:
+        """
+        (name, decayed count) of the most used emotes
+        """
+        scale = math.exp(-(now - self.epoch) * self.rate)
+        slots = heapq.nlargest(count, range(len(self.counts)), key=self.counts.__getitem__)
+        return [(self.names[slot], self.counts[slot] * scale) for slot in slots]
+
+
+class EmoteStats:
+    """
+    Emote counters of every channel, fed with the raw emotes tag of each
+    message. The positions are only decoded for emotes a channel hasn't
+    counted yet, to find their names in the text.
+    """
+
+    def __init__(self, half_life: float = 600.0, size: int = 500) -> None:
+        self.half_life = half_life
+        self.size = size
+        self.channels: Dict[str, EmoteCounter] = {}
+        self.emotes = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0
+
+    def add(self, channel: str, tag: str, text: str, now: Optional[float] = None) -> None:
+        if now is None:
+            now = time.monotonic()
+        counter = self.channels.get(channel)
+        if counter is None:
+            counter = self.channels[channel] = EmoteCounter(self.half_life, self.size, now)
+        for emote_id, count in count_emotes(tag):
+            name = '' if emote_id in counter.slots else emote_name(tag, text, emote_id)
+            counter.add(emote_id, name, count, now)
+            self.emotes += count
+
+    def top(self, channel: str, count: int = 5, now: Optional[float] = None) -> List[Tuple[str, float]]:
+        counter = self.channels.get(channel)
+        if counter is None:
+            return []
+        return counter.top(count, time.monotonic() if now is None else now)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'channels': len(self.channels),
+            'emotes': sum(len(counter) for counter in self.channels.values()),
+        }
@@ -0,0 +1,54 @@
+from typing import List
+
+
+# Twitch allows up to 8191 bytes of tags on top of the 512 byte IRC message
+DEFAULT_MAX_LINE_LENGTH = 16 * 1024
+
+
+class LineFramer:
+    """
+    Streaming framer for inbound IRC traffic.
+    Bytes are accumulated in a single reusable buffer and only complete
+    lines are decoded, so lines and multibyte characters split across
+    reads are reassembled correctly.
+    """
+
+    def __init__(self, max_line_length: int = DEFAULT_MAX_LINE_LENGTH) -> None:
+        self.max_line_length = max_line_length
+        self.buffer = bytearray()
+        # Set while skipping the rest of a line that exceeded the limit
+        self.discarding = False
+        self.dropped_lines = 0
+
+    def feed(self, data: bytes) -> List[str]:
+        """
+        Add received bytes and return the lines completed by them
+        """
+        buffer = self.buffer
+        buffer += data
+        lines = []
+        start = 0
+        while True:
+            end = buffer.find(b'\r\n', start)
+            if end == -1:
+                break
+            if self.discarding:
+                self.discarding = False
+            elif end > start:
+                lines.append(buffer[start:end].decode('utf-8', 'replace'))
+            start = end + 2
+        if start:
+            del buffer[:start]
+        if len(buffer) > self.max_line_length:
+            # Keep memory bounded, the rest of this line will be skipped
+            if not self.discarding:
+                self.discarding = True
+                self.dropped_lines += 1
+            # Keep a trailing \r in case the \n arrives in the next read
+            keep = 1 if buffer.endswith(b'\r') else 0
+            del buffer[:len(buffer) - keep]
+        return lines
+
+    def reset(self) -> None:
+        self.buffer.clear()
+        self.discarding = False
@@ -0,0 +1,133 @@
+import heapq
+import time
+from array import array
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Optional, Tuple
+
+from .utils import add_slots
+
+# Positions of a user's messages kept in the index, older ones are only found by a scan
+USER_INDEX_LENGTH = 20
+
+
+@add_slots
+@dataclass
+class HistoryEntry:
+    user: str
+    text: str
+    time: float
+
+
+class ChannelHistory:
+    """
+    Ring buffer of the last `size` messages of a channel, stored in
+    preallocated parallel arrays, with an index of each user's recent
+    messages. Overwritten messages are removed from the index, so its
+    size is bounded by the ring's.
+    """
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self.users: List[str] = [''] * size
+        self.texts: List[str] = [''] * size
+        self.times = array('d', bytes(8 * size))
+        # Sequence number of the next message, its slot is sequence % size
+        self.sequence = 0
+        self.user_messages: Dict[str, Deque[int]] = {}
+        self.user_counts: Dict[str, int] = {}
+
+    def add(self, user: str, text: str, now: float) -> None:
+        sequence = self.sequence
+        slot = sequence % self.size
+        if sequence >= self.size:
+            self.forget(self.users[slot], sequence - self.size)
+        self.users[slot] = user
+        self.texts[slot] = text
+        self.times[slot] = now
+        self.sequence = sequence + 1
+        messages = self.user_messages.get(user)
+        if messages is None:
+            messages = self.user_messages[user] = deque(maxlen=USER_INDEX_LENGTH)
+        messages.append(sequence)
+        self.user_counts[user] = self.user_counts.get(user, 0) + 1
+
+    def forget(self, user: str, sequence: int) -> None:
+        count = self.user_counts[user] - 1
+        if count == 0:
+            del self.user_counts[user]
+            del self.user_messages[user]
+            return
+        self.user_counts[user] = count
+        messages = self.user_messages[user]
+        if messages[0] == sequence:
+            messages.popleft()
+
+    def entry(self, sequence: int) -> HistoryEntry:
+        slot = sequence % self.size
+        return HistoryEntry(self.users[slot], self.texts[slot], self.times[slot])
+
+    def __len__(self) -> int:
+        return min(self.sequence, self.size)
+
+    def recent(self, limit: Optional[int] = None) -> List[HistoryEntry]:
+        """
+        Returns the last messages, newest first
+        """
+        count = len(self) if limit is None else min(limit, len(self))
+        return [self.entry(self.sequence - 1 - i) for i in range(count)]
+
+    def last_seen(self, user: str) -> Optional[HistoryEntry]:
+        messages = self.user_messages.get(user)
+        if not messages:
+            return None
+        return self.entry(messages[-1])
+
+    def messages_by(self, user: str) -> List[HistoryEntry]:
+        """
+        Returns up to USER_INDEX_LENGTH recent messages of a user, newest first
+        """
+        return [self.entry(sequence) for sequence in reversed(self.user_messages.get(user, ()))]
+
+    def top_chatters(self, count: int = 5) -> List[Tuple[str, int]]:
+        """
+        Users with the most messages in the buffer
+        """
+        return heapq.nlargest(count, self.user_counts.items(), key=lambda item: item[1])
+
+
+class ChatHistory:
+    """
+    Message history of every channel. Channels get `size` messages
+    unless they have their own size in `sizes`, 0 disables a channel's history.
+    """
+
+    def __init__(self, size: int = 1000, sizes: Optional[Dict[str, int]] = None) -> None:
+        self.size = size
+        self.sizes = sizes or {}
+        self.channels: Dict[str, Optional[ChannelHistory]] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0 or any(self.sizes.values())
+
+    def channel(self, name: str) -> Optional[ChannelHistory]:
+        try:
+            return self.channels[name]
+        except KeyError:
+            size = self.sizes.get(name, self.size)
+            history = self.channels[name] = ChannelHistory(size) if size > 0 else None
+            return history
+
+    def add(self, channel: str, user: str, text: str, now: Optional[float] = None) -> None:
+        history = self.channel(channel)
+        if history is not None:
+            history.add(user, text, time.time() if now is None else now)
+
+    def stats(self) -> Dict[str, int]:
+        histories = [history for history in self.channels.values() if history is not None]
+        return {
+            'channels': len(histories),
+            'messages': sum(len(history) for history in histories),
+            'users': sum(len(history.user_counts) for history in histories),
+        }
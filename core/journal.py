@@ -0,0 +1,148 @@
+import copy
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+
+class StateJournal:
+    """
+    Append-only journal of state changes next to a JSON snapshot.
+    Changes are queued in O(1) and written, fsynced and periodically
+    compacted into a new snapshot by a background thread.
+    On load the snapshot is read and the journal replayed over it.
+    """
+
+    def __init__(
+        self,
+        snapshot_filename: str,
+        journal_filename: Optional[str] = None,
+        compact_every: int = 100,
+        compact_interval: float = 300.0,
+    ) -> None:
+        self.snapshot_filename = snapshot_filename
+        self.journal_filename = journal_filename or os.path.splitext(snapshot_filename)[0] + '.journal'
+        self.compact_every = compact_every
+        self.compact_interval = compact_interval
+        # Copy of the state owned by the writer thread, used for snapshots
+        self.state: Dict[str, Any] = {}
+        self.queue: 'queue.Queue[Optional[Dict[str, Any]]]' = queue.Queue()
+        self.thread: Optional[threading.Thread] = None
+        self.entries_since_compaction = 0
+        self.compacted_at = time.monotonic()
+
+    def load(self) -> Dict[str, Any]:
+        """
+        Returns the state from the snapshot with the journal replayed over it
+        """
+        try:
+            with open(self.snapshot_filename, 'r') as file:
+                state = json.load(file)
+        except FileNotFoundError:
+            state = {}
+        try:
+            with open(self.journal_filename, 'rb') as file:
+                # Offset after the last complete entry
+                good = 0
+                for line in file:
+                    try:
+                        if not line.endswith(b'\n'):
+                            raise ValueError('missing newline')
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Partial line from a crash while appending, cut it off so
+                        # new entries are not appended to it
+                        logging.warning(f'Truncating corrupt entry at the end of {self.journal_filename}')
+                        os.truncate(self.journal_filename, good)
+                        break
+                    apply_entry(state, entry)
+                    self.entries_since_compaction += 1
+                    good += len(line)
+        except FileNotFoundError:
+            pass
+        self.state = copy.deepcopy(state)
+        return state
+
+    def start(self) -> None:
+        self.thread = threading.Thread(target=self.run, name='state-journal', daemon=True)
+        self.thread.start()
+
+    def set(self, path: List[str], value: Any) -> None:
+        self.queue.put({'op': 'set', 'path': path, 'value': copy.deepcopy(value)})
+
+    def delete(self, path: List[str]) -> None:
+        self.queue.put({'op': 'delete', 'path': path})
+
+    def close(self) -> None:
+        """
+        Write pending changes, compact and stop the writer thread
+        """
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+
+    def run(self) -> None:
+        with open(self.journal_filename, 'a') as journal:
+            while True:
+                try:
+                    entry = self.queue.get(timeout=self.compact_interval)
+                except queue.Empty:
+                    entry = {}
+                entries = [entry]
+                # Batch everything already waiting into one fsync
+                while not self.queue.empty():
+                    entries.append(self.queue.get_nowait())
+                stop = None in entries
+                entries = [entry for entry in entries if entry]
+                for entry in entries:
+                    apply_entry(self.state, entry)
+                    journal.write(json.dumps(entry) + '\n')
+                if entries:
+                    journal.flush()
+                    os.fsync(journal.fileno())
+                    self.entries_since_compaction += len(entries)
+                if stop or self.should_compact():
+                    self.compact(journal)
+                if stop:
+                    return
+
+    def should_compact(self) -> bool:
+        if self.entries_since_compaction == 0:
+            return False
+        return (
+            self.entries_since_compaction >= self.compact_every
+            or time.monotonic() - self.compacted_at >= self.compact_interval
+        )
+
+    def compact(self, journal: Any) -> None:
+        """
+        Atomically replace the snapshot and truncate the journal
+        """
+        temp_filename = self.snapshot_filename + '.tmp'
+        with open(temp_filename, 'w') as file:
+            json.dump(self.state, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_filename, self.snapshot_filename)
+        # Entries replayed over a newer snapshot are harmless, so truncate last
+        journal.truncate(0)
+        journal.flush()
+        os.fsync(journal.fileno())
+        self.entries_since_compaction = 0
+        self.compacted_at = time.monotonic()
+
+
+def apply_entry(state: Dict[str, Any], entry: Dict[str, Any]) -> None:
+    *parents, key = entry['path']
+    target = state
+    for parent in parents:
+        target = target.setdefault(parent, {})
+    if entry['op'] == 'set':
+        target[key] = entry['value']
+    elif entry['op'] == 'delete':
+        target.pop(key, None)
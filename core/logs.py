@@ -0,0 +1,100 @@
+import atexit
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+
+# Plain chat lines are logged here so they can be sampled
+chat_logger = logging.getLogger('xchrombot.chat')
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Hands records to a bounded queue without formatting them.
+    When the queue is full records are counted and dropped instead of
+    blocking the caller.
+    """
+
+    def __init__(self, log_queue: 'queue.Queue[Any]') -> None:
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Formatting is left to the listener thread
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class SampleFilter(logging.Filter):
+    """
+    Keeps `rate` (0 to 1) of the records passing through
+    """
+
+    def __init__(self, rate: float) -> None:
+        super().__init__()
+        self.rate = rate
+        self.credit = 0.0
+        self.sampled_out = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        self.credit += self.rate
+        if self.credit >= 1:
+            self.credit -= 1
+            return True
+        self.sampled_out += 1
+        return False
+
+
+queue_handler: Optional[DroppingQueueHandler] = None
+chat_filter: Optional[SampleFilter] = None
+
+
+def setup_logging(
+    level: int = logging.INFO,
+    format: str = '[%(asctime)-15s] %(levelname)s %(message)s',
+    datefmt: str = '%m/%d/%Y %I:%M:%S %p',
+    queue_size: int = 10000,
+    chat_sample_rate: float = 1.0,
+) -> QueueListener:
+    """
+    Route all logging through a queue emptied by a background thread
+    """
+    global queue_handler, chat_filter
+    output = logging.StreamHandler()
+    output.setFormatter(logging.Formatter(format, datefmt))
+    log_queue: 'queue.Queue[Any]' = queue.Queue(queue_size)
+    queue_handler = DroppingQueueHandler(log_queue)
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.handlers = [queue_handler]
+    chat_filter = SampleFilter(chat_sample_rate)
+    chat_logger.filters = [chat_filter]
+    listener = QueueListener(log_queue, output, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+def stats() -> Dict[str, int]:
+    return {
+        'dropped': queue_handler.dropped if queue_handler else 0,
+        'sampled_out': chat_filter.sampled_out if chat_filter else 0,
+    }
+
+
+class Decoded:
+    """
+    Decodes bytes only if the log record is actually formatted
+    """
+    __slots__ = ('data',)
+
+    def __init__(self, data: bytes) -> None:
+        self.data = data
+
+    def __str__(self) -> str:
+        return self.data.decode('utf-8', 'replace')
@@ -0,0 +1,306 @@
+import asyncio
+import bisect
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+# Upper bounds in seconds, from parsing a line to a slow HTTP request
+DEFAULT_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+def format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    def __init__(self, name: str, help: str) -> None:
+        self.name = name
+        self.help = help
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class ShardedMetric(Metric):
+    """
+    Values are kept per thread so updates need no lock,
+    the shards are merged when the metric is rendered
+    """
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...]) -> None:
+        super().__init__(name, help)
+        self.labels = labels
+        self.local = threading.local()
+        self.shards: List[Dict[Tuple[str, ...], Any]] = []
+        self.lock = threading.Lock()
+
+    def shard(self) -> Dict[Tuple[str, ...], Any]:
+        shard: Dict[Tuple[str, ...], Any] = {}
+        with self.lock:
+            self.shards.append(shard)
+        self.local.shard = shard
+        return shard
+
+    def snapshot(self) -> List[Tuple[Tuple[str, ...], Any]]:
+        with self.lock:
+            shards = list(self.shards)
+        # Copying a dict holds the GIL, so owners may keep updating their shards
+        return [item for shard in shards for item in list(shard.items())]
+
+
+class Counter(ShardedMetric):
+    """
+    Monotonic count per set of label values
+    """
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> None:
+        super().__init__(name, help, labels)
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        try:
+            shard = self.local.shard
+        except AttributeError:
+            shard = self.shard()
+        shard[label_values] = shard.get(label_values, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        totals: Dict[Tuple[str, ...], float] = {}
+        for label_values, value in self.snapshot():
+            totals[label_values] = totals.get(label_values, 0) + value
+        for label_values, value in totals.items():
+            lines.append(f'{self.name}{format_labels(self.labels, label_values)} {format_value(value)}')
+        return lines
+
+
+class HistogramSeries:
+    __slots__ = ('counts', 'sum')
+
+    def __init__(self, size: int) -> None:
+        # Counts per bucket, the last one is +Inf
+        self.counts = [0] * size
+        self.sum = 0.0
+
+
+class Histogram(ShardedMetric):
+    """
+    Distribution of observed values per set of label values.
+    Buckets are fixed, an observation is a bisect and two increments.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Tuple[str, ...] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, help, labels)
+        self.buckets = [float(bound) for bound in buckets]
+
+    def observe(self, value: float, *label_values: str) -> None:
+        try:
+            shard = self.local.shard
+        except AttributeError:
+            shard = self.shard()
+        series = shard.get(label_values)
+        if series is None:
+            series = shard[label_values] = HistogramSeries(len(self.buckets) + 1)
+        series.counts[bisect.bisect_left(self.buckets, value)] += 1
+        series.sum += value
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        merged: Dict[Tuple[str, ...], HistogramSeries] = {}
+        for label_values, series in self.snapshot():
+            total = merged.get(label_values)
+            if total is None:
+                total = merged[label_values] = HistogramSeries(len(self.buckets) + 1)
+            total.counts = [a + b for a, b in zip(total.counts, series.counts)]
+            total.sum += series.sum
+        for label_values, series in merged.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + [float('inf')], series.counts):
+                cumulative += count
+                labels = format_labels(self.labels, label_values, f'le="{format_value(bound)}"')
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = format_labels(self.labels, label_values)
+            lines.append(f'{self.name}_sum{labels} {format_value(series.sum)}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class Collected(Metric):
+    """
+    Values read from existing stats when the metrics are rendered,
+    e.g. queue depths that are already tracked elsewhere.
+    With labels, collect returns the value of each set of label values.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        type: str,
+        collect: Callable[[], Any],
+        labels: Tuple[str, ...] = (),
+    ) -> None:
+        super().__init__(name, help)
+        self.type = type
+        self.collect = collect
+        self.labels = labels
+
+    def render(self) -> List[str]:
+        try:
+            value = self.collect()
+        except Exception as e:
+            logging.debug('Could not collect %s: %s', self.name, e)
+            return []
+        values: Dict[Tuple[str, ...], float] = value if self.labels else {(): value}
+        return [
+            f'# HELP {self.name} {self.help}',
+            f'# TYPE {self.name} {self.type}',
+        ] + [
+            f'{self.name}{format_labels(self.labels, label_values)} {format_value(value)}'
+            for label_values, value in values.items()
+        ]
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.metrics: Dict[str, Metric] = {}
+
+    def counter(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> Counter:
+        counter = Counter(name, help, labels)
+        self.add(counter)
+        return counter
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labels: Tuple[str, ...] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        histogram = Histogram(name, help, labels, buckets)
+        self.add(histogram)
+        return histogram
+
+    def collect(
+        self,
+        name: str,
+        help: str,
+        collect: Callable[[], Any],
+        type: str = 'gauge',
+        labels: Tuple[str, ...] = (),
+    ) -> None:
+        self.add(Collected(name, help, type, collect, labels))
+
+    def add(self, metric: Metric) -> None:
+        # Adding a metric with the same name replaces it, e.g. when the bot is restarted
+        self.metrics[metric.name] = metric
+
+    def render(self) -> str:
+        """
+        Returns every metric in the Prometheus text exposition format
+        """
+        lines: List[str] = []
+        for metric in list(self.metrics.values()):
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+# Stages: frame, handle (a whole line), parse, moderate, dispatch, send and send_wait (queued until written)
+stage_seconds = registry.histogram(
+    'xchrombot_stage_seconds', 'Time spent in each stage of handling IRC lines', ('stage',),
+)
+command_seconds = registry.histogram(
+    'xchrombot_command_seconds', 'Command handler execution time', ('command', 'channel'),
+)
+commands_total = registry.counter(
+    'xchrombot_commands_total', 'Commands dispatched to their handler', ('command', 'channel'),
+)
+http_seconds = registry.histogram(
+    'xchrombot_http_request_seconds', 'HTTP request latency including retries', ('endpoint',),
+)
+http_errors_total = registry.counter(
+    'xchrombot_http_request_errors_total', 'HTTP requests that failed without a response', ('endpoint',),
+)
+moderation_matches_total = registry.counter(
+    'xchrombot_moderation_matches_total', 'Messages containing a banned phrase', ('channel',),
+)
+received_bytes_total = registry.counter('xchrombot_received_bytes_total', 'Bytes read from IRC connections')
+received_lines_total = registry.counter('xchrombot_received_lines_total', 'Lines read from IRC connections')
+sent_bytes_total = registry.counter('xchrombot_sent_bytes_total', 'Bytes written to IRC connections')
+# Outbound lines are batched, each write is one send call (and TLS record) carrying one or more lines
+socket_writes_total = registry.counter('xchrombot_socket_writes_total', 'Writes to IRC connections')
+# TLS: 'resumed' or 'full' handshake, 'none' without TLS
+reconnect_seconds = registry.histogram(
+    'xchrombot_reconnect_seconds', 'Time from losing a connection until its channels were joined again', ('tls',),
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0),
+)
+
+
+class MetricsServer:
+    """
+    Minimal HTTP listener serving GET /metrics from the running event loop
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 9108, registry: Registry = registry) -> None:
+        self.host = host
+        self.port = port
+        self.registry = registry
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> None:
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        logging.info(f'Serving metrics on http://{self.host}:{self.port}/metrics')
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 5)
+            # Skip the request headers
+            while (await asyncio.wait_for(reader.readline(), 5)) not in (b'\r\n', b'\n', b''):
+                pass
+            parts = request_line.split()
+            if len(parts) >= 2 and parts[0] == b'GET' and parts[1].split(b'?')[0] == b'/metrics':
+                status = '200 OK'
+                body = self.registry.render().encode('utf-8')
+            else:
+                status = '404 Not Found'
+                body = b'Not found\n'
+            writer.write(
+                f'HTTP/1.1 {status}\r\n'
+                'Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+                f'Content-Length: {len(body)}\r\n'
+                'Connection: close\r\n\r\n'.encode('ascii') + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def close(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
@@ -0,0 +1,144 @@
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+
+def normalize(phrase: str) -> str:
+    return ' '.join(phrase.lower().split())
+
+
+class PhraseMatcher:
+    """
+    Aho-Corasick automaton over a set of phrases. search() reads each
+    character of the text once, whatever the number of phrases.
+    Matching ignores case and only counts whole words, so "ass" is
+    found in "ass!" but not in "class".
+    """
+
+    def __init__(self, phrases: Iterable[str]) -> None:
+        self.phrases: List[str] = sorted({normalize(phrase) for phrase in phrases} - {''})
+        # Transitions, failure link and phrases ending in each state, state 0 is the root
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.outputs: List[Tuple[int, ...]] = [()]
+        for index, phrase in enumerate(self.phrases):
+            self.insert(phrase, index)
+        self.link()
+
+    def insert(self, phrase: str, index: int) -> None:
+        state = 0
+        for char in phrase:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.outputs.append(())
+            state = next_state
+        self.outputs[state] += (index,)
+
+    def link(self) -> None:
+        """
+        Set the failure links breadth first, each state also reports the
+        phrases of the states its failure link points to
+        """
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(char, 0)
+                self.fail[next_state] = target if target != next_state else 0
+                self.outputs[next_state] += self.outputs[self.fail[next_state]]
+
+    def __len__(self) -> int:
+        return len(self.phrases)
+
+    def search(self, text: str) -> Optional[str]:
+        """
+        Returns the first banned phrase found in the text
+        """
+        goto, fail, outputs, phrases = self.goto, self.fail, self.outputs, self.phrases
+        text = normalize(text)
+        length = len(text)
+        state = 0
+        for end, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if outputs[state]:
+                for index in outputs[state]:
+                    phrase = phrases[index]
+                    start = end - len(phrase) + 1
+                    if ((start == 0 or not text[start - 1].isalnum() or not phrase[0].isalnum())
+                            and (end + 1 == length or not text[end + 1].isalnum() or not phrase[-1].isalnum())):
+                        return phrase
+        return None
+
+
+class ModerationFilter:
+    """
+    Banned phrases of every channel, each compiled into its own
+    PhraseMatcher. A change rebuilds the channel's matcher on a background
+    thread, the previous matcher keeps checking messages until the new one
+    is swapped in. Changes made while a rebuild is queued share it.
+    """
+
+    def __init__(self) -> None:
+        self.phrases: Dict[str, List[str]] = {}
+        self.matchers: Dict[str, PhraseMatcher] = {}
+        self.pending: Set[str] = set()
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix='moderation')
+        self.rebuilds = 0
+
+    def load(self, phrases: Dict[str, List[str]]) -> None:
+        """
+        Compile the phrases of every channel right away, used at startup
+        """
+        for channel, channel_phrases in phrases.items():
+            self.phrases[channel] = list(channel_phrases)
+            self.build(channel)
+
+    def set_phrases(self, channel: str, phrases: Iterable[str]) -> 'Future[None]':
+        with self.lock:
+            self.phrases[channel] = list(phrases)
+            if channel in self.pending:
+                future: 'Future[None]' = Future()
+                future.set_result(None)
+                return future
+            self.pending.add(channel)
+        return self.executor.submit(self.build, channel)
+
+    def build(self, channel: str) -> None:
+        with self.lock:
+            self.pending.discard(channel)
+            phrases = self.phrases.get(channel, [])
+        try:
+            matcher = PhraseMatcher(phrases)
+        except Exception:
+            logging.exception('Could not compile the banned phrases of %s', channel)
+            return
+        if len(matcher):
+            self.matchers[channel] = matcher
+        else:
+            self.matchers.pop(channel, None)
+        self.rebuilds += 1
+
+    def check(self, channel: str, text: str) -> Optional[str]:
+        """
+        Returns the banned phrase found in a message, if any
+        """
+        matcher = self.matchers.get(channel)
+        if matcher is None:
+            return None
+        return matcher.search(text)
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False)
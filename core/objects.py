@@ -1,7 +1,11 @@
 from dataclasses import dataclass
 from typing import List, Optional, Union
 
+from .emotes import EmoteRanges, decode_emotes
+from .utils import add_slots
 
+
+@add_slots
 @dataclass
 class UserInfo:
     badge_info: str
@@ -26,7 +30,15 @@ class UserInfo:
     def is_mod(self) -> bool:
         return self.mod or ('broadcaster' in self.badges)
 
+    @property
+    def emote_ranges(self) -> EmoteRanges:
+        """
+        The emotes tag decoded into (emote id, positions), only when asked for
+        """
+        return decode_emotes(self.emotes)
+
 
+@add_slots
 @dataclass
 class Message:
     prefix: Optional[str]
@@ -45,6 +57,7 @@ class Message:
         return self.user  # type: ignore
 
 
+@add_slots
 @dataclass
 class Song:
     id: str
@@ -56,3 +69,19 @@ class Song:
     # Currently playing playlist or album
     context_type: str
     context_url: str
+    # Milliseconds into the track when it was fetched
+    progress: int = 0
+
+
+@add_slots
+@dataclass
+class Play:
+    """
+    A track in the recently played history
+    """
+    track_id: str
+    name: str
+    artists: str
+    track_url: str
+    # Unix time in milliseconds
+    played_at: int
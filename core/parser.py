@@ -1,8 +1,22 @@
-from typing import Any, Dict, Union
+from dataclasses import fields
+from typing import Any, Dict, Tuple, Union
 
 from .objects import Message, UserInfo
 
 
+# Raw tag key (e.g. badge-info) -> (UserInfo attribute, is boolean flag)
+# Computed once instead of on every message
+TAG_SCHEMA: Dict[str, Tuple[str, bool]] = {
+    field.name.replace('_', '-'): (field.name, field.type == bool)
+    for field in fields(UserInfo)
+}
+# Values used when twitch omits a tag
+USER_DEFAULTS: Dict[str, Any] = {
+    name: False if is_bool else ''
+    for name, is_bool in TAG_SCHEMA.values()
+}
+
+
 def parse(received_message: str, command_prefix: str = '!') -> Message:
     # If tags are included, message starts with @
     if received_message.startswith('@'):
@@ -17,23 +31,19 @@ def parse(received_message: str, command_prefix: str = '!') -> Message:
 def parse_user_data(message: str) -> UserInfo:
     """
     Returns a UserInfo object
-    Parse the user data received when 
+    Parse the tags sent in front of a message
     """
-    parts = message.strip('@').split(';')
-    user_keys = UserInfo.__annotations__
-    parts_dict: Dict[str, Any] = {}
-    for part in parts:
-        key, value = part.split('=', 1)
-        key = key.replace('-', '_')
-        if key not in user_keys:
+    parts_dict = USER_DEFAULTS.copy()
+    for part in message.lstrip('@').split(';'):
+        key, _, value = part.partition('=')
+        schema = TAG_SCHEMA.get(key)
+        if schema is None:
             continue
+        name, is_bool = schema
         # Normalize boolean values
-        if user_keys[key] == bool:
-            parts_dict[key] = True if value == '1' else False
-        else:
-            parts_dict[key] = value
+        parts_dict[name] = value == '1' if is_bool else value
 
-    return UserInfo(**parts_dict)  # type: ignore
+    return UserInfo(**parts_dict)
 
 
 def parse_message_data(message: str, user: Union[UserInfo, str] = '', command_prefix: str = '!') -> Message:
@@ -41,41 +51,43 @@ def parse_message_data(message: str, user: Union[UserInfo, str] = '', command_pr
     Returns a Message object
     Parse the standard message data received from twitch IRC
     """
-    parts = message.split(' ')
     prefix = None
-    channel = ''
-    irc_command = None
-    irc_args = None
+    if message.startswith(':'):
+        prefix_end = message.find(' ')
+        if prefix_end == -1:
+            prefix_end = len(message)
+        prefix = message[:prefix_end].lstrip(':')
+        if not user:
+            user = get_user_from_prefix(prefix)
+        message = message[prefix_end + 1:]
+
+    # The trailing text starts at the first parameter beginning with :
     text = None
     text_command = ''
     text_args = []
-    if parts[0].startswith(':'):
-        prefix = parts[0].lstrip(':')
-        if not user:
-            user = get_user_from_prefix(prefix)
-        parts = parts[1:]
+    if message.startswith(':'):
+        head = ''
+        text = message[1:]
+    else:
+        text_start = message.find(' :')
+        if text_start == -1:
+            head = message
+        else:
+            head = message[:text_start]
+            text = message[text_start + 2:]
+    if text is not None and text.startswith(command_prefix):
+        text_parts = text.split(' ')
+        text_command = text_parts[0].lstrip(command_prefix)
+        text_args = text_parts[1:]
 
-    text_start = next(
-        (i for i, part in enumerate(parts) if part.startswith(':')),
-        None
-    )
-    if text_start is not None:
-        text_parts = parts[text_start:]
-        text_parts[0] = text_parts[0][1:]
-        text = ' '.join(text_parts)
-        if text_parts[0].startswith(command_prefix):
-            text_command = text_parts[0].lstrip(command_prefix)
-            text_args = text_parts[1:]
-        parts = parts[:text_start]
-    irc_command = parts[0]
-    irc_args = parts[1:]
-
-    hash_start = next(
-        (i for i, part in enumerate(irc_args) if part.startswith('#')),
-        None
-    )
-    if hash_start is not None:
-        channel = irc_args[hash_start][1:]
+    irc_args = head.split(' ')
+    irc_command = irc_args.pop(0)
+
+    channel = ''
+    for arg in irc_args:
+        if arg.startswith('#'):
+            channel = arg[1:]
+            break
 
     return Message(
         prefix=prefix,
@@ -0,0 +1,227 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from .connection import IRCConnection, create_ssl_context
+from .metrics import reconnect_seconds
+from .scheduler import PRIORITY_CONTROL, RateLimiter, SendScheduler
+
+
+class Backoff:
+    """
+    Exponential backoff with full jitter: attempt n waits a random time
+    up to min(maximum, base * 2 ** n) seconds, so connections dropped
+    together don't all reconnect at the same moment
+    """
+
+    def __init__(self, base: float = 0.5, maximum: float = 60.0, rng: Optional[random.Random] = None) -> None:
+        self.base = base
+        self.maximum = maximum
+        self.random = rng or random.Random()
+
+    def delay(self, attempt: int) -> float:
+        return self.random.uniform(0, min(self.maximum, self.base * 2 ** attempt))
+
+
+class ConnectionPool:
+    """
+    Spreads channels over several IRC connections.
+    All connections share one RateLimiter, since Twitch limits are per
+    account, so JOINs are paced across the whole pool. Inbound lines of
+    every connection are passed to the same `on_line` callback.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        on_line: Callable[[str], None],
+        on_connect: Callable[[IRCConnection], None],
+        channels_per_connection: int = 50,
+        limiter: Optional[RateLimiter] = None,
+        queue_size: int = 1000,
+        backoff: Optional[Backoff] = None,
+        backlog_size: int = 100,
+        connect_timeout: float = 10.0,
+        **connection_options: Any,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.on_line = on_line
+        self.on_connect = on_connect
+        self.channels_per_connection = channels_per_connection
+        self.limiter = limiter or RateLimiter()
+        self.queue_size = queue_size
+        self.backoff = backoff or Backoff()
+        self.backlog_size = backlog_size
+        self.connect_timeout = connect_timeout
+        if connection_options.get('use_tls', True):
+            # Shared by every connection so reconnects can resume the TLS session
+            connection_options.setdefault('ssl_context', create_ssl_context())
+        self.connection_options = connection_options
+        self.connections: List[IRCConnection] = []
+        # Channel -> connection it has joined on
+        self.channel_connections: Dict[str, IRCConnection] = {}
+        self.channels: Dict[IRCConnection, List[str]] = {}
+        self.tasks: Dict[asyncio.Future, IRCConnection] = {}
+        # Dropped connections waiting for a new one, their schedulers hold the backlog
+        self.dropped: List[IRCConnection] = []
+        self.reconnects: Set[asyncio.Future] = set()
+        self.reconnect_count = 0
+
+    async def start(self, channels: List[str]) -> None:
+        """
+        Open enough connections for the channels, all at once, and send
+        their login and JOINs. Nothing is read until run() is called.
+        """
+        n = self.channels_per_connection
+        groups = [channels[i:i + n] for i in range(0, len(channels), n)] or [[]]
+        results = await asyncio.gather(*(self.connect() for _ in groups), return_exceptions=True)
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors:
+            for result in results:
+                if isinstance(result, IRCConnection):
+                    await result.close()
+            raise errors[0]
+        for connection, group in zip(results, groups):
+            self.add(connection, group)  # type: ignore
+
+    async def connect(self, scheduler: Optional[SendScheduler] = None) -> IRCConnection:
+        connection = IRCConnection(
+            self.host,
+            self.port,
+            self.on_line,
+            scheduler=scheduler or SendScheduler(self.limiter, max_size=self.queue_size),
+            **self.connection_options,
+        )
+        await connection.connect()
+        return connection
+
+    def add(self, connection: IRCConnection, channels: List[str]) -> None:
+        """
+        Log in and join the channels with a single write
+        """
+        self.on_connect(connection)
+        self.connections.append(connection)
+        self.channels[connection] = []
+        self.join(connection, channels)
+        connection.flush()
+
+    def watch(self, connection: IRCConnection) -> None:
+        self.tasks[asyncio.ensure_future(connection.run())] = connection
+
+    def join(self, connection: IRCConnection, channels: List[str]) -> None:
+        for channel in channels:
+            logging.info('< JOIN #%s', channel)
+            connection.send(f'JOIN #{channel}')
+            self.channel_connections[channel] = connection
+            self.channels[connection].append(channel)
+
+    async def run(self) -> None:
+        """
+        Run until closed. The channels of a dropped connection are moved
+        to connections with free slots, the rest are joined again on a
+        new connection, which also sends the lines that were waiting.
+        """
+        watched = set(self.tasks.values())
+        for connection in self.connections:
+            if connection not in watched:
+                self.watch(connection)
+        while self.tasks or self.reconnects:
+            done, _ = await asyncio.wait([*self.tasks, *self.reconnects], return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task in self.reconnects:
+                    self.reconnects.discard(task)
+                    if not task.cancelled() and task.exception():
+                        logging.error('Reconnect failed', exc_info=task.exception())
+                    continue
+                connection = self.tasks.pop(task)
+                if not task.cancelled() and task.exception():
+                    logging.error('Connection dropped', exc_info=task.exception())
+                await self.rebalance(connection)
+
+    async def rebalance(self, dropped: IRCConnection) -> None:
+        started = time.perf_counter()
+        channels = self.channels.pop(dropped)
+        self.connections.remove(dropped)
+        # Lines that were not sent yet stay in its scheduler as the backlog
+        await dropped.close(flush=False)
+        dropped.scheduler.prune(self.backlog_size)
+        if channels and self.connections:
+            logging.info(f'Moving {len(channels)} channels to other connections')
+        for connection in self.connections:
+            free = self.channels_per_connection - len(self.channels[connection])
+            if free > 0 and channels:
+                moved, channels = channels[:free], channels[free:]
+                self.join(connection, moved)
+                for line in dropped.scheduler.remove_channels(set(moved)):
+                    connection.scheduler.put(line.data, line.priority, line.channel)
+        if not channels and self.connections:
+            for line in dropped.scheduler.clear():
+                self.connection_for(line.channel).scheduler.put(line.data, line.priority, line.channel)
+            return
+        self.dropped.append(dropped)
+        self.reconnects.add(asyncio.ensure_future(self.reconnect(dropped, channels, started)))
+
+    async def reconnect(self, dropped: IRCConnection, channels: List[str], started: float) -> None:
+        """
+        Open a new connection for the channels of a dropped one, retrying with backoff
+        """
+        attempt = 0
+        while True:
+            await asyncio.sleep(self.backoff.delay(attempt))
+            attempt += 1
+            try:
+                connection = await asyncio.wait_for(self.connect(dropped.scheduler), self.connect_timeout)
+                break
+            except (OSError, asyncio.TimeoutError) as e:
+                logging.warning(f'Reconnect attempt {attempt} failed: {e!r}')
+        self.dropped.remove(dropped)
+        backlog = dropped.scheduler.prune(self.backlog_size)
+        self.add(connection, channels)
+        self.watch(connection)
+        elapsed = time.perf_counter() - started
+        tls = ('resumed' if connection.session_reused else 'full') if connection.use_tls else 'none'
+        reconnect_seconds.observe(elapsed, tls)
+        self.reconnect_count += 1
+        logging.info(f'Reconnected in {elapsed:.2f}s after {attempt} attempts ({tls} TLS handshake), '
+                     f'joined {len(channels)} channels, replaying {backlog} lines')
+
+    def connection_for(self, channel: Optional[str]) -> IRCConnection:
+        if channel is not None and channel in self.channel_connections:
+            return self.channel_connections[channel]
+        if self.connections:
+            return self.connections[0]
+        # Every connection is down, the line waits in the backlog of one being reconnected
+        return self.dropped[0]
+
+    def send(self, line: str, priority: int = PRIORITY_CONTROL, channel: Optional[str] = None) -> None:
+        self.connection_for(channel).send(line, priority, channel)
+
+    def send_data(self, data: bytes, priority: int = PRIORITY_CONTROL, channel: Optional[str] = None) -> None:
+        self.connection_for(channel).send_data(data, priority, channel)
+
+    async def close(self) -> None:
+        for task in [*self.tasks, *self.reconnects]:
+            task.cancel()
+        for connection in self.connections:
+            await connection.close()
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Outbound stats summed over all connections
+        """
+        totals: Dict[str, float] = {'connections': len(self.connections), 'reconnects': self.reconnect_count}
+        for connection in self.connections:
+            for key, value in connection.scheduler.stats().items():
+                if key == 'max_wait':
+                    totals[key] = max(totals.get(key, 0.0), value)
+                elif key == 'average_wait':
+                    continue
+                else:
+                    totals[key] = totals.get(key, 0) + value
+        total_wait = sum(connection.scheduler.total_wait for connection in self.connections)
+        totals['average_wait'] = total_wait / totals['sent'] if totals.get('sent') else 0.0
+        return totals
@@ -0,0 +1,111 @@
+from typing import Dict, Set, Tuple
+
+
+class LineFilter:
+    """
+    Cheap classification of raw IRC lines, run before core.parser.parse.
+    Only PINGs, command PRIVMSGs and lines whose IRC command has been
+    subscribed to are worth a full parse, plain chat is skipped.
+    """
+
+    def __init__(self, command_prefix: str = '!') -> None:
+        self.command_prefix = command_prefix
+        self.subscriptions: Set[str] = {'PING'}
+        self.parsed = 0
+        self.skipped = 0
+
+    def subscribe(self, irc_command: str) -> None:
+        """
+        Request that every line with this IRC command is parsed.
+        Subscribing to PRIVMSG disables skipping of plain chat.
+        """
+        self.subscriptions.add(irc_command)
+
+    def unsubscribe(self, irc_command: str) -> None:
+        self.subscriptions.discard(irc_command)
+
+    def should_parse(self, line: str) -> bool:
+        if self.classify(line):
+            self.parsed += 1
+            return True
+        self.skipped += 1
+        return False
+
+    def classify(self, line: str) -> bool:
+        irc_command, end = split_command(line)
+        if irc_command in self.subscriptions:
+            return True
+        if irc_command == 'PRIVMSG':
+            text_start = line.find(' :', end)
+            return text_start != -1 and line.startswith(self.command_prefix, text_start + 2)
+        return False
+
+    def stats(self) -> Dict[str, int]:
+        return {'parsed': self.parsed, 'skipped': self.skipped}
+
+
+def split_command(line: str) -> Tuple[str, int]:
+    """
+    Returns the IRC command of a raw line and the index where it ends,
+    skipping over the tags and the prefix without splitting the line
+    """
+    start = 0
+    if line.startswith('@'):
+        start = line.find(' ') + 1
+    if line.startswith(':', start):
+        start = line.find(' ', start) + 1
+    if start == 0 and line[:1] in ('@', ':'):
+        return '', len(line)
+    end = line.find(' ', start)
+    if end == -1:
+        end = len(line)
+    return line[start:end], end
+
+
+def find_channel(line: str) -> str:
+    """
+    Returns the channel a raw line is addressed to, without the #
+    """
+    _, end = split_command(line)
+    if not line.startswith(' #', end):
+        return ''
+    channel_end = line.find(' ', end + 2)
+    return line[end + 2:] if channel_end == -1 else line[end + 2:channel_end]
+
+
+def split_privmsg(line: str) -> Tuple[str, str, str]:
+    """
+    Returns the nick, channel and text of a raw PRIVMSG line
+    without parsing its tags
+    """
+    irc_command, end = split_command(line)
+    if irc_command != 'PRIVMSG':
+        return '', '', ''
+    prefix_start = line.find(' ') + 2 if line.startswith('@') else 1
+    nick_end = line.find('!', prefix_start, end)
+    nick = line[prefix_start:nick_end] if nick_end != -1 else ''
+    text_start = line.find(' :', end)
+    if text_start == -1:
+        return nick, line[end + 2:], ''
+    return nick, line[end + 2:text_start], line[text_start + 2:]
+
+
+def find_tag(line: str, key: str) -> str:
+    """
+    Returns the value of one tag of a raw line without parsing the others,
+    empty if the line has no such tag
+    """
+    if not line.startswith('@'):
+        return ''
+    tags_end = line.find(' ')
+    if tags_end == -1:
+        tags_end = len(line)
+    if line.startswith(key + '=', 1):
+        start = len(key) + 2
+    else:
+        start = line.find(';' + key + '=', 0, tags_end)
+        if start == -1:
+            return ''
+        start += len(key) + 2
+    end = line.find(';', start, tags_end)
+    return line[start:tags_end if end == -1 else end]
@@ -0,0 +1,334 @@
+import asyncio
+import heapq
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+from .metrics import stage_seconds
+from .utils import add_slots
+
+
+# Lower values are sent first
+PRIORITY_PONG = 0
+PRIORITY_CONTROL = 1
+PRIORITY_REPLY = 2
+PRIORITY_ANNOUNCEMENT = 3
+
+# (messages, seconds)
+RateLimit = Tuple[int, float]
+
+# Lines of the same kind and channel share their rate limits
+GroupKey = Tuple[str, Optional[str]]
+
+# Lines a new connection sends again by itself, they are not replayed after a reconnect
+CONNECTION_KINDS = frozenset(('PASS', 'NICK', 'CAP', 'JOIN', 'PONG'))
+
+
+class TokenBucket:
+    """
+    Allows `capacity` events per `period` seconds, refilled continuously
+    """
+
+    def __init__(self, capacity: int, period: float) -> None:
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        if now > self.updated_at:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+
+    def delay(self, now: float) -> float:
+        """
+        Seconds until a token is available
+        """
+        self.refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now: float) -> None:
+        self.refill(now)
+        self.tokens -= 1
+
+
+class RateLimiter:
+    """
+    Twitch rate limits for one account.
+    PRIVMSGs count against the account limit, channels where the bot is
+    not a moderator also count against the lower non-moderator limit and
+    their own per channel limit.
+    """
+
+    def __init__(
+        self,
+        privmsg: RateLimit = (20, 30),
+        privmsg_mod: RateLimit = (100, 30),
+        channel: RateLimit = (1, 1),
+        join: RateLimit = (20, 10),
+    ) -> None:
+        self.privmsg = TokenBucket(*privmsg_mod)
+        self.privmsg_non_mod = TokenBucket(*privmsg)
+        self.join = TokenBucket(*join)
+        self.channel_limit = channel
+        self.channels: Dict[str, TokenBucket] = {}
+        self.moderator_channels: Set[str] = set()
+
+    def set_moderator(self, channel: str, is_mod: bool) -> None:
+        if is_mod:
+            self.moderator_channels.add(channel)
+        else:
+            self.moderator_channels.discard(channel)
+
+    def buckets(self, kind: str, channel: Optional[str]) -> List[TokenBucket]:
+        if kind == 'JOIN':
+            return [self.join]
+        if kind != 'PRIVMSG':
+            return []
+        if channel in self.moderator_channels:
+            return [self.privmsg]
+        key = channel or ''
+        if key not in self.channels:
+            self.channels[key] = TokenBucket(*self.channel_limit)
+        return [self.privmsg, self.privmsg_non_mod, self.channels[key]]
+
+    def delay(self, kind: str, channel: Optional[str], now: float) -> float:
+        return max((bucket.delay(now) for bucket in self.buckets(kind, channel)), default=0.0)
+
+    def take(self, kind: str, channel: Optional[str], now: float) -> None:
+        for bucket in self.buckets(kind, channel):
+            bucket.take(now)
+
+
+@add_slots
+@dataclass(order=True)
+class OutboundLine:
+    priority: int
+    sequence: int
+    data: bytes = field(compare=False)
+    kind: str = field(compare=False)
+    channel: Optional[str] = field(compare=False)
+    queued_at: float = field(compare=False)
+
+
+class SendScheduler:
+    """
+    Priority queue of outbound lines paced by a RateLimiter.
+    Lines are grouped by kind and channel, the lines of a group share their
+    rate limits. Groups whose next line may be sent are kept in a heap by
+    that line's priority, groups held back by a limit in a heap by the time
+    they may send again. A held back channel is skipped without looking at
+    its lines and does not block lines for other channels.
+    """
+
+    def __init__(self, limiter: Optional[RateLimiter] = None, max_size: int = 1000) -> None:
+        self.limiter = limiter or RateLimiter()
+        self.max_size = max_size
+        # Lines of each group in priority order
+        self.groups: Dict[GroupKey, List[OutboundLine]] = {}
+        # (priority, sequence, version, key) of the next line of each group that may be ready
+        self.ready: List[Tuple[int, int, int, GroupKey]] = []
+        # (time it may send again, version, key) of held back groups
+        self.waiting: List[Tuple[float, int, GroupKey]] = []
+        # Bumped whenever a group is pushed to a heap, older heap entries are skipped
+        self.versions: Dict[GroupKey, int] = {}
+        self.held: Set[GroupKey] = set()
+        self.size = 0
+        self.sequence = 0
+        self.wakeup: Optional[asyncio.Event] = None
+        self.sent = 0
+        self.dropped = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def put(self, data: bytes, priority: int = PRIORITY_CONTROL, channel: Optional[str] = None) -> None:
+        kind = data.split(b' ', 1)[0].decode()
+        self.sequence += 1
+        line = OutboundLine(priority, self.sequence, data, kind, channel, time.monotonic())
+        if self.size >= self.max_size:
+            # Drop the least important line to make room
+            worst = max(max(lines) for lines in self.groups.values())
+            if line > worst:
+                self.dropped += 1
+                return
+            self.remove(worst)
+            self.dropped += 1
+        self.add(line)
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+    def add(self, line: OutboundLine) -> None:
+        key = (line.kind, line.channel)
+        lines = self.groups.get(key)
+        if lines is None:
+            lines = self.groups[key] = []
+        heapq.heappush(lines, line)
+        self.size += 1
+        # A held back group is looked at again once its delay is over
+        if lines[0] is line and key not in self.held:
+            self.push_ready(key)
+
+    def remove(self, line: OutboundLine) -> None:
+        key = (line.kind, line.channel)
+        lines = self.groups[key]
+        was_next = lines[0] is line
+        lines.remove(line)
+        heapq.heapify(lines)
+        self.size -= 1
+        if not lines:
+            self.forget(key)
+        elif was_next and key not in self.held:
+            self.push_ready(key)
+
+    def forget(self, key: GroupKey) -> None:
+        del self.groups[key]
+        del self.versions[key]
+        self.held.discard(key)
+
+    def push_ready(self, key: GroupKey) -> None:
+        version = self.versions[key] = self.versions.get(key, 0) + 1
+        line = self.groups[key][0]
+        heapq.heappush(self.ready, (line.priority, line.sequence, version, key))
+
+    def hold(self, key: GroupKey, until: float) -> None:
+        version = self.versions[key] = self.versions[key] + 1
+        self.held.add(key)
+        heapq.heappush(self.waiting, (until, version, key))
+
+    def pop_ready(self, now: float) -> Tuple[Optional[OutboundLine], float]:
+        """
+        Returns the most important line allowed to be sent now,
+        or the delay until one is
+        """
+        waiting, ready, versions = self.waiting, self.ready, self.versions
+        while waiting and waiting[0][0] <= now:
+            _, version, key = heapq.heappop(waiting)
+            if versions.get(key) == version:
+                self.held.discard(key)
+                self.push_ready(key)
+        while ready:
+            _, _, version, key = heapq.heappop(ready)
+            if versions.get(key) != version:
+                continue
+            lines = self.groups[key]
+            head = lines[0]
+            delay = self.limiter.delay(head.kind, head.channel, now)
+            if delay > 0:
+                self.hold(key, now + delay)
+                continue
+            heapq.heappop(lines)
+            self.size -= 1
+            if lines:
+                self.push_ready(key)
+            else:
+                self.forget(key)
+            return head, 0.0
+        while waiting and versions.get(waiting[0][2]) != waiting[0][1]:
+            heapq.heappop(waiting)
+        if not waiting:
+            return None, float('inf')
+        return None, max(waiting[0][0] - now, 0.0)
+
+    async def get(self) -> bytes:
+        """
+        Wait until a line may be sent and return it
+        """
+        if self.wakeup is None:
+            self.wakeup = asyncio.Event()
+        while True:
+            now = time.monotonic()
+            line, delay = self.pop_ready(now)
+            if line is not None:
+                self.take(line, now)
+                return line.data
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=None if delay == float('inf') else delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def get_ready(self) -> List[bytes]:
+        """
+        Remove and return every line that may be sent now, without waiting
+        """
+        now = time.monotonic()
+        ready = []
+        while True:
+            line, _ = self.pop_ready(now)
+            if line is None:
+                return ready
+            self.take(line, now)
+            ready.append(line.data)
+
+    def take(self, line: OutboundLine, now: float) -> None:
+        self.limiter.take(line.kind, line.channel, now)
+        self.record_sent(line, now)
+
+    def lines(self) -> List[OutboundLine]:
+        """
+        Every queued line in priority order
+        """
+        return sorted(line for lines in self.groups.values() for line in lines)
+
+    def replace(self, lines: List[OutboundLine]) -> None:
+        self.groups.clear()
+        self.ready.clear()
+        self.waiting.clear()
+        self.versions.clear()
+        self.held.clear()
+        self.size = 0
+        for line in lines:
+            self.add(line)
+
+    def clear(self) -> List[OutboundLine]:
+        """
+        Remove and return every queued line in priority order
+        """
+        lines = self.lines()
+        self.replace([])
+        return lines
+
+    def drain(self) -> List[bytes]:
+        """
+        Remove and return every queued line, ignoring rate limits
+        """
+        return [line.data for line in self.clear()]
+
+    def remove_channels(self, channels: Set[str]) -> List[OutboundLine]:
+        """
+        Remove and return the queued lines for the channels, in priority order
+        """
+        lines = self.lines()
+        removed = [line for line in lines if line.channel in channels]
+        if removed:
+            self.replace([line for line in lines if line.channel not in channels])
+        return removed
+
+    def prune(self, size: int) -> int:
+        """
+        Prepare the queue of a dropped connection to be replayed on a new one:
+        drop the lines the new connection sends again and keep at most `size`
+        of the others, the most important first. Returns the kept count.
+        """
+        lines = [line for line in self.lines() if line.kind not in CONNECTION_KINDS]
+        self.dropped += max(len(lines) - size, 0)
+        self.replace(lines[:size])
+        return self.size
+
+    def record_sent(self, line: OutboundLine, now: float) -> None:
+        wait = now - line.queued_at
+        self.sent += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        stage_seconds.observe(wait, 'send_wait')
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            'queue_depth': self.size,
+            'sent': self.sent,
+            'dropped': self.dropped,
+            'average_wait': self.total_wait / self.sent if self.sent else 0.0,
+            'max_wait': self.max_wait,
+        }
@@ -0,0 +1,170 @@
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS channels (
+    channel TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS template_commands (
+    channel TEXT NOT NULL,
+    name TEXT NOT NULL,
+    template TEXT NOT NULL,
+    PRIMARY KEY (channel, name)
+) WITHOUT ROWID;
+'''
+
+# (operation, channel, name, template)
+Change = Tuple[str, str, str, Optional[str]]
+
+
+class CommandStore:
+    """
+    Template commands of every channel in SQLite (WAL mode).
+    A channel's commands are read when it is loaded. Changes are applied
+    to an in-memory overlay right away and written by a background thread
+    in batches, one transaction per batch.
+    Channels loaded for the first time get a copy of the `defaults`,
+    which is how the global commands of state.json are migrated.
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        batch_interval: float = 1.0,
+        batch_size: int = 500,
+    ) -> None:
+        self.filename = filename
+        self.batch_interval = batch_interval
+        self.batch_size = batch_size
+        self.defaults: Dict[str, str] = {}
+        self.connection: Optional[sqlite3.Connection] = None
+        self.queue: 'queue.Queue[Optional[Change]]' = queue.Queue()
+        self.thread: Optional[threading.Thread] = None
+        self.lock = threading.Lock()
+        # Changes not written yet, by channel and command name, None for deleted
+        self.pending: Dict[str, Dict[str, Optional[str]]] = {}
+        self.known_channels: Set[str] = set()
+        self.batches = 0
+
+    def connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.filename, timeout=10, check_same_thread=False)
+        connection.execute('PRAGMA journal_mode=WAL')
+        # WAL stays consistent on a crash with NORMAL, only the last transactions may be lost
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    def open(self) -> None:
+        if self.connection is not None:
+            return
+        self.connection = self.connect()
+        with self.connection:
+            self.connection.executescript(SCHEMA)
+        self.thread = threading.Thread(target=self.run, name='command-store', daemon=True)
+        self.thread.start()
+
+    def load(self, channel: str) -> Dict[str, str]:
+        """
+        Returns the template commands of a channel, including unwritten changes
+        """
+        assert self.connection is not None
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT name, template FROM template_commands WHERE channel = ?', (channel,)
+            ).fetchall()
+            commands = dict(rows)
+            if channel not in self.known_channels:
+                self.known_channels.add(channel)
+                known = self.connection.execute('SELECT 1 FROM channels WHERE channel = ?', (channel,)).fetchone()
+                if not known:
+                    self.queue.put(('channel', channel, '', None))
+                    pending = self.pending.get(channel, {})
+                    for name, template in self.defaults.items():
+                        if name not in commands and name not in pending:
+                            self.change('set', channel, name, template)
+            for name, template in self.pending.get(channel, {}).items():
+                if template is None:
+                    commands.pop(name, None)
+                else:
+                    commands[name] = template
+        return commands
+
+    def set(self, channel: str, name: str, template: str) -> None:
+        with self.lock:
+            self.change('set', channel, name, template)
+
+    def delete(self, channel: str, name: str) -> None:
+        with self.lock:
+            self.change('delete', channel, name, None)
+
+    def change(self, operation: str, channel: str, name: str, template: Optional[str]) -> None:
+        self.pending.setdefault(channel, {})[name] = template
+        self.queue.put((operation, channel, name, template))
+
+    def run(self) -> None:
+        connection = self.connect()
+        try:
+            while True:
+                change = self.queue.get()
+                changes = [change]
+                deadline = time.monotonic() + self.batch_interval
+                # Collect more changes for the same transaction
+                while change is not None and len(changes) < self.batch_size:
+                    try:
+                        change = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+                    except queue.Empty:
+                        break
+                    changes.append(change)
+                stop = None in changes
+                self.write(connection, [change for change in changes if change is not None])
+                if stop:
+                    return
+        finally:
+            connection.close()
+
+    def write(self, connection: sqlite3.Connection, changes: List[Change]) -> None:
+        if not changes:
+            return
+        try:
+            with connection:
+                for operation, channel, name, template in changes:
+                    if operation == 'set':
+                        connection.execute(
+                            'INSERT OR REPLACE INTO template_commands (channel, name, template) VALUES (?, ?, ?)',
+                            (channel, name, template),
+                        )
+                    elif operation == 'delete':
+                        connection.execute(
+                            'DELETE FROM template_commands WHERE channel = ? AND name = ?', (channel, name)
+                        )
+                    else:
+                        # The channel got its copy of the defaults
+                        connection.execute('INSERT OR IGNORE INTO channels (channel) VALUES (?)', (channel,))
+        except sqlite3.Error as e:
+            # The changes stay in the overlay, so they are still served until restart
+            logging.error(f'Could not write {len(changes)} command changes to {self.filename}: {e}')
+            return
+        self.batches += 1
+        with self.lock:
+            for operation, channel, name, template in changes:
+                commands = self.pending.get(channel)
+                # Keep the overlay entry if it was changed again meanwhile
+                if commands is not None and name in commands and commands[name] == template:
+                    del commands[name]
+                    if not commands:
+                        del self.pending[channel]
+
+    def close(self) -> None:
+        """
+        Write pending changes and stop the writer thread
+        """
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
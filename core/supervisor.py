@@ -0,0 +1,309 @@
+import asyncio
+import copy
+import logging
+import multiprocessing
+import threading
+import zlib
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+
+from . import logs
+from .journal import StateJournal
+from .prefilter import find_channel, split_command
+from .scheduler import PRIORITY_CONTROL
+
+if TYPE_CHECKING:
+    from main import Bot
+
+# Spawned workers don't inherit the supervisor's threads and event loop
+context = multiprocessing.get_context('spawn')
+
+WORKER_LOG_FORMAT = '[%(asctime)-15s] %(levelname)s worker-%(process)d %(message)s'
+
+
+class WorkerOutbound:
+    """
+    Stands in for the ConnectionPool inside a worker process,
+    outbound lines are handed to the supervisor which sends them
+    """
+
+    def __init__(self, outbound: Any) -> None:
+        self.outbound = outbound
+
+    def send(self, line: str, priority: int = PRIORITY_CONTROL, channel: Optional[str] = None) -> None:
+        self.send_data((line + '\r\n').encode('utf-8'), priority, channel)
+
+    def send_data(self, data: bytes, priority: int = PRIORITY_CONTROL, channel: Optional[str] = None) -> None:
+        self.outbound.put(('send', data, priority, channel))
+
+
+class ReplicatedJournal(StateJournal):
+    """
+    Journal of a worker process. It starts from the supervisor's state
+    instead of reading the files, which the supervisor owns and may be
+    writing or compacting. Changes are sent to the supervisor, which
+    journals them and replicates them to the other workers.
+    """
+
+    def __init__(self, snapshot_filename: str, state: Dict[str, Any], outbound: Any, worker: int) -> None:
+        super().__init__(snapshot_filename)
+        self.state = state
+        self.outbound = outbound
+        self.worker = worker
+
+    def load(self) -> Dict[str, Any]:
+        return copy.deepcopy(self.state)
+
+    def start(self) -> None:
+        pass
+
+    def set(self, path: List[str], value: Any) -> None:
+        self.outbound.put(('state', {'op': 'set', 'path': path, 'value': value}, self.worker))
+
+    def delete(self, path: List[str]) -> None:
+        self.outbound.put(('state', {'op': 'delete', 'path': path}, self.worker))
+
+    def close(self) -> None:
+        pass
+
+
+def run_worker(
+    bot_class: Callable[[], 'Bot'],
+    index: int,
+    channels: List[str],
+    state: Dict[str, Any],
+    inbound: Any,
+    outbound: Any,
+    log_level: int,
+    chat_sample_rate: float,
+) -> None:
+    """
+    Entry point of a worker process
+    """
+    logs.setup_logging(level=log_level, format=WORKER_LOG_FORMAT, chat_sample_rate=chat_sample_rate)
+    bot = bot_class()
+    bot.connections = WorkerOutbound(outbound)  # type: ignore
+    bot.journal = ReplicatedJournal(bot.state_filename, state, outbound, index)
+    # Each worker serves its own metrics, on the ports after the supervisor's
+    if bot.metrics_port:
+        bot.metrics_port += 1 + index
+    bot.read_state()
+
+    async def handle_lines() -> None:
+        loop = asyncio.get_running_loop()
+        await bot.start_metrics_server()
+        await bot.preload_template_commands(channels)
+        while True:
+            batch = await loop.run_in_executor(None, inbound.get)
+            if batch is None:
+                if bot.metrics_server is not None:
+                    await bot.metrics_server.close()
+                return
+            for item in batch:
+                if type(item) is str:
+                    bot.handle_message(item)
+                elif type(item) is tuple:
+                    # The supervisor's last poll of the currently playing song
+                    bot.playback.update(*item)
+                else:
+                    bot.apply_state_entry(item)
+
+    try:
+        asyncio.run(handle_lines())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        bot.workers.shutdown()
+        bot.command_store.close()
+
+
+class Supervisor:
+    """
+    Runs parsing and dispatch in several worker processes.
+    The supervisor process keeps the IRC connections and the state journal,
+    routes each channel to a fixed worker and sends the workers' replies.
+    State changes made by a worker are replicated to the others and
+    workers that crash are restarted. The currently playing song is polled
+    by the supervisor and handed to every worker.
+    """
+
+    def __init__(self, bot: 'Bot', processes: int, bot_class: Optional[Callable[[], 'Bot']] = None) -> None:
+        self.bot = bot
+        self.processes = processes
+        self.bot_class = bot_class or type(bot)
+        self.outbound = context.Queue()
+        self.inbound: List[Any] = []
+        self.workers: List[Any] = []
+        # Lines waiting to be handed to each worker
+        self.batches: List[List[Any]] = []
+        self.flush_scheduled = False
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.outbound_thread: Optional[threading.Thread] = None
+        self.stopping = False
+        self.restarts = 0
+        self.routed: Dict[int, int] = {}
+        # Called from the outbound thread for each reply, defaults to sending it
+        self.on_send: Callable[[bytes, int, Optional[str]], None] = self.send
+
+    def init(self) -> None:
+        try:
+            asyncio.run(self.run())
+        finally:
+            self.stop_workers()
+
+    async def run(self) -> None:
+        self.start_outbound_thread()
+        loop = asyncio.get_running_loop()
+        # Poll listeners run on the polling thread
+        self.bot.playback.poll_listeners.append(lambda: loop.call_soon_threadsafe(self.share_playback))
+        monitor = asyncio.ensure_future(self.monitor())
+        try:
+            await asyncio.gather(loop.run_in_executor(None, self.bot.read_state), self.bot.connect(on_line=self.route))
+            # Workers start from the state read here, lines are only read once they are started
+            self.start_workers()
+            await self.bot.loop_for_messages()
+        finally:
+            monitor.cancel()
+
+    def start_workers(self) -> None:
+        for index in range(self.processes):
+            self.inbound.append(None)
+            self.workers.append(None)
+            self.batches.append([])
+            self.start_worker(index)
+
+    def start_worker(self, index: int) -> None:
+        # A queue shared with a crashed process may be left locked, use a new one
+        self.inbound[index] = context.Queue()
+        process = context.Process(
+            target=run_worker,
+            args=(
+                self.bot_class,
+                index,
+                [channel for channel in self.bot.channels if self.worker_for(channel) == index],
+                # Replicated entries not applied yet are in the worker's batch
+                self.bot.state,
+                self.inbound[index],
+                self.outbound,
+                logging.getLogger().level,
+                logs.chat_filter.rate if logs.chat_filter else 1.0,
+            ),
+            name=f'xchrombot-worker-{index}',
+            daemon=True,
+        )
+        process.start()
+        self.workers[index] = process
+        if self.bot.playback.updated_at is not None:
+            # A restarted worker doesn't have to wait for the next poll
+            self.inbound[index].put([self.playback_item()])
+
+    def stop_workers(self) -> None:
+        self.stopping = True
+        for queue in self.inbound:
+            queue.put(None)
+        for process in self.workers:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self.outbound.put(None)
+        if self.outbound_thread is not None:
+            self.outbound_thread.join()
+
+    async def monitor(self, interval: float = 1.0) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            for index, process in enumerate(self.workers):
+                if not process.is_alive() and not self.stopping:
+                    logging.error(f'Worker {index} exited with code {process.exitcode}, restarting')
+                    self.restarts += 1
+                    self.start_worker(index)
+
+    def worker_for(self, channel: str) -> int:
+        return zlib.crc32(channel.encode('utf-8')) % self.processes
+
+    def route(self, line: str) -> None:
+        """
+        Hand a received line to the worker of its channel
+        """
+        if not line:
+            return
+        irc_command, _ = split_command(line)
+        if not self.bot.line_filter.should_parse(line):
+            # Workers still check plain chat for banned phrases, count its emotes and keep its history
+            bot = self.bot
+            if irc_command != 'PRIVMSG' or not (
+                bot.moderation.matchers or bot.emote_stats.enabled or bot.history.enabled
+            ):
+                return
+        if irc_command == 'USERSTATE':
+            # Rate limits are applied by the supervisor
+            self.bot.handle_message(line)
+            return
+        index = self.worker_for(find_channel(line))
+        self.routed[index] = self.routed.get(index, 0) + 1
+        self.batches[index].append(line)
+        self.schedule_flush()
+
+    def broadcast(self, entry: Dict[str, Any], source: Optional[int] = None) -> None:
+        for index in range(self.processes):
+            if index != source:
+                self.batches[index].append(entry)
+        self.schedule_flush()
+
+    def playback_item(self) -> Tuple[Any, ...]:
+        playback = self.bot.playback
+        return (playback.song, playback.ok, playback.updated_at)
+
+    def share_playback(self) -> None:
+        item = self.playback_item()
+        for batch in self.batches:
+            batch.append(item)
+        self.schedule_flush()
+
+    def schedule_flush(self) -> None:
+        # Lines from one read are sent to the workers as a single batch
+        if self.flush_scheduled:
+            return
+        self.flush_scheduled = True
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+        self.loop.call_soon(self.flush)
+
+    def flush(self) -> None:
+        self.flush_scheduled = False
+        for index, batch in enumerate(self.batches):
+            if batch:
+                self.inbound[index].put(batch)
+                self.batches[index] = []
+
+    def start_outbound_thread(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.outbound_thread = threading.Thread(target=self.read_outbound, name='supervisor-outbound', daemon=True)
+        self.outbound_thread.start()
+
+    def read_outbound(self) -> None:
+        assert self.loop is not None
+        while True:
+            item = self.outbound.get()
+            if item is None:
+                return
+            if item[0] == 'send':
+                _, data, priority, channel = item
+                self.on_send(data, priority, channel)
+            elif item[0] == 'state':
+                _, entry, source = item
+                self.loop.call_soon_threadsafe(self.replicate, entry, source)
+
+    def replicate(self, entry: Dict[str, Any], source: int) -> None:
+        """
+        Apply a worker's state change to the journal and the other workers
+        """
+        self.bot.apply_state_entry(entry)
+        if entry['op'] == 'set':
+            self.bot.journal.set(entry['path'], entry['value'])
+        else:
+            self.bot.journal.delete(entry['path'])
+        self.broadcast(entry, source)
+
+    def send(self, data: bytes, priority: int, channel: Optional[str]) -> None:
+        assert self.loop is not None and self.bot.connections is not None
+        self.loop.call_soon_threadsafe(self.bot.connections.send_data, data, priority, channel)
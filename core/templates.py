@@ -0,0 +1,82 @@
+from string import Formatter
+from typing import Any, List, Tuple, Union
+
+# Same helper str.format uses to split "message.text_args[0]"
+from _string import formatter_field_name_split  # type: ignore
+
+from .objects import Message
+
+
+class TemplateError(Exception):
+    pass
+
+
+class TemplateField:
+    """
+    A replacement field of a template, with its lookups resolved ahead of time
+    """
+    __slots__ = ('lookups', 'conversion', 'format_spec')
+
+    def __init__(self, lookups: List[Tuple[bool, Union[int, str]]], conversion: str, format_spec: str) -> None:
+        self.lookups = lookups
+        self.conversion = conversion
+        self.format_spec = format_spec
+
+    def render(self, message: Message) -> str:
+        value: Any = message
+        for is_attribute, key in self.lookups:
+            value = getattr(value, key) if is_attribute else value[key]  # type: ignore
+        if self.conversion == 'r':
+            value = repr(value)
+        elif self.conversion == 'a':
+            value = ascii(value)
+        elif self.conversion == 's':
+            value = str(value)
+        return format(value, self.format_spec)
+
+
+class CompiledTemplate:
+    """
+    Template command compiled once into constant parts, already encoded
+    to bytes, and fields that are filled from the message.
+    Rendering gives the same text as template.format(message=message).
+    """
+    __slots__ = ('source', 'parts')
+
+    def __init__(self, source: str) -> None:
+        self.source = source
+        self.parts: List[Union[bytes, TemplateField]] = []
+        try:
+            parsed = list(Formatter().parse(source))
+        except ValueError as e:
+            raise TemplateError(str(e))
+        for literal, field_name, format_spec, conversion in parsed:
+            if literal:
+                self.parts.append(literal.encode('utf-8'))
+            if field_name is not None:
+                self.parts.append(self.compile_field(field_name, format_spec or '', conversion or ''))
+
+    def compile_field(self, field_name: str, format_spec: str, conversion: str) -> TemplateField:
+        first, rest = formatter_field_name_split(field_name)
+        if first != 'message':
+            raise TemplateError(f'Unknown field {{{field_name}}}, only {{message...}} is supported')
+        try:
+            lookups = list(rest)
+        except ValueError as e:
+            raise TemplateError(str(e))
+        if lookups and lookups[0][0] and not hasattr(Message, lookups[0][1]):
+            raise TemplateError(f'Message has no attribute {lookups[0][1]}')
+        if '{' in format_spec:
+            raise TemplateError('Nested fields are not supported')
+        if conversion not in ('', 'r', 's', 'a'):
+            raise TemplateError(f'Unknown conversion !{conversion}')
+        return TemplateField(lookups, conversion, format_spec)
+
+    def render(self, message: Message) -> bytes:
+        """
+        Raises IndexError when the message is missing an argument
+        """
+        return b''.join(
+            part if type(part) is bytes else part.render(message).encode('utf-8')  # type: ignore
+            for part in self.parts
+        )
@@ -0,0 +1,31 @@
+import dataclasses
+
+
+def add_slots(cls: type) -> type:
+    """
+    Rebuild a dataclass with __slots__ for smaller and faster instances.
+    Same as dataclass(slots=True), which is only available from Python 3.10.
+    """
+    field_names = tuple(field.name for field in dataclasses.fields(cls))
+    cls_dict = dict(cls.__dict__)
+    cls_dict['__slots__'] = field_names
+    for name in field_names:
+        # Defaults are already stored in the generated __init__
+        cls_dict.pop(name, None)
+    cls_dict.pop('__dict__', None)
+    cls_dict.pop('__weakref__', None)
+    return type(cls)(cls.__name__, cls.__bases__, cls_dict)
+
+
+def format_duration(seconds: float) -> str:
+    """
+    Short human readable duration, e.g. 2h 5m or 40s
+    """
+    seconds = int(seconds)
+    units = ((86400, 'd'), (3600, 'h'), (60, 'm'), (1, 's'))
+    for (size, unit), (next_size, next_unit) in zip(units, units[1:]):
+        if seconds >= size:
+            text = f'{seconds // size}{unit}'
+            remainder = seconds % size // next_size
+            return f'{text} {remainder}{next_unit}' if remainder else text
+    return f'{seconds}s'
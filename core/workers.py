@@ -0,0 +1,96 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+
+@dataclass(frozen=True)
+class IOBound:
+    """
+    Options of a command handler that runs on the worker pool
+    """
+    max_concurrency: int = 2
+    timeout: float = 5.0
+    # Reply sent when the handler times out
+    fallback: Optional[str] = None
+
+
+class WorkerJob:
+    __slots__ = ('name', 'timed_out')
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.timed_out = False
+
+
+job_local = threading.local()
+
+
+def current_job() -> Optional[WorkerJob]:
+    """
+    Returns the job run by the current worker thread, if any
+    """
+    return getattr(job_local, 'job', None)
+
+
+class WorkerPool:
+    """
+    Bounded thread pool for blocking command handlers, so the event loop
+    only does non-blocking work. Each handler has its own concurrency cap
+    and timeout.
+    """
+
+    def __init__(self, max_workers: int = 8) -> None:
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix='command-worker')
+        self.semaphores: Dict[str, asyncio.Semaphore] = {}
+        self.completed = 0
+        self.timeouts = 0
+
+    async def run(
+        self,
+        name: str,
+        func: Callable,
+        args: tuple,
+        options: IOBound,
+        on_timeout: Callable[[], Any],
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + options.timeout
+        semaphore = self.semaphores.get(name)
+        if semaphore is None:
+            semaphore = self.semaphores[name] = asyncio.Semaphore(options.max_concurrency)
+        try:
+            await asyncio.wait_for(semaphore.acquire(), options.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            on_timeout()
+            return
+
+        job = WorkerJob(name)
+        future = loop.run_in_executor(self.executor, functools.partial(self.call, job, func, *args))
+        # Threads can't be interrupted, the slot is only freed once the handler returns
+        future.add_done_callback(lambda _: semaphore.release())  # type: ignore
+        try:
+            await asyncio.wait_for(asyncio.shield(future), max(deadline - loop.time(), 0))
+        except asyncio.TimeoutError:
+            job.timed_out = True
+            self.timeouts += 1
+            on_timeout()
+            return
+        self.completed += 1
+
+    @staticmethod
+    def call(job: WorkerJob, func: Callable, *args: Any) -> Any:
+        job_local.job = job
+        try:
+            return func(*args)
+        finally:
+            job_local.job = None
+
+    def stats(self) -> Dict[str, int]:
+        return {'completed': self.completed, 'timeouts': self.timeouts}
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False)
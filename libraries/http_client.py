@@ -0,0 +1,135 @@
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError
+from urllib3.util.retry import Retry
+
+from core.metrics import http_errors_total, http_seconds
+
+
+# Status codes worth retrying
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Only requests that can safely be sent twice are retried, e.g. POSTing an
+# authorization code twice would fail the second time
+RETRY_METHODS = frozenset(['GET'])
+
+
+class CappedRetry(Retry):
+    """
+    Retry policy that waits as long as a Retry-After header asks, but gives
+    up and returns the response when that's longer than `max_retry_after`
+    seconds, so a request never waits much longer than its timeout
+    """
+
+    def __init__(self, *args: Any, max_retry_after: float = 2.0, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.max_retry_after = max_retry_after
+
+    def new(self, **kwargs: Any) -> 'CappedRetry':
+        retry = super().new(**kwargs)
+        retry.max_retry_after = self.max_retry_after
+        return retry
+
+    def increment(self, method: Optional[str] = None, url: Optional[str] = None, *args: Any, **kwargs: Any) -> Retry:
+        response = kwargs.get('response')
+        if response is not None and self.respect_retry_after_header:
+            retry_after = self.get_retry_after(response)
+            if retry_after is not None and retry_after > self.max_retry_after:
+                raise MaxRetryError(kwargs.get('_pool'), url, None)
+        return super().increment(method, url, *args, **kwargs)
+
+
+class EndpointStats:
+    __slots__ = ('count', 'errors', 'total', 'max')
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+
+
+class HTTPClient:
+    """
+    Shared HTTP client keeping connections alive in a pool.
+    Requests are named by endpoint, which selects their timeout
+    and groups their latency stats.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = 4,
+        retries: int = 2,
+        backoff: float = 0.2,
+        max_retry_after: float = 2.0,
+        timeouts: Optional[Dict[str, float]] = None,
+        default_timeout: float = 5,
+    ) -> None:
+        self.timeouts = timeouts or {}
+        self.default_timeout = default_timeout
+        retry = CappedRetry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=RETRY_METHODS,
+            raise_on_status=False,
+            max_retry_after=max_retry_after,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.endpoint_stats: Dict[str, EndpointStats] = {}
+        self.lock = threading.Lock()
+
+    def request(self, endpoint: str, method: str, url: str, **kwargs: Any) -> requests.Response:
+        kwargs.setdefault('timeout', self.timeouts.get(endpoint, self.default_timeout))
+        start = time.perf_counter()
+        failed = False
+        try:
+            return self.session.request(method, url, **kwargs)
+        except requests.RequestException:
+            failed = True
+            raise
+        finally:
+            self.record(endpoint, time.perf_counter() - start, failed)
+
+    def get(self, endpoint: str, url: str, **kwargs: Any) -> requests.Response:
+        return self.request(endpoint, 'GET', url, **kwargs)
+
+    def post(self, endpoint: str, url: str, **kwargs: Any) -> requests.Response:
+        return self.request(endpoint, 'POST', url, **kwargs)
+
+    def record(self, endpoint: str, latency: float, failed: bool) -> None:
+        http_seconds.observe(latency, endpoint)
+        if failed:
+            http_errors_total.inc(endpoint)
+        with self.lock:
+            stats = self.endpoint_stats.get(endpoint)
+            if stats is None:
+                stats = self.endpoint_stats[endpoint] = EndpointStats()
+            stats.count += 1
+            stats.errors += failed
+            stats.total += latency
+            stats.max = max(stats.max, latency)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        Returns request count, error count, average and max latency per endpoint
+        """
+        with self.lock:
+            return {
+                endpoint: {
+                    'count': stats.count,
+                    'errors': stats.errors,
+                    'average': stats.total / stats.count,
+                    'max': stats.max,
+                }
+                for endpoint, stats in self.endpoint_stats.items()
+            }
+
+    def close(self) -> None:
+        self.session.close()
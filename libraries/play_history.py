@@ -0,0 +1,140 @@
+import bisect
+import logging
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Callable, List, Optional, Tuple
+
+from core.objects import Play
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS plays (
+    played_at INTEGER PRIMARY KEY,
+    track_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    artists TEXT NOT NULL,
+    track_url TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cursor (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    after INTEGER NOT NULL
+);
+'''
+
+# Returns the plays after a cursor and the next cursor, None if the request failed
+FetchPlays = Callable[[int], Optional[Tuple[List[Play], int]]]
+
+
+class PlayHistory:
+    """
+    Local copy of the Spotify recently played history, kept in SQLite and
+    in memory, bounded to the last `max_entries` plays. A sync only fetches
+    the plays newer than the stored cursor, queries never call Spotify.
+    """
+
+    def __init__(self, filename: str, fetch: FetchPlays, max_entries: int = 5000) -> None:
+        self.filename = filename
+        self.fetch = fetch
+        self.max_entries = max_entries
+        self.connection: Optional[sqlite3.Connection] = None
+        # Oldest first
+        self.plays: List[Play] = []
+        self.times: List[int] = []
+        self.cursor = 0
+        self.synced_at = 0.0
+        self.lock = threading.Lock()
+        # Held for a whole sync, so only one request to Spotify is in flight
+        self.sync_lock = threading.Lock()
+
+    def open(self) -> None:
+        if self.connection is not None:
+            return
+        connection = sqlite3.connect(self.filename, timeout=10, check_same_thread=False)
+        connection.execute('PRAGMA journal_mode=WAL')
+        with connection:
+            connection.executescript(SCHEMA)
+        rows = connection.execute(
+            'SELECT track_id, name, artists, track_url, played_at FROM plays ORDER BY played_at DESC LIMIT ?',
+            (self.max_entries,),
+        ).fetchall()
+        self.plays = [Play(*row) for row in reversed(rows)]
+        self.times = [play.played_at for play in self.plays]
+        row = connection.execute('SELECT after FROM cursor').fetchone()
+        self.cursor = row[0] if row else 0
+        self.connection = connection
+
+    def sync(self) -> int:
+        """
+        Fetch and store the plays newer than the cursor, returns how many were new
+        """
+        # Queries only wait for the lock while new plays are stored, not for Spotify
+        with self.sync_lock:
+            with self.lock:
+                self.open()
+                cursor = self.cursor
+            result = self.fetch(cursor)
+            with self.lock:
+                # Failed syncs also count, so a Spotify outage isn't retried on every query
+                self.synced_at = time.monotonic()
+                if result is None or self.connection is None:
+                    return 0
+                return self.store(*result)
+
+    def store(self, plays: List[Play], cursor: int) -> int:
+        assert self.connection is not None
+        plays = [play for play in plays if not self.times or play.played_at > self.times[-1]]
+        try:
+            with self.connection:
+                self.connection.executemany(
+                    'INSERT OR IGNORE INTO plays (track_id, name, artists, track_url, played_at) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    [(play.track_id, play.name, play.artists, play.track_url, play.played_at) for play in plays],
+                )
+                self.connection.execute('INSERT OR REPLACE INTO cursor (id, after) VALUES (0, ?)', (cursor,))
+                self.connection.execute(
+                    'DELETE FROM plays WHERE played_at NOT IN '
+                    '(SELECT played_at FROM plays ORDER BY played_at DESC LIMIT ?)',
+                    (self.max_entries,),
+                )
+        except sqlite3.Error as e:
+            logging.error(f'Could not store the play history in {self.filename}: {e}')
+            return 0
+        self.cursor = cursor
+        self.plays.extend(plays)
+        self.times.extend(play.played_at for play in plays)
+        excess = len(self.plays) - self.max_entries
+        if excess > 0:
+            del self.plays[:excess]
+            del self.times[:excess]
+        return len(plays)
+
+    def sync_if_older(self, seconds: float) -> None:
+        if not self.synced_at or time.monotonic() - self.synced_at > seconds:
+            self.sync()
+
+    def recent(self, count: int) -> List[Play]:
+        """
+        The last plays, newest first
+        """
+        with self.lock:
+            return self.plays[:-count - 1:-1] if count > 0 else []
+
+    def since(self, timestamp: float) -> List[Play]:
+        """
+        Plays since a unix time, oldest first
+        """
+        with self.lock:
+            return self.plays[bisect.bisect_left(self.times, int(timestamp * 1000)):]
+
+    def play_counts(self, timestamp: float) -> Counter:
+        """
+        How often each track id was played since a unix time
+        """
+        return Counter(play.track_id for play in self.since(timestamp))
+
+    def close(self) -> None:
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
@@ -0,0 +1,123 @@
+import logging
+import threading
+import time
+from typing import Callable, List, Optional
+
+from core.objects import Song
+
+
+class PlaybackPoller:
+    """
+    Keeps the currently playing song in memory, polled by a background thread.
+    The next poll is scheduled from the time left on the track: at most every
+    `interval` seconds while a song plays, right after it should end once it's
+    close to its end, and backing off from `idle_min` to `idle_max` seconds
+    while nothing plays. Listeners are called from the polling thread with
+    each new song, poll listeners after every poll. A poller that is never
+    started can be kept up to date with update(), e.g. in worker processes.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[], Optional[Song]],
+        interval: float = 30.0,
+        idle_min: float = 5.0,
+        idle_max: float = 60.0,
+        end_window: float = 10.0,
+        end_margin: float = 0.5,
+        min_interval: float = 1.0,
+    ) -> None:
+        self.fetch = fetch
+        self.interval = interval
+        self.idle_min = idle_min
+        self.idle_max = idle_max
+        self.end_window = end_window
+        self.end_margin = end_margin
+        self.min_interval = min_interval
+        self.idle_delay = idle_min
+        self.song: Optional[Song] = None
+        # Whether the last poll worked, otherwise callers should fetch the song themselves
+        self.ok = False
+        self.updated_at: Optional[float] = None
+        self.polls = 0
+        self.changes = 0
+        self.listeners: List[Callable[[Song], None]] = []
+        self.poll_listeners: List[Callable[[], None]] = []
+        self.stopped = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self.thread is not None:
+            return
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, name='playback-poller', daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop polling, a request in flight is not waited for
+        """
+        self.stopped.set()
+        self.thread = None
+
+    def run(self) -> None:
+        delay = 0.0
+        while not self.stopped.wait(delay):
+            delay = self.poll()
+
+    def poll(self) -> float:
+        """
+        Fetch the current song and return the seconds until the next poll
+        """
+        try:
+            return self.poll_song()
+        finally:
+            for listener in self.poll_listeners:
+                try:
+                    listener()
+                except Exception:
+                    logging.exception('Error in poll listener')
+
+    def poll_song(self) -> float:
+        self.polls += 1
+        try:
+            song = self.fetch()
+        except Exception as e:
+            if self.ok or self.updated_at is None:
+                logging.warning('Could not poll the currently playing song: %s', e)
+            self.ok = False
+            return self.idle()
+        previous, first = self.song, self.updated_at is None
+        self.song = song
+        self.ok = True
+        self.updated_at = time.time()
+        # The song playing at startup is not announced
+        if song is not None and song.is_playing and not first and (previous is None or previous.id != song.id):
+            self.changes += 1
+            for listener in self.listeners:
+                try:
+                    listener(song)
+                except Exception:
+                    logging.exception('Error in song change listener')
+        return self.next_delay(song)
+
+    def update(self, song: Optional[Song], ok: bool, updated_at: Optional[float]) -> None:
+        """
+        Take the result of another poller's last poll
+        """
+        self.song, self.ok, self.updated_at = song, ok, updated_at
+
+    def next_delay(self, song: Optional[Song]) -> float:
+        if song is None or not song.is_playing:
+            return self.idle()
+        self.idle_delay = self.idle_min
+        remaining = max(song.duration - song.progress, 0) / 1000
+        if remaining > self.end_window:
+            # Polling regularly still notices skips and pauses
+            return min(remaining - self.end_window, self.interval)
+        return max(remaining + self.end_margin, self.min_interval)
+
+    def idle(self) -> float:
+        delay = self.idle_delay
+        self.idle_delay = min(self.idle_delay * 2, self.idle_max)
+        return delay
@@ -1,17 +1,145 @@
 import json
 import logging
 import requests
+import threading
+import time
 from base64 import b64encode
-from datetime import datetime, timedelta
-from typing import Any, Dict, Optional
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
 from urllib.parse import urlencode, urljoin
 
-from config import SPOTIFY_CLIENT_ID, SPOTIFY_CLIENT_SECRET, SPOTIFY_REDIRECT_URI
-from core.objects import Song
+from config import (
+    SPOTIFY_BACKOFF, SPOTIFY_CLIENT_ID, SPOTIFY_CLIENT_SECRET, SPOTIFY_POOL_SIZE, SPOTIFY_REDIRECT_URI,
+    SPOTIFY_RETRIES,
+)
+from core.objects import Play, Song
+from libraries.http_client import HTTPClient
 
 
 BASE_URL = 'https://api.spotify.com/v1/me/'
 TOKEN_URL = 'https://accounts.spotify.com/api/token'
+TOKEN_FILENAME = 'spotify.json'
+# Refresh the access token this many seconds before it expires
+TOKEN_REFRESH_MARGIN = 60
+TOKEN_RETRY_DELAY = 5
+# Request timeout in seconds per endpoint
+TIMEOUTS = {
+    'authorization_token': 10,
+    'refresh_token': 5,
+    'currently_playing': 2,
+    'recently_played': 5,
+}
+# Most items per page of the recently played endpoint
+RECENTLY_PLAYED_LIMIT = 50
+
+
+class SpotifyError(Exception):
+    """
+    Spotify could not be reached or answered with an error
+    """
+
+
+client = HTTPClient(
+    pool_size=SPOTIFY_POOL_SIZE,
+    retries=SPOTIFY_RETRIES,
+    backoff=SPOTIFY_BACKOFF,
+    timeouts=TIMEOUTS,
+)
+
+
+class TokenManager:
+    """
+    Keeps the access token in memory, loaded once from spotify.json,
+    and refreshes it in the background shortly before it expires.
+    Callers that need a refresh at the same time share a single request.
+    """
+
+    def __init__(self, filename: str = TOKEN_FILENAME, refresh_margin: float = TOKEN_REFRESH_MARGIN) -> None:
+        self.filename = filename
+        self.refresh_margin = refresh_margin
+        self.token: Dict[str, Any] = {}
+        self.headers: Dict[str, Any] = {}
+        self.lock = threading.Lock()
+        # Set while a refresh is in flight, other callers wait on it
+        self.refreshing: Optional[threading.Event] = None
+        self.timer: Optional[threading.Timer] = None
+
+    def load(self) -> None:
+        try:
+            with open(self.filename, 'r') as f:
+                token = json.load(f)
+        except (json.JSONDecodeError, FileNotFoundError):
+            raise Exception('Spotify access token has not been configured properly.')
+        self.set_token(token)
+
+    def set_token(self, token: Dict[str, Any]) -> None:
+        with self.lock:
+            self.token = token
+            self.headers = {
+                'Authorization': f'{token.get("token_type")} {token.get("access_token")}',
+                'Content-Type': 'application/json'
+            }
+        self.schedule_refresh()
+
+    def is_valid(self) -> bool:
+        return self.token.get('expires_at', 0) > time.time()
+
+    def get_token(self) -> Dict[str, Any]:
+        if not self.token:
+            self.load()
+        if not self.is_valid():
+            self.refresh()
+        return self.token
+
+    def get_headers(self) -> Dict[str, Any]:
+        self.get_token()
+        return self.headers
+
+    def refresh(self) -> None:
+        with self.lock:
+            waiting_for = self.refreshing
+            if waiting_for is None:
+                self.refreshing = threading.Event()
+        if waiting_for is not None:
+            waiting_for.wait(timeout=10)
+            return
+        try:
+            token = refresh_access_token(self.token['refresh_token'])
+            if token:
+                self.set_token(token)
+                self.save(token)
+            else:
+                # The account may have been authorized again in the meantime
+                self.load()
+        finally:
+            with self.lock:
+                assert self.refreshing is not None
+                self.refreshing.set()
+                self.refreshing = None
+
+    def schedule_refresh(self) -> None:
+        if self.timer is not None:
+            self.timer.cancel()
+        if not self.is_valid():
+            # Expired tokens are refreshed by the next caller
+            return
+        delay = self.token['expires_at'] - self.refresh_margin - time.time()
+        # Don't retry a failing refresh in a tight loop
+        self.timer = threading.Timer(max(delay, TOKEN_RETRY_DELAY), self.refresh)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def save(self, token: Dict[str, Any]) -> None:
+        """
+        Persist the token without blocking the caller
+        """
+        def write() -> None:
+            with open(self.filename, 'w') as f:
+                json.dump(token, f)
+        threading.Thread(target=write, name='spotify-token-writer', daemon=True).start()
+
+
+token_manager = TokenManager()
 
 
 def get_authorization_url() -> str:
@@ -40,12 +168,7 @@ def get_json_headers() -> Dict[str, Any]:
     """
     Get the headers required to make a request to Spotify's API
     """
-    token = get_access_token()
-    headers = {
-        'Authorization': f'{token["token_type"]} {token["access_token"]}',
-        'Content-Type': 'application/json'
-    }
-    return headers
+    return token_manager.get_headers()
 
 
 def get_form_headers() -> Dict[str, Any]:
@@ -74,13 +197,12 @@ def get_authorization_access_token(code: str) -> Dict[str, Any]:
         'redirect_uri': SPOTIFY_REDIRECT_URI,
     }
     try:
-        # 10 seconds timeout
-        response = requests.post(TOKEN_URL, headers=headers, data=data, timeout=10)
+        response = client.post('authorization_token', TOKEN_URL, headers=headers, data=data)
         response.raise_for_status()
         data = response.json()
         data['expires_at'] = (now + timedelta(seconds=data['expires_in'])).timestamp()
         # Write access token to file
-        with open('spotify.json', 'w') as f:
+        with open(TOKEN_FILENAME, 'w') as f:
             json.dump(data, f)
         return data
     except requests.RequestException as e:
@@ -88,22 +210,14 @@ def get_authorization_access_token(code: str) -> Dict[str, Any]:
         return {}
 
 
-def get_access_token() -> str:
-    now = datetime.now()
-    try:
-        with open('spotify.json', 'r') as f:
-            access_token: Dict = json.load(f)
-            expires_at = datetime.fromtimestamp(access_token.get('expires_at', 0))
-            # Check if access token is still valid
-            if expires_at > now:
-                return access_token
-    except (json.JSONDecodeError, FileNotFoundError):
-        raise Exception('Spotify access token has not been configured properly.')
-    # Refresh token if expired
-    return refresh_access_token(access_token['refresh_token'])
-
-
-def refresh_access_token(refresh_token: str) -> str:
+def get_access_token() -> Dict[str, Any]:
+    return token_manager.get_token()
+
+
+def refresh_access_token(refresh_token: str) -> Dict[str, Any]:
+    """
+    Request a new access token, saving it is left to the caller
+    """
     now = datetime.now()
     headers = get_form_headers()
     data = {
@@ -111,14 +225,11 @@ def refresh_access_token(refresh_token: str) -> str:
         'refresh_token': refresh_token,
     }
     try:
-        response = requests.post(TOKEN_URL, headers=headers, data=data, timeout=5)
+        response = client.post('refresh_token', TOKEN_URL, headers=headers, data=data)
         response.raise_for_status()
         data = response.json()
         data['expires_at'] = (now + timedelta(seconds=data['expires_in'])).timestamp()
         data['refresh_token'] = refresh_token
-        # Update access token
-        with open('spotify.json', 'w') as f:
-            json.dump(data, f)
         return data
     except requests.RequestException as e:
         logging.error(f'Error while refreshing access token: {e}')
@@ -126,19 +237,27 @@ def refresh_access_token(refresh_token: str) -> str:
 
 
 def get_currently_playing() -> Optional[Song]:
+    """
+    Returns None when nothing is playing, raises SpotifyError when that can't be told
+    """
     url = urljoin(BASE_URL, 'player/currently-playing')
     headers = get_json_headers()
     try:
-        response = requests.get(url, headers=headers, timeout=2)
-        # No currently playing song
-        if response.status_code != 200:
-            return None
+        response = client.get('currently_playing', url, headers=headers)
     except requests.RequestException as e:
-        logging.error(f'Error while getting currently playing song: {e}')
+        raise SpotifyError(f'Error while getting currently playing song: {e}') from e
+    # No currently playing song
+    if response.status_code == 204:
         return None
+    if response.status_code != 200:
+        raise SpotifyError(f'Spotify answered {response.status_code} to the currently playing song request')
     data = response.json()
-    context = data['context']
     item = data['item']
+    # Ads and some podcasts have no track
+    if item is None:
+        return None
+    # Songs played from the library have no context
+    context = data['context'] or {'type': '', 'external_urls': {'spotify': ''}}
     return Song(
         id=item['id'],
         name=item['name'],
@@ -148,4 +267,53 @@ def get_currently_playing() -> Optional[Song]:
         is_playing=data['is_playing'],
         context_type=context['type'],
         context_url=context['external_urls']['spotify'],
+        progress=data.get('progress_ms') or 0,
     )
+
+
+def parse_played_at(played_at: str) -> int:
+    """
+    Unix time in milliseconds of a UTC timestamp like 2016-12-13T20:44:04.589Z
+    """
+    text = played_at.rstrip('Z')
+    format = '%Y-%m-%dT%H:%M:%S.%f' if '.' in text else '%Y-%m-%dT%H:%M:%S'
+    timestamp = datetime.strptime(text, format).replace(tzinfo=timezone.utc)
+    return int(timestamp.timestamp() * 1000)
+
+
+def get_recently_played(after: int = 0) -> Optional[Tuple[List[Play], int]]:
+    """
+    Tracks played after the cursor (unix time in milliseconds), oldest first,
+    and the cursor to continue from. Spotify only keeps the last 50 plays.
+    None if the request failed.
+    """
+    url = urljoin(BASE_URL, 'player/recently-played')
+    plays: List[Play] = []
+    cursor = after
+    while True:
+        params = {'limit': RECENTLY_PLAYED_LIMIT, 'after': cursor}
+        try:
+            response = client.get('recently_played', url, headers=get_json_headers(), params=params)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            logging.error(f'Error while getting recently played tracks: {e}')
+            return None
+        data = response.json()
+        page = [
+            Play(
+                track_id=item['track']['id'],
+                name=item['track']['name'],
+                artists=', '.join(artist['name'] for artist in item['track']['artists']),
+                track_url=item['track']['external_urls']['spotify'],
+                played_at=parse_played_at(item['played_at']),
+            )
+            for item in data['items']
+            if item.get('track')
+        ]
+        plays.extend(page)
+        # Pages go forward in time from the cursor
+        next_cursor = int((data.get('cursors') or {}).get('after') or cursor)
+        if not data.get('next') or next_cursor <= cursor:
+            plays.sort(key=lambda play: play.played_at)
+            return plays, next_cursor
+        cursor = next_cursor
@@ -1,41 +1,173 @@
-import json
+import asyncio
 import logging
-import socket
-import ssl
-from typing import Any, Dict, Optional, Tuple, Union
+import signal
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
 
-from config import TWITCH_OAUTH_TOKEN, TWITCH_USERNAME, TWITCH_CHANNELS
-from core.decorators import require_mod
+from config import (
+    COMMAND_CACHE_SIZE, COMMAND_STORE_BATCH_INTERVAL, COMMAND_STORE_FILENAME, COMMAND_WORKERS,
+    COOLDOWN_MAX_ENTRIES, EMOTE_STATS_HALF_LIFE, EMOTE_STATS_METRICS_TOP, EMOTE_STATS_SIZE,
+    HISTORY_CHANNEL_MESSAGES, HISTORY_MESSAGES, IRC_CHANNELS_PER_CONNECTION, IRC_MAX_LINE_LENGTH,
+    IRC_RECONNECT_BACKOFF, IRC_RECV_SIZE, IRC_WRITE_DELAY, LOG_CHAT_SAMPLE_RATE, LOG_QUEUE_SIZE,
+    METRICS_HOST, METRICS_PORT, MODERATION_WARNING, MODERATION_WARNING_COOLDOWN,
+    OUTBOUND_BACKLOG_SIZE, OUTBOUND_QUEUE_SIZE, RATE_LIMIT_CHANNEL, RATE_LIMIT_JOIN,
+    RATE_LIMIT_PRIVMSG, RATE_LIMIT_PRIVMSG_MOD, SPOTIFY_ANNOUNCE_CHANNELS, SPOTIFY_HISTORY_FILENAME,
+    SPOTIFY_HISTORY_SIZE, SPOTIFY_HISTORY_SYNC_INTERVAL, SPOTIFY_POLL_IDLE, SPOTIFY_POLL_INTERVAL,
+    TEMPLATE_COMMAND_COOLDOWNS, TWITCH_CHANNELS, TWITCH_OAUTH_TOKEN, TWITCH_USERNAME,
+    WORKER_PROCESSES,
+)
+from core import logs
+from core.commands import ChannelCommands, CommandEntry, CommandRegistry, Cooldowns
+from core.connection import IRCConnection
+from core.decorators import io_bound, require_mod
+from core.emotes import EmoteStats
+from core.history import ChatHistory
+from core.journal import StateJournal, apply_entry
+from core.logs import Decoded, chat_logger
+from core.metrics import (
+    MetricsServer, command_seconds, commands_total, moderation_matches_total, registry, stage_seconds,
+)
+from core.moderation import ModerationFilter, normalize
 from core.parser import parse
-from core.objects import Message, Song
-from libraries.spotify import get_currently_playing
+from core.pool import Backoff, ConnectionPool
+from core.prefilter import LineFilter, find_tag, split_privmsg
+from core.scheduler import (
+    PRIORITY_ANNOUNCEMENT, PRIORITY_CONTROL, PRIORITY_REPLY, RateLimiter,
+)
+from core.store import CommandStore
+from core.templates import CompiledTemplate, TemplateError
+from core.objects import Message, Play, Song, UserInfo
+from core.utils import format_duration
+from core.workers import IOBound, WorkerPool, current_job
+from libraries.play_history import PlayHistory
+from libraries.playback import PlaybackPoller
 
 
 class Bot:
     def __init__(self) -> None:
         self.irc_server = 'irc.chat.twitch.tv'
         self.irc_port = 6697
+        self.irc_use_tls = True
         self.oauth_token = TWITCH_OAUTH_TOKEN
         self.username = TWITCH_USERNAME
         self.channels = TWITCH_CHANNELS
         self.command_prefix = '!'
+        self.line_filter = LineFilter(self.command_prefix)
+        self.line_filter.subscribe('USERSTATE')
+        self.rate_limiter = RateLimiter(
+            privmsg=RATE_LIMIT_PRIVMSG,
+            privmsg_mod=RATE_LIMIT_PRIVMSG_MOD,
+            channel=RATE_LIMIT_CHANNEL,
+            join=RATE_LIMIT_JOIN,
+        )
         self.state: Dict[str, Any] = {}
         self.state_filename = 'state.json'
+        self.journal = StateJournal(self.state_filename)
+        self.connections: Optional[ConnectionPool] = None
+        self.reconnect_backoff = Backoff(*IRC_RECONNECT_BACKOFF)
+        self.pending_handlers: Set[asyncio.Future] = set()
+        self.workers = WorkerPool(COMMAND_WORKERS)
+        # The template commands of state.json are copied to channels without commands of their own
         self.state_schema: Dict[str, Any] = {
             'template_commands': {},
+            # Banned phrases by channel, {channel: {phrase: True}}
+            'banned_phrases': {},
         }
-        self.custom_commands = {
-            'cmds': self.list_commands,
-            'addcmd': self.add_template_command,
-            'editcmd': self.edit_template_command,
-            'delcmd': self.delete_template_command,
-            'song': (self.get_spotify_currently_playing, 'song'),
-            'playlist': (self.get_spotify_currently_playing, 'context'),
-        }
+        self.command_store = CommandStore(COMMAND_STORE_FILENAME, batch_interval=COMMAND_STORE_BATCH_INTERVAL)
+        self.template_commands = ChannelCommands(self.load_template_commands, COMMAND_CACHE_SIZE)
+        self.template_cooldowns = TEMPLATE_COMMAND_COOLDOWNS
+        self.commands = CommandRegistry(max_cooldowns=COOLDOWN_MAX_ENTRIES)
+        self.commands.register('cmds', self.list_commands, aliases=('commands',), cooldown=(30, 5, 0))
+        self.commands.register('addcmd', self.add_template_command)
+        self.commands.register('editcmd', self.edit_template_command)
+        self.commands.register('delcmd', self.delete_template_command)
+        self.commands.register('addphrase', self.add_banned_phrase)
+        self.commands.register('delphrase', self.delete_banned_phrase)
+        self.commands.register('phrases', self.count_banned_phrases, cooldown=(30, 5, 0))
+        self.commands.register('song', self.get_spotify_currently_playing, 'song', cooldown=(15, 5, 0))
+        self.commands.register('playlist', self.get_spotify_currently_playing, 'context', cooldown=(15, 5, 0))
+        self.commands.register('history', self.show_play_history, cooldown=(15, 5, 0))
+        self.commands.register('playcount', self.show_play_count, cooldown=(15, 5, 0))
+        self.commands.register('lastseen', self.last_seen, cooldown=(10, 3, 0))
+        self.commands.register('topchatters', self.top_chatters, cooldown=(30, 10, 0))
+        self.commands.register('topemotes', self.top_emotes, cooldown=(30, 10, 0))
+        self.history = ChatHistory(HISTORY_MESSAGES, HISTORY_CHANNEL_MESSAGES)
+        self.emote_stats = EmoteStats(EMOTE_STATS_HALF_LIFE, EMOTE_STATS_SIZE)
+        self.emote_metrics_top = EMOTE_STATS_METRICS_TOP
+        self.moderation = ModerationFilter()
+        # Sent when a message contains a banned phrase, empty to only log it
+        self.moderation_warning = MODERATION_WARNING
+        self.moderation_warning_cooldown = MODERATION_WARNING_COOLDOWN
+        # Keyed by channel
+        self.moderation_warnings = Cooldowns()
+        # 0 disables polling, !song then asks Spotify each time
+        self.spotify_poll_interval = SPOTIFY_POLL_INTERVAL
+        self.playback = PlaybackPoller(
+            self.fetch_currently_playing, SPOTIFY_POLL_INTERVAL, *SPOTIFY_POLL_IDLE,
+        )
+        self.song_announcement_channels = SPOTIFY_ANNOUNCE_CHANNELS
+        self.play_history = PlayHistory(SPOTIFY_HISTORY_FILENAME, self.fetch_recently_played, SPOTIFY_HISTORY_SIZE)
+        # 0 disables the metrics listener
+        self.metrics_port = METRICS_PORT
+        self.metrics_server: Optional[MetricsServer] = None
+        self.register_metrics()
 
     def init(self) -> None:
-        self.read_state()
-        self.connect()
+        asyncio.run(self.start())
+
+    async def start(self) -> None:
+        # The state is read while the connections are opened, reading only starts once both are done
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(loop.run_in_executor(None, self.read_state), self.connect())
+        await self.preload_template_commands(self.channels)
+        await self.loop_for_messages()
+
+    def register_metrics(self) -> None:
+        """
+        Export the stats the bot already keeps alongside the stage timings
+        """
+        def connection_stat(key: str) -> Callable[[], float]:
+            return lambda: self.connections.stats()[key]  # type: ignore
+
+        registry.collect('xchrombot_lines_parsed_total', 'Lines that were fully parsed',
+                         lambda: self.line_filter.parsed, 'counter')
+        registry.collect('xchrombot_lines_skipped_total', 'Lines skipped by the prefilter',
+                         lambda: self.line_filter.skipped, 'counter')
+        registry.collect('xchrombot_commands_on_cooldown_total', 'Commands ignored because of a cooldown',
+                         lambda: self.commands.dropped, 'counter')
+        registry.collect('xchrombot_handler_timeouts_total', 'Worker pool handlers that timed out',
+                         lambda: self.workers.timeouts, 'counter')
+        registry.collect('xchrombot_log_records_dropped_total', 'Log records dropped because the queue was full',
+                         lambda: logs.stats()['dropped'], 'counter')
+        registry.collect('xchrombot_outbound_queue_depth', 'Lines waiting to be sent', connection_stat('queue_depth'))
+        registry.collect('xchrombot_outbound_sent_total', 'Lines sent', connection_stat('sent'), 'counter')
+        registry.collect('xchrombot_outbound_dropped_total', 'Outbound lines dropped because the queue was full',
+                         connection_stat('dropped'), 'counter')
+        registry.collect('xchrombot_connections', 'Open IRC connections', connection_stat('connections'))
+        registry.collect('xchrombot_reconnects_total', 'IRC connections that were reopened after dropping',
+                         connection_stat('reconnects'), 'counter')
+        registry.collect('xchrombot_emotes_total', 'Emote uses counted', lambda: self.emote_stats.emotes, 'counter')
+        registry.collect('xchrombot_emote_uses', 'Decayed use count of the most used emotes of each channel',
+                         self.emote_metrics, labels=('channel', 'emote'))
+        registry.collect('xchrombot_template_commands_cached', 'Template commands kept in memory',
+                         lambda: self.template_commands.size)
+        registry.collect('xchrombot_template_command_loads_total', 'Channels whose template commands were loaded',
+                         lambda: self.template_commands.loads, 'counter')
+        registry.collect('xchrombot_spotify_polls_total', 'Polls of the currently playing song',
+                         lambda: self.playback.polls, 'counter')
+        registry.collect('xchrombot_history_messages', 'Chat messages kept in the channel histories',
+                         lambda: self.history.stats()['messages'])
+
+    async def start_metrics_server(self) -> None:
+        if not self.metrics_port:
+            return
+        self.metrics_server = MetricsServer(METRICS_HOST, self.metrics_port)
+        try:
+            await self.metrics_server.start()
+        except OSError as e:
+            logging.warning(f'Could not serve metrics on port {self.metrics_port}: {e}')
+            self.metrics_server = None
 
     def ensure_state_schema(self) -> bool:
         """
@@ -52,101 +184,360 @@ class Bot:
         """
         Load states from file
         """
-        with open(self.state_filename, 'r') as file:
-            self.state = json.load(file)
+        self.state = self.journal.load()
+        self.journal.start()
         is_dirty = self.ensure_state_schema()
+        phrases = self.state['banned_phrases']
+        for channel in [channel for channel, value in phrases.items() if isinstance(value, list)]:
+            # Phrases used to be stored as one list per channel
+            phrases[channel] = dict.fromkeys(phrases[channel], True)
+            is_dirty = True
         if is_dirty:
             self.write_state()
+        self.command_store.defaults = self.state['template_commands']
+        self.command_store.open()
+        self.moderation.load(self.state['banned_phrases'])
+
+    def apply_state_entry(self, entry: Dict[str, Any]) -> None:
+        """
+        Apply a state change made by another worker process
+        """
+        apply_entry(self.state, entry)
+        if entry['path'][0] == 'banned_phrases' and len(entry['path']) >= 2:
+            channel = entry['path'][1]
+            self.moderation.set_phrases(channel, self.state['banned_phrases'].get(channel, {}))
+
+    def load_template_commands(self, channel: str) -> Dict[str, CommandEntry]:
+        """
+        Read and compile the template commands of a channel
+        """
+        commands = {}
+        for name, template in self.command_store.load(channel).items():
+            try:
+                commands[name] = self.template_command_entry(name, CompiledTemplate(template))
+            except TemplateError as e:
+                logging.warning('Template command %s of %s is invalid: %s', name, channel, e)
+        return commands
+
+    async def preload_template_commands(self, channels: List[str]) -> None:
+        """
+        Load the template commands of the joined channels on the executor,
+        so the first command of a channel doesn't query SQLite on the loop thread
+        """
+        loop = asyncio.get_running_loop()
+        loaded = await loop.run_in_executor(
+            None, lambda: {channel: self.load_template_commands(channel) for channel in channels},
+        )
+        for channel, commands in loaded.items():
+            self.template_commands.add(channel, commands)
+
+    def template_command_entry(self, name: str, template: CompiledTemplate) -> CommandEntry:
+        return CommandEntry(
+            name, self.handle_template_command, (template,), *self.template_cooldowns, is_template=True,
+        )
 
     def write_state(self) -> None:
         """
-        Update file with current state
+        Record the whole current state in the journal.
+        Single changes should use self.journal.set/delete instead.
         """
-        with open(self.state_filename, 'w') as file:
-            json.dump(self.state, file)
+        for key, value in self.state.items():
+            self.journal.set([key], value)
 
-    def send_privmsg(self, channel: str, message: str) -> None:
-        self.send_command(f'PRIVMSG #{channel} :{message}')
+    def send_privmsg(self, channel: str, message: str, priority: int = PRIORITY_REPLY) -> None:
+        self.send_command(f'PRIVMSG #{channel} :{message}', priority=priority, channel=channel)
 
-    def send_command(self, command: str) -> None:
+    def is_reply_dropped(self) -> bool:
+        """
+        Replies of a worker pool handler that already timed out are dropped
+        """
+        job = current_job()
+        if job is not None and job.timed_out:
+            logging.info('Dropping reply of timed out command %s', job.name)
+            return True
+        return False
+
+    def send_command(self, command: str, priority: int = PRIORITY_CONTROL, channel: Optional[str] = None) -> None:
+        if self.is_reply_dropped():
+            return
         if 'PASS' not in command:
-            logging.info(f'< {command}')
-        self.irc.send((command + '\r\n').encode('utf-8'))
+            logging.info('< %s', command)
+        assert self.connections is not None
+        start = time.perf_counter()
+        self.connections.send(command, priority=priority, channel=channel)
+        stage_seconds.observe(time.perf_counter() - start, 'send')
+
+    def send_encoded_privmsg(self, channel: str, text: bytes, priority: int = PRIORITY_REPLY) -> None:
+        if self.is_reply_dropped():
+            return
+        logging.info('< PRIVMSG #%s :%s', channel, Decoded(text))
+        assert self.connections is not None
+        start = time.perf_counter()
+        data = b'PRIVMSG #' + channel.encode('utf-8') + b' :' + text + b'\r\n'
+        self.connections.send_data(data, priority=priority, channel=channel)
+        stage_seconds.observe(time.perf_counter() - start, 'send')
 
-    def send_credentials(self) -> None:
-        self.send_command(f'PASS {self.oauth_token}')
-        self.send_command(f'NICK {self.username}')
-        self.send_command('CAP REQ :twitch.tv/tags')
+    def send_credentials(self, connection: IRCConnection) -> None:
+        connection.send(f'PASS {self.oauth_token}')
+        for command in (f'NICK {self.username}', 'CAP REQ :twitch.tv/tags'):
+            logging.info('< %s', command)
+            connection.send(command)
 
-    def connect(self) -> None:
+    async def connect(self, on_line: Optional[Callable[[str], None]] = None) -> None:
         """
-        Connect to twitch IRC server
+        Connect to twitch IRC server, spreading the channels over
+        as many connections as needed
         """
-        self.irc = ssl.wrap_socket(socket.socket())
-        self.irc.connect((self.irc_server, self.irc_port))
-        self.send_credentials()
+        await self.start_metrics_server()
+        self.connections = ConnectionPool(
+            self.irc_server,
+            self.irc_port,
+            on_line or self.handle_message,
+            self.send_credentials,
+            channels_per_connection=IRC_CHANNELS_PER_CONNECTION,
+            limiter=self.rate_limiter,
+            queue_size=OUTBOUND_QUEUE_SIZE,
+            backoff=self.reconnect_backoff,
+            backlog_size=OUTBOUND_BACKLOG_SIZE,
+            use_tls=self.irc_use_tls,
+            recv_size=IRC_RECV_SIZE,
+            max_line_length=IRC_MAX_LINE_LENGTH,
+            write_delay=IRC_WRITE_DELAY,
+        )
+        await self.connections.start(self.channels)
         for channel in self.channels:
-            self.send_command(f'JOIN #{channel}')
-            self.send_privmsg(channel, 'is here EleGiggle')
-        self.loop_for_messages()
+            self.send_privmsg(channel, 'is here EleGiggle', priority=PRIORITY_ANNOUNCEMENT)
 
-    def loop_for_messages(self) -> None:
+    async def loop_for_messages(self) -> None:
+        assert self.connections is not None
+        run_task = asyncio.ensure_future(self.connections.run())
+        self.add_signal_handlers(run_task.cancel)
+        self.start_playback_poller()
         try:
-            while True:
-                received_messages = self.irc.recv(2048).decode()
-                for message in received_messages.split('\r\n'):
-                    self.handle_message(message)
-        except KeyboardInterrupt:
+            await run_task
+        except asyncio.CancelledError:
             logging.info('Terminating bot...')
             for channel in self.channels:
-                logging.info(f'Leaving channel {channel}')
-                self.send_command(f'PART #{channel}')
-            self.irc.close()
+                logging.info('Leaving channel %s', channel)
+                self.send_command(f'PART #{channel}', channel=channel)
+            stats = self.line_filter.stats()
+            logging.info(f'Parsed {stats["parsed"]} lines, skipped {stats["skipped"]}')
+            stats = self.connections.stats()
+            logging.info(f'Sent {stats["sent"]} lines, dropped {stats["dropped"]}, '
+                         f'average wait {stats["average_wait"]:.3f}s, max wait {stats["max_wait"]:.3f}s')
+            stats = logs.stats()
+            logging.info(f'Log records dropped {stats["dropped"]}, chat lines sampled out {stats["sampled_out"]}')
+        finally:
+            self.playback.stop()
+            await self.connections.close()
+            if self.metrics_server is not None:
+                await self.metrics_server.close()
+            for task in list(self.pending_handlers):
+                task.cancel()
+            self.workers.shutdown()
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self.journal.close)
+            await loop.run_in_executor(None, self.command_store.close)
+            await loop.run_in_executor(None, self.play_history.close)
+            self.moderation.close()
+
+    def start_playback_poller(self) -> None:
+        if not self.spotify_poll_interval:
+            return
+        loop = asyncio.get_running_loop()
+        # Listeners run on the polling thread
+        self.playback.listeners.append(lambda song: loop.call_soon_threadsafe(self.announce_song, song))
+        # The previous song just ended, so it's in the recently played history now
+        self.playback.listeners.append(lambda song: self.play_history.sync())
+        self.playback.start()
 
-    def log_message(self, message: Message) -> None:
-        logging.info(f'> {message.user_name or "-"}@{message.channel}: {message.text}')
+    def add_signal_handlers(self, callback: Callable[[], Any]) -> None:
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, callback)
+            except (NotImplementedError, RuntimeError):
+                # Signal handlers are not supported on every platform
+                pass
+
+    def dispatch(self, func: Callable, message: Message, *args: Any) -> None:
+        """
+        Run a command handler without blocking the message loop.
+        Handlers marked with @io_bound run on the worker pool, coroutines
+        are scheduled on the loop and anything else is called directly.
+        State changes (e.g. !addcmd) must stay in handlers that are not
+        @io_bound, so only the loop thread ever mutates the state.
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop (e.g. called from a worker thread), run inline
+            self.run_handler(func, message, *args)
+            return
+        options: Optional[IOBound] = getattr(func, 'io_bound', None)
+        if options is not None:
+            coroutine = self.workers.run(
+                func.__name__,
+                self.run_handler,
+                (func, message, *args),
+                options,
+                lambda: self.on_handler_timeout(message, options),  # type: ignore
+            )
+        elif asyncio.iscoroutinefunction(func):
+            coroutine = self.run_async_handler(func, message, *args)
+        else:
+            self.run_handler(func, message, *args)
+            return
+        task = asyncio.ensure_future(coroutine)
+        self.pending_handlers.add(task)
+        task.add_done_callback(self.on_handler_done)
+
+    @staticmethod
+    def run_handler(func: Callable, message: Message, *args: Any) -> Any:
+        start = time.perf_counter()
+        try:
+            return func(message, *args)
+        finally:
+            command_seconds.observe(time.perf_counter() - start, message.text_command, message.channel)
+
+    @staticmethod
+    async def run_async_handler(func: Callable, message: Message, *args: Any) -> Any:
+        start = time.perf_counter()
+        try:
+            return await func(message, *args)
+        finally:
+            command_seconds.observe(time.perf_counter() - start, message.text_command, message.channel)
+
+    def on_handler_timeout(self, message: Message, options: IOBound) -> None:
+        logging.warning('Command %s timed out after %ss', message.text_command, options.timeout)
+        if options.fallback:
+            self.send_privmsg(message.channel, f'@{message.user_name} {options.fallback}')
+
+    def on_handler_done(self, task: asyncio.Future) -> None:
+        self.pending_handlers.discard(task)
+        if not task.cancelled() and task.exception():
+            logging.error('Error while handling command', exc_info=task.exception())
+
+    def log_line(self, line: str, message: Optional[Message] = None) -> None:
+        """
+        Log an inbound line, chat as user@channel: text and other lines
+        without their tags. Only plain chat is sampled, commands and server
+        lines are always logged.
+        """
+        nick, channel, text = split_privmsg(line)
+        if not nick:
+            logging.info('> %s', line.split(' ', 1)[-1] if line.startswith('@') else line)
+        elif message is not None and message.text_command:
+            logging.info('> %s@%s: %s', nick, channel, text)
+        else:
+            chat_logger.info('> %s@%s: %s', nick, channel, text)
 
     def handle_message(self, received_message: str) -> None:
         if len(received_message) == 0:
             return
+        if not self.line_filter.should_parse(received_message):
+            # Plain chat and unhandled server lines are not parsed
+            self.log_line(received_message)
+            self.record_emotes(received_message)
+            if not self.moderate(received_message):
+                self.record_history(received_message)
+            return
+        start = time.perf_counter()
         message: Message = parse(received_message, command_prefix=self.command_prefix)
-        self.log_message(message)
+        stage_seconds.observe(time.perf_counter() - start, 'parse')
+        self.log_line(received_message, message)
 
-        if message.irc_command == 'PING':
-            self.send_command('PONG :tmi.chat.twitch.tv')
+        if message.irc_command == 'USERSTATE' and isinstance(message.user, UserInfo):
+            # Moderators and broadcasters get a higher message rate limit
+            self.rate_limiter.set_moderator(message.channel, message.user.is_mod)
 
         if message.irc_command == 'PRIVMSG':
-            if self.custom_commands.get(message.text_command):
-                custom_command: Union[object, Tuple] = self.custom_commands[message.text_command]
-                if type(custom_command) == tuple:
-                    # Pass arguments if tuple
-                    func = custom_command[0]
-                    args = list(custom_command[1:])
-                    func(message, *args)
-                else:
-                    custom_command(message)  # type: ignore
-            elif message.text_command in self.state['template_commands']:
-                self.handle_template_command(
-                    message,
-                    message.text_command,
-                    self.state['template_commands'][message.text_command]
-                )
-
-    def handle_template_command(self, message: Message, command: str, template: str) -> None:
+            self.record_emotes(received_message)
+            if self.moderate(received_message, message):
+                return
+            self.handle_command(message)
+            # Recorded after the command so it doesn't see its own message
+            self.record_history(received_message)
+
+    def handle_command(self, message: Message) -> None:
+        if not message.text_command:
+            return
+        command = self.commands.get(message.text_command)
+        if command is None:
+            command = self.template_commands.get(message.channel, message.text_command)
+        if command is None:
+            return
+        start = time.perf_counter()
+        if not self.commands.allow(command, message):
+            logging.debug('Command %s is on cooldown', command.name)
+            return
+        commands_total.inc(message.text_command, message.channel)
+        self.dispatch(command.handler, message, *command.args)
+        stage_seconds.observe(time.perf_counter() - start, 'dispatch')
+
+    def moderate(self, line: str, message: Optional[Message] = None) -> bool:
+        """
+        Check a raw PRIVMSG line for banned phrases, returns whether it was
+        moderated. Only matching lines are parsed, to tell if a mod sent them.
+        """
+        if not self.moderation.matchers:
+            return False
+        start = time.perf_counter()
+        nick, channel, text = split_privmsg(line)
+        phrase = self.moderation.check(channel, text) if nick else None
+        stage_seconds.observe(time.perf_counter() - start, 'moderate')
+        if phrase is None:
+            return False
+        if message is None:
+            message = parse(line, command_prefix=self.command_prefix)
+        if isinstance(message.user, UserInfo) and message.user.is_mod:
+            return False
+        moderation_matches_total.inc(channel)
+        logging.info('Message of %s in %s contains banned phrase %r', nick, channel, phrase)
+        now = time.monotonic()
+        if self.moderation_warning and not self.moderation_warnings.is_active(channel, now):
+            self.moderation_warnings.start(channel, self.moderation_warning_cooldown, now)
+            self.send_privmsg(channel, self.moderation_warning.format(user=message.user_name))
+        return True
+
+    def record_emotes(self, line: str) -> None:
+        if not self.emote_stats.enabled:
+            return
+        # Most messages have no emotes, the text is only split for those that do
+        tag = find_tag(line, 'emotes')
+        if tag:
+            _, channel, text = split_privmsg(line)
+            self.emote_stats.add(channel, tag, text)
+
+    def emote_metrics(self) -> Dict[Tuple[str, ...], float]:
+        return {
+            (channel, name): count
+            for channel in list(self.emote_stats.channels)
+            for name, count in self.emote_stats.top(channel, self.emote_metrics_top)
+        }
+
+    def record_history(self, line: str) -> None:
+        if not self.history.enabled:
+            return
+        nick, channel, text = split_privmsg(line)
+        if nick:
+            self.history.add(channel, nick, text)
+
+    def handle_template_command(self, message: Message, template: CompiledTemplate) -> None:
         try:
-            text = template.format(**{'message': message})
+            text = template.render(message)
         except IndexError:
-            text = f'@{message.user_name} your command is missing an argument'
+            self.send_privmsg(message.channel, f'@{message.user_name} your command is missing an argument')
+            return
         except Exception as e:
-            logging.warning('Error while handling template command', message, template)
-            logging.warning(e)
+            logging.warning('Error while handling template command %r: %s', template.source, e)
             return
-        self.send_privmsg(message.channel, text)
+        self.send_encoded_privmsg(message.channel, text)
 
     # CUSTOM COMMANDS BEGIN
     def list_commands(self, message: Message) -> None:
-        template_command_names = list(self.state['template_commands'].keys())
-        custom_command_names = list(self.custom_commands.keys())
+        template_command_names = list(self.template_commands.commands(message.channel))
+        custom_command_names = [entry.name for entry in self.commands]
         all_command_names = [
             self.command_prefix + command
             for command in (template_command_names + custom_command_names)
@@ -155,24 +546,141 @@ class Bot:
         self.send_privmsg(message.channel, text)
 
     def get_spotify_currently_playing(self, message: Message, type: str) -> None:
-        song: Optional[Song] = get_currently_playing()
+        if self.playback.ok:
+            # Answered from memory, the poller keeps the song up to date
+            self.reply_song(message, type, self.playback.song)
+        else:
+            self.dispatch(self.get_spotify_song, message, type)
+
+    @io_bound(max_concurrency=2, timeout=3.0, fallback='Spotify is not responding, try again later')
+    def get_spotify_song(self, message: Message, type: str) -> None:
+        from libraries.spotify import SpotifyError
+        try:
+            song = self.fetch_currently_playing()
+        except SpotifyError as e:
+            self.reply_spotify_error(message, e)
+            return
+        self.reply_song(message, type, song)
+
+    def fetch_currently_playing(self) -> Optional[Song]:
+        # Imported on first use, requests alone takes longer to import than the rest of the bot
+        from libraries.spotify import get_currently_playing
+        return get_currently_playing()
+
+    def reply_spotify_error(self, message: Message, error: Exception) -> None:
+        logging.warning('%s', error)
+        self.send_privmsg(message.channel, f'@{message.user_name} Spotify is not responding, try again later')
+
+    def fetch_recently_played(self, after: int) -> Optional[Tuple[List[Play], int]]:
+        from libraries.spotify import get_recently_played
+        return get_recently_played(after)
+
+    @io_bound(max_concurrency=2, timeout=5.0, fallback='Spotify is not responding, try again later')
+    def show_play_history(self, message: Message) -> None:
+        count = 5
+        if message.text_args and message.text_args[0].isdigit():
+            count = min(max(int(message.text_args[0]), 1), 10)
+        self.play_history.sync_if_older(SPOTIFY_HISTORY_SYNC_INTERVAL)
+        plays = self.play_history.recent(count)
+        if not plays:
+            self.send_privmsg(message.channel, f'@{message.user_name} No songs have been played recently')
+            return
+        now = time.time()
+        tracks = ', '.join(
+            f'{play.name} - {play.artists} ({format_duration(now - play.played_at / 1000)} ago)' for play in plays
+        )
+        self.send_privmsg(message.channel, f'@{message.user_name} Last played: {tracks}')
+
+    @io_bound(max_concurrency=2, timeout=5.0, fallback='Spotify is not responding, try again later')
+    def show_play_count(self, message: Message) -> None:
+        self.play_history.sync_if_older(SPOTIFY_HISTORY_SYNC_INTERVAL)
+        midnight = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+        plays = self.play_history.since(midnight)
+        counts = self.play_history.play_counts(midnight)
+        if message.text_args:
+            query = ' '.join(message.text_args).lower()
+            matches = [play for play in plays if query in play.name.lower()]
+            if not matches:
+                self.send_privmsg(message.channel, f'@{message.user_name} No song matching {query} was played today')
+                return
+            play = max(matches, key=lambda play: counts[play.track_id])
+            name, artists, count = play.name, play.artists, counts[play.track_id]
+        else:
+            from libraries.spotify import SpotifyError
+            try:
+                song = self.playback.song if self.playback.ok else self.fetch_currently_playing()
+            except SpotifyError as e:
+                self.reply_spotify_error(message, e)
+                return
+            if song is None:
+                self.send_privmsg(message.channel, f'@{message.user_name} There is no song playing currently')
+                return
+            name, artists, count = song.name, song.artists, counts[song.id]
+        times = 'once' if count == 1 else f'{count} times'
+        self.send_privmsg(message.channel, f'@{message.user_name} {name} - {artists} was played {times} today')
+
+    def reply_song(self, message: Message, type: str, song: Optional[Song]) -> None:
         if not song:
             self.send_privmsg(
                 message.channel,
                 f'@{message.user_name}, There is no song playing currently'
             )
+            return
 
         if type == 'song':
             self.send_privmsg(
                 message.channel,
                 f'@{message.user_name}, The current song is {song.name} - {song.artists}: {song.track_url}'
             )
+        elif type == 'context' and not song.context_type:
+            self.send_privmsg(
+                message.channel,
+                f'@{message.user_name}, Not listening to a playlist or album currently'
+            )
         elif type == 'context':
             self.send_privmsg(
                 message.channel,
                 f'@{message.user_name}, Currently listening to {song.context_type}: {song.context_url}'
             )
 
+    def announce_song(self, song: Song) -> None:
+        for channel in self.song_announcement_channels:
+            self.send_privmsg(
+                channel, f'Now playing: {song.name} - {song.artists} {song.track_url}', priority=PRIORITY_ANNOUNCEMENT,
+            )
+
+    def last_seen(self, message: Message) -> None:
+        if len(message.text_args) < 1:
+            self.send_privmsg(message.channel, f'@{message.user_name} Usage: !lastseen <user>')
+            return
+        user = message.text_args[0].lstrip('@').lower()
+        history = self.history.channel(message.channel)
+        entry = history.last_seen(user) if history is not None else None
+        if entry is None:
+            self.send_privmsg(message.channel, f'@{message.user_name} {user} has not chatted recently')
+            return
+        text = entry.text if len(entry.text) <= 200 else entry.text[:199] + '…'
+        ago = format_duration(time.time() - entry.time)
+        self.send_privmsg(message.channel, f'@{message.user_name} {user} was last seen {ago} ago: {text}')
+
+    def top_chatters(self, message: Message) -> None:
+        history = self.history.channel(message.channel)
+        chatters = history.top_chatters(5) if history is not None else []
+        if history is None or not chatters:
+            self.send_privmsg(message.channel, f'@{message.user_name} No one has chatted recently')
+            return
+        ranking = ', '.join(f'{user} ({count})' for user, count in chatters)
+        text = f'@{message.user_name} Top chatters of the last {len(history)} messages: {ranking}'
+        self.send_privmsg(message.channel, text)
+
+    def top_emotes(self, message: Message) -> None:
+        emotes = self.emote_stats.top(message.channel, 5)
+        if not emotes:
+            self.send_privmsg(message.channel, f'@{message.user_name} No emotes have been used recently')
+            return
+        ranking = ', '.join(f'{name} ({count:.0f})' for name, count in emotes)
+        self.send_privmsg(message.channel, f'@{message.user_name} Top emotes lately: {ranking}')
+
     @require_mod
     def add_template_command(self, message: Message, force: bool = False) -> None:
         if len(message.text_args) < 2:
@@ -183,14 +691,24 @@ class Bot:
 
         command_name = message.text_args[0].lstrip(self.command_prefix)
         template = ' '.join(message.text_args[1:])
-        if command_name in self.state['template_commands'] and not force:
+        if command_name in self.commands:
+            text = f'@{message.user_name} {command_name} is a built-in command and can\'t be changed.'
+            self.send_privmsg(message.channel, text)
+            return
+        if command_name in self.template_commands.commands(message.channel) and not force:
             text = (f'@{message.user_name} Command {command_name} already exists, '
                     f'use {self.command_prefix}editcmd if you want to update it.')
             self.send_privmsg(message.channel, text)
             return
 
-        self.state['template_commands'][command_name] = template
-        self.write_state()
+        try:
+            compiled_template = CompiledTemplate(template)
+        except TemplateError as e:
+            self.send_privmsg(message.channel, f'@{message.user_name} Invalid template: {e}')
+            return
+
+        self.template_commands.set(message.channel, self.template_command_entry(command_name, compiled_template))
+        self.command_store.set(message.channel, command_name, template)
         text = f'@{message.user_name} Command {command_name} has been {"added" if not force else "updated"}!'
         self.send_privmsg(message.channel, text)
 
@@ -208,28 +726,82 @@ class Bot:
             command.lstrip(self.command_prefix)
             for command in message.text_args
         ]
+        channel_commands = self.template_commands.commands(message.channel)
         for command_name in command_names:
-            if command_name not in self.state['template_commands']:
+            if command_name not in channel_commands:
                 text = f'@{message.user_name} Command {command_name} does not exist.'
                 self.send_privmsg(message.channel, text)
                 return
         for command_name in command_names:
-            del self.state['template_commands'][command_name]
-        self.write_state()
+            self.template_commands.remove(message.channel, command_name)
+            self.command_store.delete(message.channel, command_name)
         text = f'@{message.user_name} Command {command_names} has been deleted!'
         self.send_privmsg(message.channel, text)
 
+    def ban_phrase(self, channel: str, phrase: str) -> None:
+        self.state['banned_phrases'].setdefault(channel, {})[phrase] = True
+        # One journal entry per phrase, long phrase lists are not written again on every change
+        self.journal.set(['banned_phrases', channel, phrase], True)
+        # Compiled in the background, the previous phrases apply until then
+        self.moderation.set_phrases(channel, self.state['banned_phrases'][channel])
+
+    def unban_phrase(self, channel: str, phrase: str) -> None:
+        phrases = self.state['banned_phrases'][channel]
+        del phrases[phrase]
+        if phrases:
+            self.journal.delete(['banned_phrases', channel, phrase])
+        else:
+            del self.state['banned_phrases'][channel]
+            self.journal.delete(['banned_phrases', channel])
+        self.moderation.set_phrases(channel, phrases)
+
+    @require_mod
+    def add_banned_phrase(self, message: Message) -> None:
+        phrase = normalize(' '.join(message.text_args))
+        if not phrase:
+            self.send_privmsg(message.channel, f'@{message.user_name} Usage: !addphrase <phrase>')
+            return
+        if phrase in self.state['banned_phrases'].get(message.channel, {}):
+            self.send_privmsg(message.channel, f'@{message.user_name} That phrase is already banned.')
+            return
+        self.ban_phrase(message.channel, phrase)
+        self.send_privmsg(message.channel, f'@{message.user_name} Phrase has been banned!')
+
+    @require_mod
+    def delete_banned_phrase(self, message: Message) -> None:
+        phrase = normalize(' '.join(message.text_args))
+        if not phrase:
+            self.send_privmsg(message.channel, f'@{message.user_name} Usage: !delphrase <phrase>')
+            return
+        if phrase not in self.state['banned_phrases'].get(message.channel, {}):
+            self.send_privmsg(message.channel, f'@{message.user_name} That phrase is not banned.')
+            return
+        self.unban_phrase(message.channel, phrase)
+        self.send_privmsg(message.channel, f'@{message.user_name} Phrase has been unbanned!')
+
+    @require_mod
+    def count_banned_phrases(self, message: Message) -> None:
+        # The phrases themselves are not repeated in chat
+        count = len(self.state['banned_phrases'].get(message.channel, {}))
+        self.send_privmsg(message.channel, f'@{message.user_name} {count} banned phrases in this channel')
+
 
 def main() -> None:
     bot = Bot()
-    bot.init()
+    if WORKER_PROCESSES > 1:
+        from core.supervisor import Supervisor
+        Supervisor(bot, WORKER_PROCESSES).init()
+    else:
+        bot.init()
 
 
 if __name__ == '__main__':
     FORMAT = '[%(asctime)-15s] %(levelname)s %(message)s'
-    logging.basicConfig(
+    logs.setup_logging(
         level=logging.INFO,
         format=FORMAT,
-        datefmt='%m/%d/%Y %I:%M:%S %p'
+        datefmt='%m/%d/%Y %I:%M:%S %p',
+        queue_size=LOG_QUEUE_SIZE,
+        chat_sample_rate=LOG_CHAT_SAMPLE_RATE,
     )
     main()
@@ -0,0 +1,101 @@
+import unittest
+
+from core.commands import ChannelCommands, CommandEntry, CommandRegistry, Cooldowns
+from core.decorators import require_mod
+from core.parser import parse
+
+
+def message(user: str, channel: str = 'xchrombot', text: str = '!drop'):  # type: ignore
+    return parse(f':{user}!{user}@{user}.tmi.twitch.tv PRIVMSG #{channel} :{text}')
+
+
+class TestCommandRegistry(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.registry = CommandRegistry()
+
+    def test_aliases_and_builtin_precedence(self) -> None:
+        handler = object()
+        self.registry.register('cmds', print, aliases=('commands',))
+        self.assertIsNone(self.registry.register('cmds', handler, is_template=True))
+        self.assertIs(self.registry.get('commands').handler, print)  # type: ignore
+        self.registry.unregister('cmds')
+        self.assertNotIn('commands', self.registry)
+
+    def test_cooldowns(self) -> None:
+        entry = self.registry.register('drop', print, cooldown=(10, 3, 0))
+        assert entry is not None
+        self.assertTrue(self.registry.allow(entry, message('a'), now=100))
+        # Same user and other users in the channel cooldown
+        self.assertFalse(self.registry.allow(entry, message('a'), now=101))
+        self.assertFalse(self.registry.allow(entry, message('b'), now=101))
+        # Other channels are not affected
+        self.assertTrue(self.registry.allow(entry, message('b', channel='other'), now=101))
+        # Channel cooldown over, user cooldown still running
+        self.assertTrue(self.registry.allow(entry, message('b'), now=104))
+        self.assertFalse(self.registry.allow(entry, message('a'), now=108))
+        self.assertTrue(self.registry.allow(entry, message('a'), now=111))
+        self.assertEqual(self.registry.dropped, 3)
+
+    def test_global_cooldown(self) -> None:
+        entry = self.registry.register('song', print, cooldown=(0, 0, 5))
+        assert entry is not None
+        self.assertTrue(self.registry.allow(entry, message('a'), now=100))
+        self.assertFalse(self.registry.allow(entry, message('b', channel='other'), now=102))
+
+    def test_mod_commands_start_no_cooldown_for_others(self) -> None:
+        entry = self.registry.register('addcmd', require_mod(print), cooldown=(0, 5, 0))
+        assert entry is not None
+        self.assertFalse(self.registry.allow(entry, message('a'), now=100))
+        mod = parse('@mod=1 :b!b@b.tmi.twitch.tv PRIVMSG #xchrombot :!addcmd')
+        self.assertTrue(self.registry.allow(entry, mod, now=101))
+        self.assertEqual(self.registry.dropped, 0)
+
+
+class TestCooldowns(unittest.TestCase):
+
+    def test_bounded(self) -> None:
+        cooldowns = Cooldowns(max_entries=3)
+        for i in range(10):
+            cooldowns.start(i, 60, now=0)
+        self.assertEqual(len(cooldowns), 3)
+        self.assertTrue(cooldowns.is_active(9, now=1))
+        self.assertFalse(cooldowns.is_active(0, now=1))
+
+    def test_expired_entries_are_evicted(self) -> None:
+        cooldowns = Cooldowns()
+        cooldowns.start('a', 1, now=0)
+        cooldowns.start('b', 1, now=0.5)
+        cooldowns.start('c', 1, now=5)
+        self.assertEqual(len(cooldowns), 1)
+
+
+class TestChannelCommands(unittest.TestCase):
+
+    def test_lru_eviction(self) -> None:
+        loaded = []
+
+        def load(channel: str) -> dict:
+            loaded.append(channel)
+            return {name: CommandEntry(name, print, (), 0, 0, 0, True) for name in ('a', 'b')}
+
+        commands = ChannelCommands(load, max_entries=4)
+        commands.get('x', 'a')
+        commands.get('y', 'a')
+        commands.get('x', 'b')
+        commands.set('x', CommandEntry('c', print, (), 0, 0, 0, True))
+        # y was used least recently and goes to stay within 4 entries
+        self.assertEqual(list(commands.channels), ['x'])
+        self.assertEqual(commands.size, 3)
+        self.assertIsNotNone(commands.get('y', 'b'))
+        self.assertEqual(loaded, ['x', 'y', 'y'])
+        self.assertEqual(list(commands.channels), ['y'])
+
+    def test_added_channels_are_not_loaded(self) -> None:
+        commands = ChannelCommands(lambda channel: {}, max_entries=4)
+        commands.add('x', {'a': CommandEntry('a', print, (), 0, 0, 0, True)})
+        self.assertIsNotNone(commands.get('x', 'a'))
+        # Commands changed since the channel was loaded are kept
+        commands.add('x', {})
+        self.assertIsNotNone(commands.get('x', 'a'))
+        self.assertEqual(commands.loads, 1)
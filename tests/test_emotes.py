@@ -0,0 +1,71 @@
+import unittest
+
+from core.emotes import EmoteCounter, EmoteStats, count_emotes, decode_emotes, emote_name
+from core.parser import parse
+
+
+class TestDecoding(unittest.TestCase):
+
+    def test_decode(self) -> None:
+        self.assertEqual(decode_emotes('25:0-4,12-16/1902:6-10'), (('25', ((0, 4), (12, 16))), ('1902', ((6, 10),))))
+        self.assertEqual(decode_emotes(''), ())
+        self.assertEqual(list(count_emotes('25:0-4,12-16/1902:6-10')), [('25', 2), ('1902', 1)])
+
+    def test_user_info_decodes_lazily(self) -> None:
+        message = parse('@display-name=a;emotes=25:0-4;mod=0 :a!a@a.tmi.twitch.tv PRIVMSG #x :Kappa')
+        self.assertEqual(message.user.emotes, '25:0-4')  # type: ignore
+        self.assertEqual(message.user.emote_ranges, (('25', ((0, 4),)),))  # type: ignore
+
+    def test_name(self) -> None:
+        self.assertEqual(emote_name('25:6-10', 'hello Kappa', '25'), 'Kappa')
+        self.assertEqual(emote_name('25:0-4', '\x01ACTION Kappa\x01', '25'), 'Kappa')
+        # Positions past the text fall back to the id
+        self.assertEqual(emote_name('25:20-24', 'Kappa', '25'), '25')
+
+
+class TestEmoteCounter(unittest.TestCase):
+
+    def test_decay(self) -> None:
+        counter = EmoteCounter(half_life=10, now=0)
+        counter.add('1', 'Kappa', 4, now=0)
+        counter.add('2', 'LUL', 1, now=20)
+        top = counter.top(2, now=20)
+        self.assertEqual([name for name, _ in top], ['Kappa', 'LUL'])
+        self.assertAlmostEqual(top[0][1], 1.0)
+        self.assertAlmostEqual(top[1][1], 1.0)
+        counter.add('2', '', 1, now=20)
+        self.assertEqual(counter.top(1, now=30)[0][0], 'LUL')
+
+    def test_least_used_is_evicted(self) -> None:
+        counter = EmoteCounter(half_life=10, size=2, now=0)
+        counter.add('1', 'a', 5, now=0)
+        counter.add('2', 'b', 1, now=0)
+        counter.add('3', 'c', 2, now=0)
+        self.assertEqual(sorted(counter.slots), ['1', '3'])
+        self.assertEqual(counter.top(3, now=0), [('a', 5.0), ('c', 2.0)])
+
+    def test_rescale_keeps_counts(self) -> None:
+        counter = EmoteCounter(half_life=1, now=0)
+        counter.add('1', 'a', 1, now=0)
+        counter.add('2', 'b', 3, now=300)
+        counter.add('2', 'b', 1, now=301)
+        # The first emote decayed away when the weights were rescaled
+        self.assertEqual(counter.ids, ['2'])
+        self.assertAlmostEqual(counter.top(1, now=301)[0][1], 2.5)
+
+
+class TestEmoteStats(unittest.TestCase):
+
+    def test_channels(self) -> None:
+        stats = EmoteStats(half_life=60, size=10)
+        stats.add('a', '25:0-4,6-10', 'Kappa Kappa', now=0)
+        stats.add('a', '1902:0-4', 'Keepo', now=0)
+        stats.add('b', '1902:0-4', 'Keepo', now=0)
+        self.assertEqual(stats.top('a', now=0), [('Kappa', 2.0), ('Keepo', 1.0)])
+        self.assertEqual(stats.top('c', now=0), [])
+        self.assertEqual(stats.emotes, 4)
+        self.assertEqual(stats.stats(), {'channels': 2, 'emotes': 3})
+
+
+if __name__ == '__main__':
+    unittest.main()
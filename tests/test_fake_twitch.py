@@ -0,0 +1,205 @@
+import asyncio
+import os
+import tempfile
+import threading
+import unittest
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from benchmarks.fake_twitch import FakeTwitchServer
+from benchmarks.traffic import chat_line
+from core.decorators import io_bound
+from core.journal import StateJournal
+from core.objects import Message
+from core.pool import Backoff
+from core.store import CommandStore
+from main import Bot
+
+
+def make_bot(port: int, directory: str) -> Bot:
+    bot = Bot()
+    bot.irc_server = '127.0.0.1'
+    bot.irc_port = port
+    bot.irc_use_tls = False
+    bot.channels = ['a', 'b']
+    bot.metrics_port = 0
+    bot.spotify_poll_interval = 0
+    bot.reconnect_backoff = Backoff(0.01, 0.05)
+    bot.journal = StateJournal(os.path.join(directory, 'state.json'))
+    bot.command_store = CommandStore(os.path.join(directory, 'commands.db'))
+    bot.read_state()
+    return bot
+
+
+class TestFakeTwitchServer(unittest.TestCase):
+
+    def received(self, server: FakeTwitchServer, client: int) -> List[str]:
+        return [line for _, index, line in server.received if index == client]
+
+    def run_session(
+        self,
+        test: Callable[[FakeTwitchServer, Bot], Awaitable[None]],
+        prepare: Optional[Callable[[Bot], Awaitable[None]]] = None,
+    ) -> None:
+        """
+        Run `test` once the bot has connected to a fake Twitch server and
+        joined its channels. `prepare` runs before the bot starts reading.
+        """
+        async def run(directory: str) -> None:
+            server = FakeTwitchServer()
+            await server.start()
+            bot = make_bot(server.port, directory)
+            await bot.connect()
+            if prepare is not None:
+                await prepare(bot)
+            run_task = asyncio.ensure_future(bot.loop_for_messages())
+            await server.wait_for_joins(['a', 'b'])
+            await test(server, bot)
+            run_task.cancel()
+            await asyncio.wait_for(run_task, 5)
+            await server.wait_for(lambda: not server.channels)
+            await server.close()
+
+        with tempfile.TemporaryDirectory() as directory:
+            asyncio.run(run(directory))
+
+    def test_bot_session(self) -> None:
+        async def test(server: FakeTwitchServer, bot: Bot) -> None:
+            client = server.clients[0]
+            self.assertEqual(client.nick, bot.username)
+            self.assertEqual(client.capabilities, ['twitch.tv/tags'])
+
+            bot.command_store.set('b', 'hi', 'hi @{message.user_name}')
+            server.send(['PING :tmi.twitch.tv', chat_line(1, 'b', '!hi')])
+            await server.wait_for(lambda: 'PRIVMSG #b :hi @chatter1' in self.received(server, 0))
+            self.assertIn('PONG :tmi.twitch.tv', self.received(server, 0))
+
+            # Plain chat is not parsed but kept in the channel history
+            server.send([chat_line(2, 'b', 'hello there'), chat_line(1, 'b', '!lastseen @Chatter2')])
+            last_seen = 'PRIVMSG #b :@chatter1 chatter2 was last seen 0s ago: hello there'
+            await server.wait_for(lambda: last_seen in self.received(server, 0))
+
+        self.run_session(test)
+
+    def test_dispatch(self) -> None:
+        threads: Dict[str, threading.Thread] = {}
+
+        async def test(server: FakeTwitchServer, bot: Bot) -> None:
+            def record(name: str) -> Callable:
+                def handler(message: Message) -> None:
+                    threads[name] = threading.current_thread()
+                    bot.send_privmsg(message.channel, f'{name} done')
+                return handler
+
+            async def coroutine_handler(message: Message) -> None:
+                await asyncio.sleep(0)
+                record('coroutine')(message)
+
+            bot.commands.register('plain', record('plain'))
+            bot.commands.register('blocking', io_bound()(record('blocking')))
+            bot.commands.register('coroutine', coroutine_handler)
+            store_set = bot.command_store.set
+
+            def recording_set(*args: Any) -> None:
+                threads['addcmd'] = threading.current_thread()
+                store_set(*args)
+
+            bot.command_store.set = recording_set  # type: ignore
+            server.send([
+                chat_line(1, 'a', '!plain'), chat_line(2, 'a', '!blocking'), chat_line(3, 'b', '!coroutine'),
+                chat_line(4, 'b', '!addcmd hi hello').replace('mod=0', 'mod=1'),
+            ])
+            await server.wait_for(lambda: {'PRIVMSG #a :plain done', 'PRIVMSG #a :blocking done',
+                                           'PRIVMSG #b :coroutine done'} <= set(self.received(server, 0)))
+            added = 'PRIVMSG #b :@chatter4 Command hi has been added!'
+            await server.wait_for(lambda: added in self.received(server, 0))
+            loop_thread = threading.current_thread()
+            self.assertIs(threads['plain'], loop_thread)
+            self.assertIs(threads['coroutine'], loop_thread)
+            # State changes stay on the loop thread, only @io_bound handlers run on the worker pool
+            self.assertIs(threads['addcmd'], loop_thread)
+            self.assertIsNot(threads['blocking'], loop_thread)
+
+        self.run_session(test)
+
+    def test_commands_are_loaded_off_the_loop(self) -> None:
+        loads: List[threading.Thread] = []
+
+        async def prepare(bot: Bot) -> None:
+            bot.command_store.set('b', 'hi', 'hi @{message.user_name}')
+            store_load = bot.command_store.load
+
+            def recording_load(channel: str) -> Dict[str, str]:
+                loads.append(threading.current_thread())
+                return store_load(channel)
+
+            bot.command_store.load = recording_load  # type: ignore
+            await bot.preload_template_commands(bot.channels)
+
+        async def test(server: FakeTwitchServer, bot: Bot) -> None:
+            server.send([chat_line(1, 'b', '!hi'), chat_line(2, 'a', '!hi')])
+            await server.wait_for(lambda: 'PRIVMSG #b :hi @chatter1' in self.received(server, 0))
+            self.assertEqual(len(loads), 2)
+            self.assertNotIn(threading.current_thread(), loads)
+
+        self.run_session(test, prepare)
+
+    def test_banned_phrases(self) -> None:
+        async def test(server: FakeTwitchServer, bot: Bot) -> None:
+            server.send([chat_line(1, 'a', '!addphrase Big  Spoiler').replace('mod=0', 'mod=1')])
+            banned = 'PRIVMSG #a :@chatter1 Phrase has been banned!'
+            await server.wait_for(lambda: banned in self.received(server, 0))
+            # The phrases are compiled in the background
+            while 'a' not in bot.moderation.matchers:
+                await asyncio.sleep(0.01)
+
+            spoiler = 'the big spoiler is...'
+            server.send([chat_line(2, 'a', spoiler), chat_line(3, 'b', spoiler)])
+            warning = 'PRIVMSG #a :' + bot.moderation_warning.format(user='chatter2')
+            await server.wait_for(lambda: warning in self.received(server, 0))
+            # Only channel a bans the phrase
+            await server.wait_for(lambda: bot.history.channel('b') is not None)
+            self.assertIsNotNone(bot.history.channel('b').last_seen('chatter3'))  # type: ignore
+            self.assertIsNone(bot.history.channel('a').last_seen('chatter2'))  # type: ignore
+            self.assertEqual(bot.state['banned_phrases'], {'a': {'big spoiler': True}})
+
+            # Further matches within the cooldown are not warned about again
+            server.send([chat_line(4, 'a', spoiler), chat_line(5, 'a', '!lastseen nobody')])
+            not_seen = 'PRIVMSG #a :@chatter5 nobody has not chatted recently'
+            await server.wait_for(lambda: not_seen in self.received(server, 0))
+            warning = 'PRIVMSG #a :' + bot.moderation_warning.format(user='chatter4')
+            self.assertNotIn(warning, self.received(server, 0))
+            self.assertIsNone(bot.history.channel('a').last_seen('chatter4'))  # type: ignore
+
+        self.run_session(test)
+
+    def test_reconnect_after_drop(self) -> None:
+        async def test(server: FakeTwitchServer, bot: Bot) -> None:
+            assert bot.connections is not None and server.server is not None
+            # Refuse new connections, so replies pile up while the bot retries
+            server.server.close()
+            server.disconnect(server.clients[0])
+            await server.wait_for(lambda: not server.channels)
+            while not bot.connections.dropped:
+                await asyncio.sleep(0.01)
+            bot.send_privmsg('a', 'sent while disconnected')
+            await asyncio.sleep(0.1)
+
+            await server.start()
+            await server.wait_for_joins(['a', 'b'])
+            await server.wait_for(lambda: 'PRIVMSG #a :sent while disconnected' in self.received(server, 1))
+            lines = self.received(server, 1)
+            self.assertEqual(lines[:5], [f'PASS {bot.oauth_token}', f'NICK {bot.username}',
+                                         'CAP REQ :twitch.tv/tags', 'JOIN #a', 'JOIN #b'])
+            self.assertEqual(bot.connections.stats()['reconnects'], 1)
+
+        self.run_session(test)
+
+    def test_reconnect_when_asked(self) -> None:
+        async def test(server: FakeTwitchServer, bot: Bot) -> None:
+            server.send([':tmi.twitch.tv RECONNECT'])
+            await server.wait_for(lambda: len(server.clients) == 2 and len(server.clients[1].channels) == 2)
+            server.send([chat_line(1, 'a', '!lastseen nobody')])
+            await server.wait_for(lambda: 'PRIVMSG #a :@chatter1 nobody has not chatted recently'
+                                  in self.received(server, 1))
+
+        self.run_session(test)
@@ -0,0 +1,59 @@
+import os
+import random
+import unittest
+
+from core.framer import LineFramer
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'twitch_burst.log')
+
+
+class TestLineFramer(unittest.TestCase):
+
+    def setUp(self) -> None:
+        with open(FIXTURE, 'rb') as f:
+            self.burst = f.read()
+        self.expected = self.burst.decode('utf-8').split('\r\n')[:-1]
+
+    def feed_in_chunks(self, framer: LineFramer, data: bytes, rng: random.Random) -> list:
+        lines = []
+        position = 0
+        while position < len(data):
+            size = rng.randint(1, 300)
+            lines.extend(framer.feed(data[position:position + size]))
+            position += size
+        return lines
+
+    def test_random_chunk_sizes(self) -> None:
+        for seed in range(20):
+            framer = LineFramer()
+            lines = self.feed_in_chunks(framer, self.burst, random.Random(seed))
+            self.assertEqual(lines, self.expected)
+            self.assertEqual(len(framer.buffer), 0)
+
+    def test_single_bytes(self) -> None:
+        framer = LineFramer()
+        lines = []
+        for i in range(len(self.burst)):
+            lines.extend(framer.feed(self.burst[i:i + 1]))
+        self.assertEqual(lines, self.expected)
+
+    def test_partial_line_is_kept(self) -> None:
+        framer = LineFramer()
+        self.assertEqual(framer.feed(b'PING :tmi.tw'), [])
+        self.assertEqual(framer.feed(b'itch.tv\r'), [])
+        self.assertEqual(framer.feed(b'\nPING'), ['PING :tmi.twitch.tv'])
+
+    def test_split_multibyte_character(self) -> None:
+        framer = LineFramer()
+        data = 'PRIVMSG #xchrombot :🔥\r\n'.encode('utf-8')
+        split = data.index(b'\xf0') + 2
+        self.assertEqual(framer.feed(data[:split]), [])
+        self.assertEqual(framer.feed(data[split:]), ['PRIVMSG #xchrombot :🔥'])
+
+    def test_overlong_line_is_dropped(self) -> None:
+        framer = LineFramer(max_line_length=64)
+        lines = framer.feed(b'A' * 100)
+        lines += framer.feed(b'B' * 100 + b'\r\nPING :tmi.twitch.tv\r\n')
+        self.assertEqual(lines, ['PING :tmi.twitch.tv'])
+        self.assertEqual(framer.dropped_lines, 1)
+        self.assertLessEqual(len(framer.buffer), 64)
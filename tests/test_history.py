@@ -0,0 +1,46 @@
+import unittest
+
+from core.history import USER_INDEX_LENGTH, ChannelHistory, ChatHistory
+
+
+class TestChannelHistory(unittest.TestCase):
+
+    def test_ring_overwrites_oldest(self) -> None:
+        history = ChannelHistory(3)
+        for i, user in enumerate(['a', 'b', 'a', 'c']):
+            history.add(user, f'message {i}', float(i))
+        self.assertEqual(len(history), 3)
+        self.assertEqual([entry.text for entry in history.recent()], ['message 3', 'message 2', 'message 1'])
+        self.assertEqual(history.user_counts, {'a': 1, 'b': 1, 'c': 1})
+
+    def test_user_index(self) -> None:
+        history = ChannelHistory(100)
+        history.add('a', 'hello', 1.0)
+        history.add('b', 'hi', 2.0)
+        history.add('a', 'bye', 3.0)
+        self.assertEqual(history.last_seen('a').text, 'bye')  # type: ignore
+        self.assertEqual([entry.text for entry in history.messages_by('a')], ['bye', 'hello'])
+        self.assertIsNone(history.last_seen('c'))
+        self.assertEqual(history.top_chatters(1), [('a', 2)])
+
+    def test_index_stays_bounded(self) -> None:
+        history = ChannelHistory(50)
+        for i in range(1000):
+            history.add(f'user{i % 7}' if i % 2 else 'spammer', str(i), float(i))
+        self.assertEqual(sum(history.user_counts.values()), 50)
+        self.assertLessEqual(len(history.user_messages['spammer']), USER_INDEX_LENGTH)
+        self.assertEqual(history.last_seen('spammer').text, '998')  # type: ignore
+        for user, messages in history.user_messages.items():
+            for entry in history.messages_by(user):
+                self.assertEqual(entry.user, user)
+
+
+class TestChatHistory(unittest.TestCase):
+
+    def test_channel_sizes(self) -> None:
+        history = ChatHistory(10, {'quiet': 0, 'busy': 100})
+        for channel in ('quiet', 'busy', 'other'):
+            history.add(channel, 'a', 'hello')
+        self.assertIsNone(history.channel('quiet'))
+        self.assertEqual(history.channel('busy').size, 100)  # type: ignore
+        self.assertEqual(history.stats(), {'channels': 2, 'messages': 2, 'users': 2})
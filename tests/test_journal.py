@@ -0,0 +1,61 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from core.journal import StateJournal
+
+
+class TestStateJournal(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.snapshot = os.path.join(self.directory.name, 'state.json')
+        with open(self.snapshot, 'w') as file:
+            json.dump({'template_commands': {'drop': 'drop it'}}, file)
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_replay_journal(self) -> None:
+        journal = StateJournal(self.snapshot)
+        with open(journal.journal_filename, 'w') as file:
+            file.write(json.dumps({'op': 'set', 'path': ['template_commands', 'gym'], 'value': 'wrong door'}) + '\n')
+            file.write(json.dumps({'op': 'delete', 'path': ['template_commands', 'drop']}) + '\n')
+        state = journal.load()
+        self.assertEqual(state, {'template_commands': {'gym': 'wrong door'}})
+
+    def test_close_compacts(self) -> None:
+        journal = StateJournal(self.snapshot)
+        journal.load()
+        journal.start()
+        journal.set(['template_commands', 'gym'], 'wrong door')
+        journal.close()
+        with open(self.snapshot, 'r') as file:
+            self.assertEqual(json.load(file), {'template_commands': {'drop': 'drop it', 'gym': 'wrong door'}})
+        self.assertEqual(os.path.getsize(journal.journal_filename), 0)
+
+    def test_partial_entry_is_ignored(self) -> None:
+        journal = StateJournal(self.snapshot)
+        with open(journal.journal_filename, 'w') as file:
+            file.write(json.dumps({'op': 'set', 'path': ['template_commands', 'gym'], 'value': 'x'}) + '\n')
+            file.write('{"op": "set", "pa')
+        state = journal.load()
+        self.assertEqual(state, {'template_commands': {'drop': 'drop it', 'gym': 'x'}})
+
+    def test_entries_after_a_partial_entry_survive(self) -> None:
+        journal = StateJournal(self.snapshot)
+        with open(journal.journal_filename, 'w') as file:
+            file.write(json.dumps({'op': 'set', 'path': ['template_commands', 'gym'], 'value': 'x'}) + '\n')
+            file.write('{"op": "set", "path": ["templ')
+        journal.load()
+        journal.start()
+        journal.set(['template_commands', 'lurk'], 'y')
+        # Appended and fsynced, but not compacted yet, like before a crash
+        deadline = time.monotonic() + 5
+        while journal.entries_since_compaction < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        state = StateJournal(self.snapshot).load()
+        self.assertEqual(state, {'template_commands': {'drop': 'drop it', 'gym': 'x', 'lurk': 'y'}})
+        journal.close()
@@ -0,0 +1,46 @@
+import logging
+import queue
+import unittest
+
+from benchmarks.traffic import chat_line
+from core.logs import Decoded, DroppingQueueHandler, SampleFilter, chat_logger
+from main import Bot
+
+
+class TestLogPipeline(unittest.TestCase):
+
+    def test_full_queue_drops(self) -> None:
+        handler = DroppingQueueHandler(queue.Queue(2))
+        logger = logging.getLogger('tests.logs.drop')
+        logger.propagate = False
+        logger.addHandler(handler)
+        for i in range(5):
+            logger.warning('line %d', i)
+        self.assertEqual(handler.dropped, 3)
+        self.assertEqual(handler.queue.qsize(), 2)
+
+    def test_formatting_is_deferred(self) -> None:
+        handler = DroppingQueueHandler(queue.Queue())
+        record = logging.LogRecord('tests', logging.INFO, __file__, 1, '< PRIVMSG #%s :%s', ('a', Decoded(b'hi')), None)
+        handler.emit(record)
+        queued = handler.queue.get_nowait()
+        self.assertEqual(queued.args[0], 'a')
+        self.assertEqual(queued.getMessage(), '< PRIVMSG #a :hi')
+
+    def test_sample_filter(self) -> None:
+        sample_filter = SampleFilter(0.25)
+        record = logging.LogRecord('tests', logging.INFO, __file__, 1, 'chat', None, None)
+        kept = [sample_filter.filter(record) for _ in range(100)]
+        self.assertEqual(kept.count(True), 25)
+        self.assertEqual(sample_filter.sampled_out, 75)
+
+    def test_chat_is_logged_at_info(self) -> None:
+        bot = Bot()
+        with self.assertLogs(chat_logger, logging.INFO) as logs:
+            bot.handle_message(chat_line(1, 'a', 'hello there'))
+        self.assertEqual(logs.records[0].levelno, logging.INFO)
+        self.assertEqual(logs.records[0].getMessage(), '> chatter1@a: hello there')
+        # Server lines are not sampled with the chat
+        with self.assertLogs(level=logging.INFO) as logs:
+            bot.handle_message(':tmi.twitch.tv 001 bot :Welcome, GLHF!')
+        self.assertEqual([record.name for record in logs.records], ['root'])
@@ -0,0 +1,66 @@
+import asyncio
+import threading
+import unittest
+
+from core.metrics import Counter, Histogram, MetricsServer, Registry
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_histogram_buckets_are_cumulative(self) -> None:
+        histogram = Histogram('stage_seconds', 'Stage time', ('stage',), buckets=(0.1, 1))
+        histogram.observe(0.05, 'parse')
+        histogram.observe(0.5, 'parse')
+        histogram.observe(5, 'parse')
+        lines = histogram.render()
+        self.assertIn('stage_seconds_bucket{stage="parse",le="0.1"} 1', lines)
+        self.assertIn('stage_seconds_bucket{stage="parse",le="1.0"} 2', lines)
+        self.assertIn('stage_seconds_bucket{stage="parse",le="+Inf"} 3', lines)
+        self.assertIn('stage_seconds_sum{stage="parse"} 5.55', lines)
+        self.assertIn('stage_seconds_count{stage="parse"} 3', lines)
+
+    def test_label_values_are_escaped(self) -> None:
+        counter = Counter('commands_total', 'Commands', ('command',))
+        counter.inc('say "hi"\\')
+        counter.inc('say "hi"\\', amount=2)
+        self.assertEqual(counter.render()[-1], 'commands_total{command="say \\"hi\\"\\\\"} 3')
+
+    def test_collected_with_labels(self) -> None:
+        registry = Registry()
+        registry.collect('emote_uses', 'Emote uses', lambda: {('a', 'Kappa'): 2.5}, labels=('channel', 'emote'))
+        self.assertIn('emote_uses{channel="a",emote="Kappa"} 2.5', registry.render().splitlines())
+
+    def test_server(self) -> None:
+        registry = Registry()
+        registry.counter('lines_total', 'Lines').inc(amount=3)
+        registry.collect('queue_depth', 'Queued lines', lambda: 7)
+
+        async def request(path: str) -> bytes:
+            server = MetricsServer(port=0, registry=registry)
+            await server.start()
+            reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+            writer.write(f'GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode())
+            response = await reader.read()
+            writer.close()
+            await server.close()
+            return response
+
+        response = asyncio.run(request('/metrics'))
+        self.assertTrue(response.startswith(b'HTTP/1.1 200 OK'))
+        self.assertIn(b'\r\n\r\n# HELP lines_total Lines\n# TYPE lines_total counter\nlines_total 3\n', response)
+        self.assertIn(b'queue_depth 7\n', response)
+        self.assertTrue(asyncio.run(request('/')).startswith(b'HTTP/1.1 404'))
+
+    def test_threads_are_merged(self) -> None:
+        histogram = Histogram('handler_seconds', 'Handler time', buckets=(1,))
+
+        def observe() -> None:
+            for _ in range(1000):
+                histogram.observe(0.5)
+
+        threads = [threading.Thread(target=observe) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertIn('handler_seconds_count 4000', histogram.render())
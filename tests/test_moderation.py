@@ -0,0 +1,103 @@
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from core.journal import StateJournal
+from core.moderation import ModerationFilter, PhraseMatcher
+from core.store import CommandStore
+from main import Bot
+
+
+class TestPhraseMatcher(unittest.TestCase):
+
+    def test_whole_words_only(self) -> None:
+        matcher = PhraseMatcher(['ass', 'bad word'])
+        self.assertEqual(matcher.search('what an ASS!'), 'ass')
+        self.assertIsNone(matcher.search('first class seats'))
+        self.assertEqual(matcher.search('such a bad  word'), 'bad word')
+        self.assertIsNone(matcher.search('bad wordsmith'))
+        self.assertIsNone(PhraseMatcher([]).search('anything'))
+
+    def test_overlapping_phrases(self) -> None:
+        # "he" and "she" end inside "ushers", only "hers" is a whole word in the second text
+        matcher = PhraseMatcher(['he', 'she', 'his', 'hers'])
+        self.assertIsNone(matcher.search('ushers'))
+        self.assertEqual(matcher.search('u hers'), 'hers')
+        self.assertEqual(matcher.search('is it his?'), 'his')
+
+    def test_matches_naive_search(self) -> None:
+        rng = random.Random(1)
+        words = ['ab', 'ba', 'aab', 'b', 'abab', 'a b', 'bb a']
+        matcher = PhraseMatcher(words)
+        patterns = [re.compile(r'(?<!\w)' + re.escape(word) + r'(?!\w)') for word in words]
+        for _ in range(2000):
+            text = ''.join(rng.choice('ab ') for _ in range(rng.randint(0, 12)))
+            # Runs of whitespace count as one space
+            expected = any(pattern.search(' '.join(text.split())) for pattern in patterns)
+            self.assertEqual(matcher.search(text) is not None, expected, text)
+
+
+class TestModerationFilter(unittest.TestCase):
+
+    def test_rebuilds_in_the_background(self) -> None:
+        moderation = ModerationFilter()
+        moderation.load({'a': ['spoiler']})
+        self.assertEqual(moderation.check('a', 'no spoiler please'), 'spoiler')
+        self.assertIsNone(moderation.check('b', 'no spoiler please'))
+        moderation.set_phrases('b', ['spoiler']).result(timeout=5)
+        self.assertEqual(moderation.check('b', 'spoiler'), 'spoiler')
+        moderation.set_phrases('a', []).result(timeout=5)
+        self.assertIsNone(moderation.check('a', 'spoiler'))
+        self.assertNotIn('a', moderation.matchers)
+        moderation.close()
+
+    def test_queued_changes_share_a_rebuild(self) -> None:
+        moderation = ModerationFilter()
+        # Keep the rebuild thread busy
+        busy = threading.Event()
+        moderation.executor.submit(busy.wait, 5)
+        first = moderation.set_phrases('a', ['one'])
+        moderation.set_phrases('a', ['two'])
+        busy.set()
+        first.result(timeout=5)
+        self.assertEqual(moderation.rebuilds, 1)
+        self.assertIsNone(moderation.check('a', 'one'))
+        self.assertEqual(moderation.check('a', 'two'), 'two')
+        moderation.close()
+
+
+class TestBannedPhraseState(unittest.TestCase):
+
+    def test_one_journal_entry_per_phrase(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'state.json')
+            with open(filename, 'w') as file:
+                json.dump({'banned_phrases': {'a': ['one', 'two']}}, file)
+            bot = Bot()
+            bot.journal = StateJournal(filename)
+            bot.command_store = CommandStore(os.path.join(directory, 'commands.db'))
+            bot.read_state()
+            # Lists of older state files are migrated
+            self.assertEqual(bot.state['banned_phrases'], {'a': {'one': True, 'two': True}})
+            with mock.patch.object(bot.journal, 'set', wraps=bot.journal.set) as journal_set:
+                bot.ban_phrase('a', 'three')
+            journal_set.assert_called_once_with(['banned_phrases', 'a', 'three'], True)
+            bot.unban_phrase('a', 'one')
+            bot.unban_phrase('a', 'two')
+            # Removing the last phrase of a channel removes the channel
+            bot.ban_phrase('b', 'four')
+            bot.unban_phrase('b', 'four')
+            self.assertNotIn('b', bot.state['banned_phrases'])
+            bot.journal.close()
+            bot.command_store.close()
+            bot.moderation.close()
+            self.assertEqual(StateJournal(filename).load()['banned_phrases'], {'a': {'three': True}})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -49,3 +49,25 @@ class TestParseMessage(unittest.TestCase):
         self.assertFalse(user.first_msg)
         self.assertFalse(user.emote_only)
 
+    def test_parse_ping(self) -> None:
+        message: Message = parse('PING :tmi.twitch.tv')
+        self.assertEqual(message.irc_command, 'PING')
+        self.assertEqual(message.irc_args, [])
+        self.assertEqual(message.text, 'tmi.twitch.tv')
+        self.assertEqual(message.text_command, '')
+        self.assertIsNone(message.prefix)
+
+    def test_parse_message_with_missing_tags(self) -> None:
+        sample_message = (
+            '@badges=broadcaster/1;display-name=xchromium7;mod=0 '
+            ':xchromium7!xchromium7@xchromium7.tmi.twitch.tv PRIVMSG #xchrombot :!addcmd hi  hello'
+        )
+        message: Message = parse(sample_message)
+        self.assertEqual(message.text_command, 'addcmd')
+        self.assertEqual(message.text_args, ['hi', '', 'hello'])
+        user = message.user
+        self.assertIsInstance(user, UserInfo)
+        self.assertTrue(user.is_mod)
+        self.assertEqual(user.client_nonce, '')
+        self.assertFalse(user.subscriber)
+        self.assertFalse(hasattr(user, '__dict__'))
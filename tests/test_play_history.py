@@ -0,0 +1,97 @@
+import os
+import tempfile
+import threading
+import unittest
+from typing import List, Optional, Tuple
+
+from core.objects import Play
+from libraries.play_history import PlayHistory
+
+
+def play(track_id: str, played_at: int) -> Play:
+    return Play(track_id, f'Song {track_id}', 'Artist', f'https://open.spotify.com/track/{track_id}', played_at)
+
+
+class FakeSpotify:
+    """
+    Recently played endpoint over a list of plays
+    """
+
+    def __init__(self) -> None:
+        self.plays: List[Play] = []
+        self.cursors: List[int] = []
+
+    def fetch(self, after: int) -> Optional[Tuple[List[Play], int]]:
+        self.cursors.append(after)
+        plays = [play for play in self.plays if play.played_at > after]
+        return plays, max((play.played_at for play in plays), default=after)
+
+
+class TestPlayHistory(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.filename = os.path.join(self.directory.name, 'history.db')
+        self.spotify = FakeSpotify()
+
+    def history(self, max_entries: int = 5000) -> PlayHistory:
+        history = PlayHistory(self.filename, self.spotify.fetch, max_entries)
+        self.addCleanup(history.close)
+        return history
+
+    def test_only_new_plays_are_fetched(self) -> None:
+        history = self.history()
+        self.spotify.plays = [play('a', 1000), play('b', 2000)]
+        self.assertEqual(history.sync(), 2)
+        self.spotify.plays.append(play('a', 3000))
+        self.assertEqual(history.sync(), 1)
+        self.assertEqual(self.spotify.cursors, [0, 2000])
+        self.assertEqual([p.played_at for p in history.recent(5)], [3000, 2000, 1000])
+        self.assertEqual(history.play_counts(1.5), {'a': 1, 'b': 1})
+        self.assertEqual(history.play_counts(0), {'a': 2, 'b': 1})
+
+    def test_bounded_and_kept_on_disk(self) -> None:
+        history = self.history(max_entries=3)
+        self.spotify.plays = [play(str(i), i * 1000) for i in range(1, 6)]
+        history.sync()
+        self.assertEqual([p.track_id for p in history.recent(10)], ['5', '4', '3'])
+        history.close()
+
+        reopened = self.history(max_entries=3)
+        reopened.open()
+        self.assertEqual([p.track_id for p in reopened.recent(10)], ['5', '4', '3'])
+        self.assertEqual(reopened.cursor, 5000)
+        reopened.sync()
+        self.assertEqual(self.spotify.cursors[-1], 5000)
+
+    def test_sync_if_older(self) -> None:
+        history = self.history()
+        history.sync_if_older(60)
+        history.sync_if_older(60)
+        self.assertEqual(len(self.spotify.cursors), 1)
+        history.sync_if_older(0)
+        self.assertEqual(len(self.spotify.cursors), 2)
+
+    def test_queries_do_not_wait_for_spotify(self) -> None:
+        history = self.history()
+        self.spotify.plays = [play('a', 1000)]
+        history.sync()
+        fetching, release = threading.Event(), threading.Event()
+
+        def slow_fetch(after: int) -> Optional[Tuple[List[Play], int]]:
+            fetching.set()
+            release.wait(5)
+            return self.spotify.fetch(after)
+
+        history.fetch = slow_fetch
+        self.spotify.plays.append(play('b', 2000))
+        thread = threading.Thread(target=history.sync)
+        thread.start()
+        self.assertTrue(fetching.wait(5))
+        self.assertTrue(history.lock.acquire(timeout=1))
+        history.lock.release()
+        self.assertEqual([p.track_id for p in history.recent(5)], ['a'])
+        release.set()
+        thread.join()
+        self.assertEqual([p.track_id for p in history.recent(5)], ['b', 'a'])
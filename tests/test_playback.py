@@ -0,0 +1,60 @@
+import unittest
+from typing import List, Optional
+
+from core.objects import Song
+from libraries.playback import PlaybackPoller
+
+
+def song(id: str, progress: int = 0, duration: int = 200_000, is_playing: bool = True) -> Song:
+    return Song(
+        id=id,
+        name=f'Song {id}',
+        artists='Artist',
+        track_url=f'https://open.spotify.com/track/{id}',
+        duration=duration,
+        is_playing=is_playing,
+        context_type='playlist',
+        context_url='https://open.spotify.com/playlist/1',
+        progress=progress,
+    )
+
+
+class TestPlaybackPoller(unittest.TestCase):
+
+    def poller(self, songs: List[Optional[Song]]) -> PlaybackPoller:
+        return PlaybackPoller(lambda: songs.pop(0), interval=30, idle_min=5, idle_max=20, end_window=10)
+
+    def test_delay_follows_the_track(self) -> None:
+        poller = self.poller([song('1', progress=0), song('1', progress=185_000), song('1', progress=199_000)])
+        self.assertEqual(poller.poll(), 30)
+        self.assertEqual(poller.poll(), 5)
+        # Close to the end it polls right after the track should have changed
+        self.assertEqual(poller.poll(), 1.5)
+
+    def test_backs_off_while_nothing_plays(self) -> None:
+        poller = self.poller([None, song('1', is_playing=False), None, None, song('1')])
+        self.assertEqual([poller.poll() for _ in range(4)], [5, 10, 20, 20])
+        self.assertEqual(poller.poll(), 30)
+        self.assertEqual(poller.idle_delay, 5)
+
+    def test_song_change_events(self) -> None:
+        changes: List[str] = []
+        poller = self.poller([song('1'), song('1'), song('1', is_playing=False), song('1'), song('2'), None, song('2')])
+        poller.listeners.append(lambda song: changes.append(song.id))
+        for _ in range(7):
+            poller.poll()
+        # Neither the song playing at startup nor resuming the same song is announced
+        self.assertEqual(changes, ['2', '2'])
+        self.assertEqual(poller.song.id, '2')  # type: ignore
+
+    def test_errors_are_not_served_from_memory(self) -> None:
+        def fail() -> Optional[Song]:
+            raise Exception('Spotify access token has not been configured properly.')
+
+        poller = PlaybackPoller(fail, idle_min=5)
+        with self.assertLogs(level='WARNING'):
+            self.assertEqual(poller.poll(), 5)
+        self.assertFalse(poller.ok)
+        poller.fetch = lambda: song('1')
+        poller.poll()
+        self.assertTrue(poller.ok)
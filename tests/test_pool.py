@@ -0,0 +1,125 @@
+import asyncio
+import unittest
+from typing import Dict, List
+
+from core.connection import IRCConnection
+from core.pool import Backoff, ConnectionPool
+from core.scheduler import PRIORITY_REPLY, RateLimiter
+
+
+class TestBackoff(unittest.TestCase):
+
+    def test_delays_grow_up_to_the_maximum(self) -> None:
+        backoff = Backoff(0.5, 10)
+        for attempt, ceiling in [(0, 0.5), (1, 1), (3, 4), (10, 10)]:
+            delays = [backoff.delay(attempt) for _ in range(100)]
+            self.assertTrue(all(0 <= delay <= ceiling for delay in delays))
+            # Jittered, not the same delay every time
+            self.assertGreater(len(set(delays)), 1)
+
+
+class TestConnectionPool(unittest.TestCase):
+
+    def test_shard_and_rebalance(self) -> None:
+        joins: Dict[int, List[str]] = {}
+        writers: List[asyncio.StreamWriter] = []
+        received: List[str] = []
+
+        async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+            index = len(writers)
+            writers.append(writer)
+            joins[index] = []
+            writer.write(f':tmi.twitch.tv 001 bot :connection {index}\r\n'.encode())
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                if line.startswith(b'JOIN'):
+                    joins[index].append(line.decode().strip()[6:])
+
+        async def run() -> None:
+            server = await asyncio.start_server(handle, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            connected: List[IRCConnection] = []
+            pool = ConnectionPool(
+                '127.0.0.1', port, received.append, connected.append,
+                channels_per_connection=2, backoff=Backoff(0, 0), use_tls=False,
+            )
+            await pool.start(['a', 'b', 'c', 'd', 'e'])
+            run_task = asyncio.ensure_future(pool.run())
+            await asyncio.sleep(0.1)
+            self.assertEqual(len(connected), 3)
+            self.assertEqual(joins, {0: ['a', 'b'], 1: ['c', 'd'], 2: ['e']})
+
+            # Dropping a connection moves its channels to the others
+            writers[0].close()
+            await asyncio.sleep(0.1)
+            self.assertEqual(joins[2], ['e', 'a'])
+            self.assertEqual(joins[3], ['b'])
+            self.assertIs(pool.connection_for('a'), pool.connection_for('e'))
+            self.assertEqual(len(received), 4)
+
+            run_task.cancel()
+            await pool.close()
+            server.close()
+
+        asyncio.run(run())
+
+    def test_login_and_joins_are_one_write(self) -> None:
+        chunks: List[bytes] = []
+
+        async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+            chunks.append(await reader.read(65536))
+            writer.close()
+
+        async def run() -> None:
+            server = await asyncio.start_server(handle, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            pool = ConnectionPool(
+                '127.0.0.1', port, lambda line: None, lambda connection: connection.send('NICK bot'),
+                use_tls=False,
+            )
+            await pool.start(['a', 'b'])
+            await asyncio.sleep(0.1)
+            self.assertEqual(chunks, [b'NICK bot\r\nJOIN #a\r\nJOIN #b\r\n'])
+            await pool.close()
+            server.close()
+
+        asyncio.run(run())
+
+    def test_replies_of_one_iteration_are_one_write(self) -> None:
+        chunks: List[bytes] = []
+
+        async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                chunks.append(data)
+            writer.close()
+
+        async def run() -> None:
+            server = await asyncio.start_server(handle, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            pool = ConnectionPool(
+                '127.0.0.1', port, lambda line: None, lambda connection: None,
+                limiter=RateLimiter(channel=(100, 1)), use_tls=False,
+            )
+            await pool.start([])
+            run_task = asyncio.ensure_future(pool.run())
+            await asyncio.sleep(0.05)
+            for i in range(3):
+                pool.send(f'PRIVMSG #a :reply {i}', priority=PRIORITY_REPLY, channel='a')
+            await asyncio.wait_for(self.wait_for_data(chunks), 5)
+            self.assertEqual(chunks, [b'PRIVMSG #a :reply 0\r\nPRIVMSG #a :reply 1\r\nPRIVMSG #a :reply 2\r\n'])
+            self.assertEqual(pool.connections[0].writes, 1)
+            run_task.cancel()
+            await pool.close()
+            server.close()
+
+        asyncio.run(run())
+
+    @staticmethod
+    async def wait_for_data(chunks: List[bytes]) -> None:
+        while not chunks:
+            await asyncio.sleep(0.01)
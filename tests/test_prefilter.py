@@ -0,0 +1,53 @@
+import unittest
+
+from core.prefilter import LineFilter, find_tag, split_privmsg
+
+
+TAGS = '@badge-info=;badges=;display-name=xchromium7;mod=0 '
+PREFIX = ':xchromium7!xchromium7@xchromium7.tmi.twitch.tv '
+
+
+class TestLineFilter(unittest.TestCase):
+
+    def test_ping_is_parsed(self) -> None:
+        line_filter = LineFilter()
+        self.assertTrue(line_filter.should_parse('PING :tmi.twitch.tv'))
+
+    def test_command_is_parsed(self) -> None:
+        line_filter = LineFilter()
+        self.assertTrue(line_filter.should_parse(PREFIX + 'PRIVMSG #xchrombot :!drop'))
+        self.assertTrue(line_filter.should_parse(TAGS + PREFIX + 'PRIVMSG #xchrombot :!song now'))
+
+    def test_chat_is_skipped(self) -> None:
+        line_filter = LineFilter()
+        self.assertFalse(line_filter.should_parse(TAGS + PREFIX + 'PRIVMSG #xchrombot :hello !drop'))
+        self.assertFalse(line_filter.should_parse(PREFIX + 'JOIN #xchrombot'))
+        self.assertEqual(line_filter.stats(), {'parsed': 0, 'skipped': 2})
+
+    def test_subscription(self) -> None:
+        line_filter = LineFilter()
+        line_filter.subscribe('PRIVMSG')
+        line_filter.subscribe('RECONNECT')
+        self.assertTrue(line_filter.should_parse(TAGS + PREFIX + 'PRIVMSG #xchrombot :hello'))
+        self.assertTrue(line_filter.should_parse(':tmi.twitch.tv RECONNECT'))
+        self.assertEqual(line_filter.stats(), {'parsed': 2, 'skipped': 0})
+
+
+class TestSplitPrivmsg(unittest.TestCase):
+
+    def test_split(self) -> None:
+        self.assertEqual(split_privmsg(TAGS + PREFIX + 'PRIVMSG #xchrombot :hello :) there'),
+                         ('xchromium7', 'xchrombot', 'hello :) there'))
+        self.assertEqual(split_privmsg(PREFIX + 'PRIVMSG #xchrombot :hi'), ('xchromium7', 'xchrombot', 'hi'))
+        self.assertEqual(split_privmsg('PING :tmi.twitch.tv'), ('', '', ''))
+
+
+class TestFindTag(unittest.TestCase):
+
+    def test_find(self) -> None:
+        line = '@badge-info=;emotes=25:0-4;mod=1 ' + PREFIX + 'PRIVMSG #xchrombot :Kappa emotes=1'
+        self.assertEqual(find_tag(line, 'emotes'), '25:0-4')
+        self.assertEqual(find_tag(line, 'badge-info'), '')
+        self.assertEqual(find_tag(line, 'mod'), '1')
+        self.assertEqual(find_tag(line, 'info'), '')
+        self.assertEqual(find_tag(PREFIX + 'PRIVMSG #xchrombot :emotes=1', 'emotes'), '')
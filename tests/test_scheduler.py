@@ -0,0 +1,119 @@
+import time
+import unittest
+from typing import Optional
+
+from core.scheduler import (
+    PRIORITY_ANNOUNCEMENT, PRIORITY_PONG, PRIORITY_REPLY, RateLimiter, SendScheduler, TokenBucket,
+)
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_refill(self) -> None:
+        bucket = TokenBucket(2, 1)
+        now = bucket.updated_at
+        bucket.take(now)
+        bucket.take(now)
+        self.assertAlmostEqual(bucket.delay(now), 0.5)
+        self.assertEqual(bucket.delay(now + 0.5), 0)
+
+
+class TestSendScheduler(unittest.TestCase):
+
+    def test_priority_order(self) -> None:
+        scheduler = SendScheduler()
+        scheduler.put(b'PRIVMSG #a :hello\r\n', PRIORITY_ANNOUNCEMENT, 'a')
+        scheduler.put(b'PRIVMSG #b :reply\r\n', PRIORITY_REPLY, 'b')
+        scheduler.put(b'PONG :tmi.twitch.tv\r\n', PRIORITY_PONG)
+        now = time.monotonic()
+        lines = [scheduler.pop_ready(now)[0].data for _ in range(3)]  # type: ignore
+        self.assertEqual(lines, [b'PONG :tmi.twitch.tv\r\n', b'PRIVMSG #b :reply\r\n', b'PRIVMSG #a :hello\r\n'])
+
+    def test_channel_limit_does_not_block_other_channels(self) -> None:
+        scheduler = SendScheduler(RateLimiter(channel=(1, 1)))
+        now = scheduler.limiter.privmsg.updated_at
+        scheduler.limiter.take('PRIVMSG', 'a', now)
+        scheduler.put(b'PRIVMSG #a :one\r\n', PRIORITY_REPLY, 'a')
+        scheduler.put(b'PRIVMSG #b :two\r\n', PRIORITY_ANNOUNCEMENT, 'b')
+        line, _ = scheduler.pop_ready(now)
+        self.assertEqual(line.data, b'PRIVMSG #b :two\r\n')  # type: ignore
+        scheduler.limiter.take('PRIVMSG', 'b', now)
+        line, delay = scheduler.pop_ready(now)
+        self.assertIsNone(line)
+        self.assertGreater(delay, 0)
+
+    def test_held_back_channel_is_skipped(self) -> None:
+        limiter = RateLimiter(privmsg=(1000, 30), privmsg_mod=(1000, 30), channel=(1, 1))
+        scheduler = SendScheduler(limiter, max_size=2000)
+        now = limiter.privmsg.updated_at
+        for i in range(1000):
+            scheduler.put(f'PRIVMSG #a :warning {i}\r\n'.encode(), PRIORITY_REPLY, 'a')
+        checked = []
+        delay = limiter.delay
+
+        def recording_delay(kind: str, channel: Optional[str], now: float) -> float:
+            checked.append(channel)
+            return delay(kind, channel, now)
+
+        limiter.delay = recording_delay  # type: ignore
+        self.assertEqual(scheduler.pop_ready(now)[0].data, b'PRIVMSG #a :warning 0\r\n')  # type: ignore
+        limiter.take('PRIVMSG', 'a', now)
+        for i in range(10):
+            scheduler.put(f'PRIVMSG #b{i} :reply\r\n'.encode(), PRIORITY_ANNOUNCEMENT, f'b{i}')
+            line, _ = scheduler.pop_ready(now)
+            self.assertEqual(line.data, f'PRIVMSG #b{i} :reply\r\n'.encode())  # type: ignore
+            limiter.take('PRIVMSG', f'b{i}', now)
+        # Channel a was looked at once more after its line was sent, not for every other line
+        self.assertEqual(checked.count('a'), 2)
+        line, delay_left = scheduler.pop_ready(now)
+        self.assertIsNone(line)
+        self.assertAlmostEqual(delay_left, 1, places=3)
+        line, _ = scheduler.pop_ready(now + 1.01)
+        self.assertEqual(line.data, b'PRIVMSG #a :warning 1\r\n')  # type: ignore
+
+    def test_more_important_line_of_a_channel_goes_first(self) -> None:
+        scheduler = SendScheduler(RateLimiter(channel=(100, 1)))
+        scheduler.put(b'PRIVMSG #a :announcement\r\n', PRIORITY_ANNOUNCEMENT, 'a')
+        scheduler.put(b'PRIVMSG #a :reply\r\n', PRIORITY_REPLY, 'a')
+        scheduler.put(b'PRIVMSG #b :announcement\r\n', PRIORITY_ANNOUNCEMENT, 'b')
+        self.assertEqual(scheduler.get_ready(), [
+            b'PRIVMSG #a :reply\r\n', b'PRIVMSG #a :announcement\r\n', b'PRIVMSG #b :announcement\r\n',
+        ])
+
+    def test_moderator_limit(self) -> None:
+        limiter = RateLimiter(privmsg=(1, 30), channel=(100, 1))
+        now = limiter.privmsg.updated_at
+        limiter.take('PRIVMSG', 'a', now)
+        self.assertGreater(limiter.delay('PRIVMSG', 'a', now), 0)
+        limiter.set_moderator('a', True)
+        self.assertEqual(limiter.delay('PRIVMSG', 'a', now), 0)
+
+    def test_full_queue_drops_least_important(self) -> None:
+        scheduler = SendScheduler(max_size=2)
+        scheduler.put(b'PRIVMSG #a :announcement\r\n', PRIORITY_ANNOUNCEMENT, 'a')
+        scheduler.put(b'PRIVMSG #a :reply\r\n', PRIORITY_REPLY, 'a')
+        scheduler.put(b'PONG :tmi.twitch.tv\r\n', PRIORITY_PONG)
+        self.assertEqual(scheduler.drain(), [b'PONG :tmi.twitch.tv\r\n', b'PRIVMSG #a :reply\r\n'])
+        self.assertEqual(scheduler.stats()['dropped'], 1)
+
+    def test_get_ready_stops_at_the_join_limit(self) -> None:
+        scheduler = SendScheduler(RateLimiter(join=(2, 10)))
+        scheduler.put(b'NICK bot\r\n')
+        for channel in 'abc':
+            scheduler.put(f'JOIN #{channel}\r\n'.encode())
+        self.assertEqual(scheduler.get_ready(), [b'NICK bot\r\n', b'JOIN #a\r\n', b'JOIN #b\r\n'])
+        self.assertEqual(scheduler.get_ready(), [])
+        self.assertEqual(scheduler.drain(), [b'JOIN #c\r\n'])
+
+    def test_prune_keeps_the_most_important_replies(self) -> None:
+        scheduler = SendScheduler()
+        scheduler.put(b'PASS oauth:x\r\n')
+        scheduler.put(b'JOIN #a\r\n')
+        scheduler.put(b'PONG :tmi.twitch.tv\r\n', PRIORITY_PONG)
+        scheduler.put(b'PRIVMSG #a :announcement\r\n', PRIORITY_ANNOUNCEMENT, 'a')
+        scheduler.put(b'PRIVMSG #a :reply\r\n', PRIORITY_REPLY, 'a')
+        scheduler.put(b'PRIVMSG #b :reply\r\n', PRIORITY_REPLY, 'b')
+        self.assertEqual(scheduler.prune(2), 2)
+        self.assertEqual([line.data for line in scheduler.remove_channels({'b'})], [b'PRIVMSG #b :reply\r\n'])
+        self.assertEqual(scheduler.drain(), [b'PRIVMSG #a :reply\r\n'])
+        self.assertEqual(scheduler.stats()['dropped'], 1)
@@ -0,0 +1,253 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple, Union
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+
+from libraries import spotify
+from libraries.http_client import HTTPClient
+from libraries.playback import PlaybackPoller
+
+CURRENTLY_PLAYING = {
+    'is_playing': True,
+    'progress_ms': 42000,
+    'context': {'type': 'playlist', 'external_urls': {'spotify': 'https://open.spotify.com/playlist/1'}},
+    'item': {
+        'id': '1',
+        'name': 'Never Gonna Give You Up',
+        'artists': [{'name': 'Rick Astley'}],
+        'duration_ms': 213573,
+        'external_urls': {'spotify': 'https://open.spotify.com/track/1'},
+    },
+}
+
+
+def played(track_id: str, played_at: str) -> Dict[str, Any]:
+    return {
+        'track': {
+            'id': track_id,
+            'name': f'Song {track_id}',
+            'artists': [{'name': 'Artist'}],
+            'external_urls': {'spotify': f'https://open.spotify.com/track/{track_id}'},
+        },
+        'played_at': played_at,
+    }
+
+
+# (played at in milliseconds, item), oldest first
+RECENTLY_PLAYED = [
+    (1481661844589, played('1', '2016-12-13T20:44:04.589Z')),
+    (1481662000000, played('2', '2016-12-13T20:46:40.000Z')),
+    (1481662200000, played('3', '2016-12-13T20:50:00Z')),
+]
+
+
+class SpotifyHandler(BaseHTTPRequestHandler):
+    """
+    Local stand-in for the Spotify API
+    """
+    protocol_version = 'HTTP/1.1'
+    # Status codes returned before succeeding, per path
+    failures: Dict[str, List[int]] = {}
+    connections: set = set()
+
+    def do_GET(self) -> None:
+        self.connections.add(self.client_address)
+        pending = self.failures.get(self.path)
+        if pending:
+            self.respond_failure(pending.pop(0))
+        elif self.path == '/v1/me/player/currently-playing':
+            self.respond(200, CURRENTLY_PLAYING)
+        elif self.path.startswith('/v1/me/player/recently-played'):
+            self.respond(200, self.recently_played(int(parse_qs(urlparse(self.path).query)['after'][0])))
+        else:
+            self.respond(404, {})
+
+    def do_POST(self) -> None:
+        self.connections.add(self.client_address)
+        self.rfile.read(int(self.headers['Content-Length']))
+        pending = self.failures.get(self.path)
+        if pending:
+            self.respond_failure(pending.pop(0))
+            return
+        self.respond(200, {'access_token': 'new', 'token_type': 'Bearer', 'expires_in': 3600})
+
+    def recently_played(self, after: int, page_size: int = 2) -> Dict[str, Any]:
+        """
+        Pages of RECENTLY_PLAYED going forward from the cursor
+        """
+        items = [item for played_at, item in RECENTLY_PLAYED if played_at > after]
+        page = items[:page_size]
+        cursor = max(played_at for played_at, item in RECENTLY_PLAYED if item in page) if page else None
+        return {
+            'items': list(reversed(page)),
+            'next': 'more' if len(items) > page_size else None,
+            'cursors': {'after': str(cursor), 'before': '0'} if page else None,
+        }
+
+    def respond_failure(self, failure: Union[int, Tuple[int, str]]) -> None:
+        """
+        Respond with a status code, or a (status code, Retry-After) pair
+        """
+        if isinstance(failure, tuple):
+            self.respond(failure[0], {}, {'Retry-After': failure[1]})
+        else:
+            self.respond(failure, {})
+
+    def respond(self, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+class TestTokenManager(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, 'spotify.json')
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def write_token(self, expires_at: float) -> None:
+        with open(self.filename, 'w') as f:
+            json.dump({
+                'access_token': 'old',
+                'token_type': 'Bearer',
+                'refresh_token': 'refresh',
+                'expires_at': expires_at,
+            }, f)
+
+    def test_headers_from_memory(self) -> None:
+        self.write_token(time.time() + 3600)
+        manager = spotify.TokenManager(self.filename)
+        self.assertEqual(manager.get_headers()['Authorization'], 'Bearer old')
+        os.remove(self.filename)
+        self.assertEqual(manager.get_headers()['Authorization'], 'Bearer old')
+
+    def test_concurrent_callers_share_refresh(self) -> None:
+        self.write_token(0)
+        calls = []
+
+        def refresh(refresh_token: str) -> Dict[str, Any]:
+            calls.append(refresh_token)
+            time.sleep(0.1)
+            return {
+                'access_token': 'new',
+                'token_type': 'Bearer',
+                'refresh_token': refresh_token,
+                'expires_at': time.time() + 3600,
+            }
+
+        manager = spotify.TokenManager(self.filename)
+        with mock.patch.object(spotify, 'refresh_access_token', refresh):
+            threads = [threading.Thread(target=manager.get_headers) for _ in range(5)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(calls, ['refresh'])
+        self.assertEqual(manager.get_headers()['Authorization'], 'Bearer new')
+
+
+class TestSpotifyClient(unittest.TestCase):
+
+    def setUp(self) -> None:
+        SpotifyHandler.failures = {}
+        SpotifyHandler.connections = set()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), SpotifyHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        base = f'http://127.0.0.1:{self.server.server_address[1]}'
+        self.client = HTTPClient(retries=2, backoff=0, timeouts=spotify.TIMEOUTS)
+        manager = spotify.TokenManager()
+        manager.token = {'access_token': 'token', 'token_type': 'Bearer', 'expires_at': time.time() + 3600}
+        manager.headers = {'Authorization': 'Bearer token'}
+        self.patches = [
+            mock.patch.object(spotify, 'BASE_URL', base + '/v1/me/'),
+            mock.patch.object(spotify, 'TOKEN_URL', base + '/api/token'),
+            mock.patch.object(spotify, 'client', self.client),
+            mock.patch.object(spotify, 'token_manager', manager),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self) -> None:
+        for patch in self.patches:
+            patch.stop()
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connection_is_reused(self) -> None:
+        for _ in range(5):
+            song = spotify.get_currently_playing()
+        self.assertEqual(song.name, 'Never Gonna Give You Up')  # type: ignore
+        self.assertEqual(song.artists, 'Rick Astley')  # type: ignore
+        self.assertEqual(song.progress, 42000)  # type: ignore
+        self.assertEqual(len(SpotifyHandler.connections), 1)
+        stats = self.client.stats()['currently_playing']
+        self.assertEqual(stats['count'], 5)
+        self.assertEqual(stats['errors'], 0)
+
+    def test_retry_transient_errors(self) -> None:
+        SpotifyHandler.failures['/v1/me/player/currently-playing'] = [503, 502]
+        song = spotify.get_currently_playing()
+        self.assertIsNotNone(song)
+        SpotifyHandler.failures['/v1/me/player/currently-playing'] = [503, 503, 503]
+        with self.assertRaises(spotify.SpotifyError):
+            spotify.get_currently_playing()
+
+    def test_failed_poll_is_not_served_from_memory(self) -> None:
+        poller = PlaybackPoller(spotify.get_currently_playing)
+        poller.poll()
+        self.assertTrue(poller.ok)
+        # An outage is not the same as nothing playing, !song asks Spotify itself meanwhile
+        SpotifyHandler.failures['/v1/me/player/currently-playing'] = [503, 503, 503]
+        with self.assertLogs(level='WARNING'):
+            poller.poll()
+        self.assertFalse(poller.ok)
+
+    def test_retry_after(self) -> None:
+        SpotifyHandler.failures['/v1/me/player/currently-playing'] = [(429, '1')]
+        start = time.perf_counter()
+        self.assertIsNotNone(spotify.get_currently_playing())
+        self.assertGreaterEqual(time.perf_counter() - start, 1)
+        # Waiting longer than the request's timeout is left to the caller
+        SpotifyHandler.failures['/v1/me/player/currently-playing'] = [(429, '60'), 503]
+        with self.assertRaises(spotify.SpotifyError):
+            spotify.get_currently_playing()
+        self.assertEqual(SpotifyHandler.failures['/v1/me/player/currently-playing'], [503])
+
+    def test_post_is_not_retried(self) -> None:
+        SpotifyHandler.failures['/api/token'] = [503]
+        self.assertEqual(spotify.refresh_access_token('refresh'), {})
+        self.assertEqual(SpotifyHandler.failures['/api/token'], [])
+
+    def test_refresh_token(self) -> None:
+        token = spotify.refresh_access_token('refresh')
+        self.assertEqual(token['access_token'], 'new')
+        self.assertEqual(token['refresh_token'], 'refresh')
+        self.assertIn('refresh_token', self.client.stats())
+
+    def test_recently_played_pages(self) -> None:
+        result = spotify.get_recently_played()
+        assert result is not None
+        plays, cursor = result
+        self.assertEqual([play.track_id for play in plays], ['1', '2', '3'])
+        self.assertEqual(plays[0].played_at, 1481661844589)
+        self.assertEqual(cursor, 1481662200000)
+        self.assertEqual(self.client.stats()['recently_played']['count'], 2)
+        self.assertEqual(spotify.get_recently_played(cursor), ([], cursor))
@@ -0,0 +1,50 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from core.store import CommandStore
+
+
+class TestCommandStore(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        # Cleanups run in reverse, so stores are closed before this
+        self.addCleanup(self.directory.cleanup)
+        self.filename = os.path.join(self.directory.name, 'commands.db')
+
+    def open_store(self) -> CommandStore:
+        store = CommandStore(self.filename, batch_interval=0.05)
+        store.defaults = {'drop': 'drop it'}
+        store.open()
+        self.addCleanup(store.close)
+        return store
+
+    def test_changes_are_batched_and_persisted(self) -> None:
+        store = self.open_store()
+        self.assertEqual(store.load('a'), {'drop': 'drop it'})
+        store.set('a', 'gym', 'wrong door')
+        store.set('b', 'hi', 'hello')
+        store.delete('a', 'drop')
+        # Served from the overlay before they are written
+        self.assertEqual(store.load('a'), {'gym': 'wrong door'})
+        store.close()
+        self.assertEqual(store.batches, 1)
+        self.assertEqual(store.pending, {})
+
+        store = self.open_store()
+        self.assertEqual(store.load('a'), {'gym': 'wrong door'})
+        self.assertEqual(store.load('b'), {'drop': 'drop it', 'hi': 'hello'})
+        connection = sqlite3.connect(self.filename)
+        self.assertEqual(connection.execute('PRAGMA journal_mode').fetchone(), ('wal',))
+        connection.close()
+
+    def test_defaults_are_copied_once(self) -> None:
+        store = self.open_store()
+        store.load('a')
+        store.delete('a', 'drop')
+        store.close()
+        store = self.open_store()
+        store.defaults = {'drop': 'drop it', 'new': 'not copied'}
+        self.assertEqual(store.load('a'), {})
@@ -0,0 +1,183 @@
+import asyncio
+import functools
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+from typing import List, Optional
+
+from core.journal import StateJournal
+from core.objects import Song
+from core.store import CommandStore
+from core.supervisor import Supervisor
+from main import Bot
+
+MOD_TAGS = '@badges=moderator/1;display-name=modguy;mod=1 '
+
+
+def privmsg(channel: str, text: str, tags: str = '') -> str:
+    return f'{tags}:modguy!modguy@modguy.tmi.twitch.tv PRIVMSG #{channel} :{text}'
+
+
+class TempBot(Bot):
+    """
+    Bot keeping its state and commands in a temporary directory
+    """
+
+    def __init__(self, directory: str) -> None:
+        super().__init__()
+        self.state_filename = os.path.join(directory, 'state.json')
+        self.journal = StateJournal(self.state_filename)
+        self.command_store = CommandStore(os.path.join(directory, 'commands.db'), batch_interval=0.05)
+
+
+class TestSupervisor(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        with open(os.path.join(self.directory.name, 'state.json'), 'w') as file:
+            json.dump({'template_commands': {'drop': 'drop it'}}, file)
+        bot_class = functools.partial(TempBot, self.directory.name)
+        self.supervisor = Supervisor(bot_class(), 2, bot_class=bot_class)
+        # Workers start from the supervisor's state
+        self.supervisor.bot.read_state()
+        self.replies: List[bytes] = []
+        self.received = threading.Condition()
+        self.supervisor.on_send = self.on_send
+        self.supervisor.start_workers()
+
+    def tearDown(self) -> None:
+        self.supervisor.stop_workers()
+        self.supervisor.bot.journal.close()
+        self.supervisor.bot.command_store.close()
+        self.directory.cleanup()
+
+    def on_send(self, data: bytes, priority: int, channel: Optional[str]) -> None:
+        with self.received:
+            self.replies.append(data)
+            self.received.notify_all()
+
+    async def wait_for_replies(self, count: int) -> List[bytes]:
+        def wait() -> None:
+            with self.received:
+                self.received.wait_for(lambda: len(self.replies) >= count, timeout=30)
+        await asyncio.get_running_loop().run_in_executor(None, wait)
+        return self.replies
+
+    def test_commands_are_stored_per_channel(self) -> None:
+        # Channels handled by different workers
+        first, second = 'channel0', next(
+            f'channel{i}' for i in range(1, 100)
+            if self.supervisor.worker_for(f'channel{i}') != self.supervisor.worker_for('channel0')
+        )
+
+        async def run() -> None:
+            self.supervisor.start_outbound_thread()
+            self.supervisor.route(privmsg(first, '!addcmd hello hi {message.user_name}', MOD_TAGS))
+            await self.wait_for_replies(1)
+            self.supervisor.route(privmsg(first, '!hello'))
+            self.supervisor.route(privmsg(second, '!cmds'))
+            replies = await self.wait_for_replies(3)
+            self.assertIn(f'PRIVMSG #{first} :hi modguy\r\n'.encode(), replies)
+            # The other channel only has the commands migrated from state.json
+            self.assertIn(f'PRIVMSG #{second} :@modguy !drop !cmds'.encode(), b''.join(replies))
+
+        asyncio.run(run())
+        self.supervisor.stop_workers()
+        connection = sqlite3.connect(os.path.join(self.directory.name, 'commands.db'))
+        rows = connection.execute('SELECT channel, name FROM template_commands ORDER BY channel, name').fetchall()
+        connection.close()
+        # Joined channels are loaded when the workers start, so they got the defaults as well
+        joined = [(channel, 'drop') for channel in self.supervisor.bot.channels]
+        self.assertEqual(rows, sorted([(first, 'drop'), (first, 'hello'), (second, 'drop')] + joined))
+
+    def test_crashed_worker_is_restarted(self) -> None:
+        async def run() -> None:
+            self.supervisor.start_outbound_thread()
+            monitor = asyncio.ensure_future(self.supervisor.monitor(interval=0.1))
+            self.supervisor.workers[0].kill()
+            for _ in range(50):
+                await asyncio.sleep(0.1)
+                if self.supervisor.restarts:
+                    break
+            monitor.cancel()
+            self.assertEqual(self.supervisor.restarts, 1)
+            channel = next(f'channel{i}' for i in range(100) if self.supervisor.worker_for(f'channel{i}') == 0)
+            self.supervisor.route(privmsg(channel, '!drop'))
+            replies = await self.wait_for_replies(1)
+            self.assertTrue(replies[0].startswith(f'PRIVMSG #{channel} :'.encode()))
+
+        asyncio.run(run())
+
+    def test_restarted_worker_starts_from_the_supervisor_state(self) -> None:
+        bot = self.supervisor.bot
+        channel = next(f'channel{i}' for i in range(100) if self.supervisor.worker_for(f'channel{i}') == 0)
+        # Only in the supervisor's memory, and a torn entry the supervisor's writer could be appending
+        bot.state['banned_phrases'][channel] = {'big spoiler': True}
+        with open(bot.journal.journal_filename, 'ab') as file:
+            file.write(b'{"op": "set", "path": ["lurk"]')
+        size = os.path.getsize(bot.journal.journal_filename)
+
+        async def run() -> None:
+            self.supervisor.start_outbound_thread()
+            monitor = asyncio.ensure_future(self.supervisor.monitor(interval=0.1))
+            self.supervisor.workers[0].kill()
+            while not self.supervisor.restarts:
+                await asyncio.sleep(0.1)
+            monitor.cancel()
+            self.supervisor.route(privmsg(channel, 'the big spoiler is...'))
+            replies = await self.wait_for_replies(1)
+            self.assertIn(bot.moderation_warning.format(user='modguy').encode(), replies[0])
+
+        asyncio.run(run())
+        self.assertEqual(os.path.getsize(bot.journal.journal_filename), size)
+
+    def test_workers_answer_from_the_polled_song(self) -> None:
+        song = Song('1', 'Polled', 'Artist', 'https://open.spotify.com/track/1', 200_000, True, '', '')
+        self.supervisor.bot.playback.fetch = lambda: song
+
+        async def run() -> None:
+            self.supervisor.start_outbound_thread()
+            self.supervisor.bot.playback.poll_listeners.append(self.supervisor.share_playback)
+            self.supervisor.bot.playback.poll()
+            # Workers without Spotify credentials could only reply from the shared song
+            for i in range(2):
+                channel = next(f'channel{j}' for j in range(100) if self.supervisor.worker_for(f'channel{j}') == i)
+                self.supervisor.route(privmsg(channel, '!song'))
+            replies = await self.wait_for_replies(2)
+            self.assertEqual(sum(b'The current song is Polled - Artist' in reply for reply in replies), 2)
+
+        asyncio.run(run())
+
+    def test_banned_phrases_without_history(self) -> None:
+        bot = self.supervisor.bot
+        bot.history.size, bot.history.sizes = 0, {}
+
+        async def run() -> None:
+            self.supervisor.start_outbound_thread()
+            self.supervisor.route(privmsg('channel0', '!addphrase big spoiler', MOD_TAGS))
+            await self.wait_for_replies(1)
+            # The supervisor applies the replicated phrase in the background
+            while 'channel0' not in bot.moderation.matchers:
+                await asyncio.sleep(0.01)
+            self.supervisor.route(privmsg('channel0', 'the big spoiler is...'))
+            replies = await self.wait_for_replies(2)
+            warning = bot.moderation_warning.format(user='modguy')
+            self.assertIn(f'PRIVMSG #channel0 :{warning}\r\n'.encode(), replies)
+
+        asyncio.run(run())
+
+    def test_emotes_without_history(self) -> None:
+        bot = self.supervisor.bot
+        bot.history.size, bot.history.sizes = 0, {}
+
+        async def run() -> None:
+            self.supervisor.start_outbound_thread()
+            self.supervisor.route(privmsg('channel0', 'Kappa hi', '@emotes=25:0-4;mod=0 '))
+            self.supervisor.route(privmsg('channel0', '!topemotes'))
+            replies = await self.wait_for_replies(1)
+            self.assertIn(b'Top emotes lately: Kappa (1)', replies[0])
+
+        asyncio.run(run())
@@ -0,0 +1,35 @@
+import json
+import os
+import unittest
+
+from core.parser import parse
+from core.templates import CompiledTemplate, TemplateError
+
+STATE_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'state.json')
+
+
+class TestCompiledTemplate(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.message = parse(
+            '@badges=;color=#5F9EA0;display-name=xchromium7;mod=0 '
+            ':xchromium7!xchromium7@xchromium7.tmi.twitch.tv PRIVMSG #xchrombot :!hug chatter99'
+        )
+
+    def test_same_output_as_format(self) -> None:
+        with open(STATE_FILE, 'r') as file:
+            templates = json.load(file)['template_commands']
+        templates['hug'] = '{message.user_name} hugs {message.text_args[0]} {{braces}} {message.user.color!r:>12}'
+        for template in templates.values():
+            expected = template.format(message=self.message).encode('utf-8')
+            self.assertEqual(CompiledTemplate(template).render(self.message), expected)
+
+    def test_missing_argument(self) -> None:
+        template = CompiledTemplate('hello {message.text_args[1]}')
+        with self.assertRaises(IndexError):
+            template.render(self.message)
+
+    def test_invalid_templates(self) -> None:
+        for template in ('unclosed {message', 'positional {}', '{user}', '{message.nope}', '{message!x}'):
+            with self.assertRaises(TemplateError):
+                CompiledTemplate(template)
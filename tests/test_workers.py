@@ -0,0 +1,58 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from core.workers import IOBound, WorkerPool, current_job
+
+
+class TestWorkerPool(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.pool = WorkerPool(max_workers=4)
+
+    def tearDown(self) -> None:
+        self.pool.shutdown()
+
+    def test_runs_off_loop(self) -> None:
+        threads = []
+
+        async def run() -> None:
+            await self.pool.run('song', lambda: threads.append(threading.current_thread()), (), IOBound(), lambda: None)
+
+        asyncio.run(run())
+        self.assertIsNot(threads[0], threading.main_thread())
+        self.assertEqual(self.pool.stats(), {'completed': 1, 'timeouts': 0})
+
+    def test_timeout_marks_job(self) -> None:
+        jobs = []
+        fallbacks = []
+
+        def slow() -> None:
+            jobs.append(current_job())
+            time.sleep(0.2)
+
+        async def run() -> None:
+            await self.pool.run('song', slow, (), IOBound(timeout=0.05), lambda: fallbacks.append(True))
+
+        asyncio.run(run())
+        self.assertEqual(fallbacks, [True])
+        self.assertTrue(jobs[0].timed_out)
+
+    def test_concurrency_cap(self) -> None:
+        running = []
+        peak = []
+
+        def handler() -> None:
+            running.append(1)
+            peak.append(len(running))
+            time.sleep(0.02)
+            running.pop()
+
+        async def run() -> None:
+            options = IOBound(max_concurrency=1, timeout=1)
+            await asyncio.gather(*(self.pool.run('song', handler, (), options, lambda: None) for _ in range(4)))
+
+        asyncio.run(run())
+        self.assertEqual(max(peak), 1)
+        self.assertEqual(self.pool.completed, 4)